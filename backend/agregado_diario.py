@@ -0,0 +1,202 @@
+"""
+Agregado diário de vendas por empresa.
+
+Guarda, para cada base (chave do pool), o resumo de VENDAS por dia e
+vendedor: quantidade, total e total autenticado (ECF_CX_DATA preenchida).
+Cada consulta carrega só os dias do período pedido que ainda não estão
+na memória.
+
+A atualização (no máximo a cada agregado_diario_refresh_segundos) relê
+hoje e os agregado_diario_janela_dias anteriores, contados a partir do
+"hoje" da última atualização, que é onde aparecem vendas concluídas,
+autenticadas ou canceladas com atraso. Dias mais antigos ficam como
+foram lidos; para não carregar para sempre uma mudança muito tardia o
+agregado inteiro é descartado a cada agregado_diario_reconstrucao_horas.
+
+A memória é limitada: cada base guarda no máximo agregado_diario_max_dias
+dias (sai o usado há mais tempo) e no máximo agregado_diario_max_bases
+bases ficam na memória.
+
+vendas-por-dia e os totais do período do dashboard somam essas linhas em
+vez de varrer VENDAS.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import get_settings
+from db_async import executar_na_conexao
+from filtros_sql import Data, filtro_periodo, para_data
+
+log = logging.getLogger("agregado_diario")
+settings = get_settings()
+
+SQL_AGREGADO_DIARIO = """
+    SELECT
+        CAST(VENDAS.ECF_DATA AS DATE),
+        VENDAS.VEN_CODIGO,
+        COUNT(*),
+        COALESCE(SUM(VENDAS.ECF_TOTAL), 0),
+        COALESCE(SUM(CASE WHEN {autenticada} THEN VENDAS.ECF_TOTAL ELSE 0 END), 0)
+    FROM VENDAS
+    WHERE VENDAS.ECF_CANCELADA = 'N'
+    AND VENDAS.ECF_CONCLUIDA = 'S'
+    AND {periodo}
+    GROUP BY CAST(VENDAS.ECF_DATA AS DATE), VENDAS.VEN_CODIGO
+"""
+
+# dia -> código do vendedor -> [quantidade, total, total autenticado]
+Dias = Dict[date, Dict[str, list]]
+
+
+def carregar_dias(cursor, inicio: date, fim: date, tem_ecf_cx_data: bool = True) -> Dias:
+    """Lê o resumo por dia e vendedor de inicio a fim (inclusive)."""
+    periodo_sql, periodo_params = filtro_periodo("VENDAS.ECF_DATA", inicio, fim)
+    autenticada = "VENDAS.ECF_CX_DATA IS NOT NULL" if tem_ecf_cx_data else "1 = 0"
+    cursor.execute(SQL_AGREGADO_DIARIO.format(autenticada=autenticada, periodo=periodo_sql), periodo_params)
+    dias: Dias = {}
+    for dia, vendedor, quantidade, total, total_autenticado in cursor.fetchall():
+        dia = para_data(dia)
+        vendedor = str(vendedor).strip() if vendedor is not None else ""
+        dias.setdefault(dia, {})[vendedor] = [int(quantidade or 0), float(total or 0), float(total_autenticado or 0)]
+    return dias
+
+
+def _intervalos(dias: Iterable[date]) -> List[Tuple[date, date]]:
+    """Agrupa dias consecutivos em intervalos (inicio, fim)."""
+    intervalos: List[Tuple[date, date]] = []
+    for dia in sorted(dias):
+        if intervalos and (dia - intervalos[-1][1]).days <= 1:
+            intervalos[-1] = (intervalos[-1][0], dia)
+        else:
+            intervalos.append((dia, dia))
+    return intervalos
+
+
+class AgregadoDiario:
+    def __init__(self, tem_ecf_cx_data: bool):
+        self.tem_ecf_cx_data = tem_ecf_cx_data
+        self.dias: Dias = {}
+        # Dias já lidos (com ou sem venda), do usado há mais tempo ao mais recente
+        self.carregados: "OrderedDict[date, None]" = OrderedDict()
+        self.fim: Optional[date] = None  # "hoje" da última atualização
+        self.atualizado_em = 0.0
+        self.criado_em = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def faltantes(self, inicio: date, fim: date) -> List[date]:
+        return [inicio + timedelta(days=n) for n in range((fim - inicio).days + 1)
+                if inicio + timedelta(days=n) not in self.carregados]
+
+    def recentes(self) -> List[date]:
+        """Dias carregados da janela relida a cada atualização."""
+        desde = self.fim - timedelta(days=settings.agregado_diario_janela_dias)
+        return [d for d in self.carregados if d >= desde]
+
+    def guardar(self, inicio: date, fim: date, dias: Dias):
+        for n in range((fim - inicio).days + 1):
+            dia = inicio + timedelta(days=n)
+            self.dias.pop(dia, None)
+            self.carregados[dia] = None
+        self.dias.update(dias)
+
+    def usar(self, periodos: List[Tuple[date, date]]):
+        """Marca os dias dos períodos como usados agora e despeja os excedentes fora deles."""
+        for inicio, fim in periodos:
+            for n in range((fim - inicio).days + 1):
+                dia = inicio + timedelta(days=n)
+                if dia in self.carregados:
+                    self.carregados.move_to_end(dia)
+        excesso = len(self.carregados) - settings.agregado_diario_max_dias
+        if excesso <= 0:
+            return
+        despejar = [d for d in self.carregados
+                    if not any(inicio <= d <= fim for inicio, fim in periodos)][:excesso]
+        for dia in despejar:
+            del self.carregados[dia]
+            self.dias.pop(dia, None)
+
+    def por_dia(self, data_inicial: Data, data_final: Data,
+                codigo_vendedor: Optional[str] = None) -> List[Tuple[date, int, float, float]]:
+        """(dia, quantidade, total, total autenticado) dos dias com venda, em ordem."""
+        inicio, fim = para_data(data_inicial), para_data(data_final)
+        vendedor = str(codigo_vendedor).strip() if codigo_vendedor else None
+        resultado = []
+        for dia in sorted(d for d in self.dias if inicio <= d <= fim):
+            if vendedor:
+                linhas = [self.dias[dia][vendedor]] if vendedor in self.dias[dia] else []
+            else:
+                linhas = self.dias[dia].values()
+            if linhas:
+                resultado.append((
+                    dia,
+                    sum(l[0] for l in linhas),
+                    sum(l[1] for l in linhas),
+                    sum(l[2] for l in linhas),
+                ))
+        return resultado
+
+    def totais(self, data_inicial: Data, data_final: Data,
+               codigo_vendedor: Optional[str] = None) -> Tuple[int, float, float]:
+        """(quantidade, total, total autenticado) do período."""
+        linhas = self.por_dia(data_inicial, data_final, codigo_vendedor)
+        return (
+            sum(l[1] for l in linhas),
+            sum(l[2] for l in linhas),
+            sum(l[3] for l in linhas),
+        )
+
+
+_agregados: "OrderedDict[str, AgregadoDiario]" = OrderedDict()
+
+
+async def _carregar(conn, agregado: AgregadoDiario, inicio: date, fim: date):
+    inicio_carga = time.perf_counter()
+    dias = await executar_na_conexao(conn, carregar_dias, conn.cursor(), inicio, fim, agregado.tem_ecf_cx_data)
+    agregado.guardar(inicio, fim, dias)
+    log.info(f"Agregado diário {inicio} a {fim} lido em {(time.perf_counter() - inicio_carga) * 1000:.1f} ms "
+             f"({len(dias)} dias)")
+
+
+async def obter_agregado(conn, periodos: List[Tuple[Data, Data]], tem_ecf_cx_data: bool = True) -> AgregadoDiario:
+    """
+    Agregado da base da conexão com os dias dos períodos (data_inicial,
+    data_final) carregados e atualizado nos últimos agregado_diario_refresh_segundos.
+    Dias depois de hoje não são lidos.
+    """
+    hoje = date.today()
+    periodos = [(para_data(inicio), min(para_data(fim), hoje)) for inicio, fim in periodos]
+    periodos = [(inicio, fim) for inicio, fim in periodos if inicio <= fim]
+    chave = getattr(conn, "chave", None) or id(conn)
+
+    agregado = _agregados.get(chave)
+    if (agregado is None or agregado.tem_ecf_cx_data != tem_ecf_cx_data
+            or time.monotonic() - agregado.criado_em > settings.agregado_diario_reconstrucao_horas * 3600):
+        agregado = _agregados[chave] = AgregadoDiario(tem_ecf_cx_data)
+    _agregados.move_to_end(chave)
+    while len(_agregados) > max(1, settings.agregado_diario_max_bases):
+        _agregados.popitem(last=False)
+
+    async with agregado.lock:
+        if agregado.fim is not None and (
+                agregado.fim < hoje
+                or time.monotonic() - agregado.atualizado_em >= settings.agregado_diario_refresh_segundos):
+            # Janela contada do "hoje" da última atualização, para não perder
+            # dias se o servidor ficou parado
+            for inicio, fim in _intervalos(agregado.recentes()):
+                await _carregar(conn, agregado, inicio, fim)
+            agregado.fim = hoje
+            agregado.atualizado_em = time.monotonic()
+
+        for periodo_inicio, periodo_fim in periodos:
+            for inicio, fim in _intervalos(agregado.faltantes(periodo_inicio, periodo_fim)):
+                await _carregar(conn, agregado, inicio, fim)
+        if agregado.fim is None:
+            agregado.fim = hoje
+            agregado.atualizado_em = time.monotonic()
+        agregado.usar(periodos)
+
+    return agregado
@@ -0,0 +1,81 @@
+"""
+Agregados do Dashboard.
+
+Calcula todos os números do card de estatísticas em duas consultas:
+uma única varredura de VENDAS com agregação condicional (dia, período,
+autenticadas/não autenticadas) e uma leitura das contagens de CLIENTES e
+PRODUTO. Antes eram sete consultas separadas mais uma sonda de colunas.
+Com o agregado diário (agregado_diario.py) ligado, os valores de vendas
+saem dele e só as contagens vão ao banco.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from filtros_sql import filtro_dia, filtro_periodo
+
+log = logging.getLogger("agregados_dashboard")
+
+# A varredura cobre o período e o dia de hoje; cada CASE separa o que pertence a cada card.
+# {dia} e {periodo} são predicados semiabertos de filtros_sql (2 parâmetros cada).
+SQL_AGREGADOS_VENDAS = """
+    SELECT
+        COALESCE(SUM(CASE WHEN {dia} THEN VENDAS.ECF_TOTAL ELSE 0 END), 0) AS VENDAS_DIA,
+        COALESCE(SUM(CASE WHEN {dia} THEN 1 ELSE 0 END), 0) AS PEDIDOS_DIA,
+        COALESCE(SUM(CASE WHEN {periodo} THEN VENDAS.ECF_TOTAL ELSE 0 END), 0) AS VENDAS_PERIODO,
+        COALESCE(SUM(CASE WHEN {periodo} THEN 1 ELSE 0 END), 0) AS PEDIDOS_PERIODO,
+        COALESCE(SUM(CASE WHEN {periodo} AND {autenticada} THEN VENDAS.ECF_TOTAL ELSE 0 END), 0) AS VENDAS_AUTH,
+        COALESCE(SUM(CASE WHEN {periodo} AND NOT ({autenticada}) THEN VENDAS.ECF_TOTAL ELSE 0 END), 0) AS VENDAS_NAO_AUTH
+    FROM VENDAS
+    WHERE VENDAS.ECF_CANCELADA = 'N'
+    AND VENDAS.ECF_CONCLUIDA = 'S'
+    AND (({periodo}) OR ({dia}))
+    {filtro_vendedor}
+"""
+
+# Contagens gerais (sem filtro de vendedor)
+SQL_CONTAGENS = """
+    SELECT
+        (SELECT COUNT(*) FROM CLIENTES),
+        (SELECT COUNT(*) FROM PRODUTO)
+    FROM RDB$DATABASE
+"""
+
+
+def calcular_dashboard_stats(cursor, data_hoje: str, data_inicial: str, data_final: str,
+                             filtro_vendedor: str = "", params_vendedor: Optional[List[Any]] = None,
+                             tem_ecf_cx_data: bool = True) -> Dict[str, Any]:
+    """
+    Executa as duas consultas do dashboard e devolve um dicionário com os
+    campos de DashboardStats. Bases sem VENDAS.ECF_CX_DATA contam todas as
+    vendas como não autenticadas. params_vendedor são os parâmetros (?) de
+    filtro_vendedor.
+    """
+    dia_sql, dia = filtro_dia("VENDAS.ECF_DATA", data_hoje)
+    periodo_sql, periodo = filtro_periodo("VENDAS.ECF_DATA", data_inicial, data_final)
+    autenticada = "VENDAS.ECF_CX_DATA IS NOT NULL" if tem_ecf_cx_data else "1 = 0"
+    cursor.execute(
+        SQL_AGREGADOS_VENDAS.format(dia=dia_sql, periodo=periodo_sql,
+                                    autenticada=autenticada, filtro_vendedor=filtro_vendedor),
+        list(dia * 2 + periodo * 4 + periodo + dia) + list(params_vendedor or [])
+    )
+    row = cursor.fetchone() or (0, 0, 0, 0, 0, 0)
+
+    stats = {
+        "vendas_dia": float(row[0] or 0),
+        "total_pedidos_dia": int(row[1] or 0),
+        "vendas_mes": float(row[2] or 0),
+        "valor_total_pedidos": float(row[2] or 0),
+        "total_pedidos": int(row[3] or 0),
+        "vendas_autenticadas": float(row[4] or 0),
+        "vendas_nao_autenticadas": float(row[5] or 0),
+    }
+
+    stats.update(calcular_contagens(cursor))
+    return stats
+
+
+def calcular_contagens(cursor) -> Dict[str, int]:
+    """total_clientes e total_produtos (sem filtro de vendedor)."""
+    cursor.execute(SQL_CONTAGENS)
+    row = cursor.fetchone() or (0, 0)
+    return {"total_clientes": int(row[0] or 0), "total_produtos": int(row[1] or 0)}
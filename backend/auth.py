@@ -8,6 +8,7 @@ from passlib.context import CryptContext
 import os
 import logging
 from conexao_firebird import obter_conexao_controladora, obter_conexao_cliente
+from db_async import executar
 
 # Configuração de segurança
 SECRET_KEY = os.getenv("SECRET_KEY", "chave_secreta_temporaria_mude_em_producao")
@@ -94,7 +95,7 @@ async def autenticar_usuario(email: str, senha: str):
     - CRIADO_EM (TIMESTAMP)
     """
     try:
-        conn = obter_conexao_controladora()
+        conn = await executar(None, obter_conexao_controladora)
         cursor = conn.cursor()
         
         # Consultar dados da tabela com o nome correto da coluna USU_VEN_CODIGO
@@ -208,7 +209,7 @@ async def autenticar_usuario(email: str, senha: str):
 async def obter_empresas_usuario(usuario_id: int):
     """Obtém as empresas vinculadas ao usuário."""
     try:
-        conn = obter_conexao_controladora()
+        conn = await executar(None, obter_conexao_controladora)
         cursor = conn.cursor()
         
         # Consulta as empresas vinculadas ao usuário
@@ -259,7 +260,7 @@ async def login(response: Response, form_data: UserLogin):
             # Verificar se é um caso especial de vendedor sem email cadastrado
             # fazendo uma consulta direta para determinar se o usuário existe mas é vendedor sem email
             try:
-                conn = obter_conexao_controladora()
+                conn = await executar(None, obter_conexao_controladora)
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT ID, EMAIL, NIVEL_ACESSO FROM USUARIOS_APP 
@@ -393,35 +394,50 @@ async def listar_empresas_usuario(request: Request):
 # Middleware de autenticação
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+def obter_payload_token(request: Request) -> Dict[str, Any]:
+    """
+    Decodifica o token Bearer da requisição uma única vez.
+    O payload fica guardado em request.state e é reaproveitado pelas
+    demais funções que precisarem dele durante a mesma requisição.
+    """
+    payload = getattr(request.state, "jwt_payload", None)
+    if payload is not None:
+        return payload
+    
+    authorization = request.headers.get("Authorization")
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Não autorizado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    token = authorization.replace("Bearer ", "")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    request.state.jwt_payload = payload
+    return payload
+
 @router.post("/buscar-codigo-vendedor")
 async def buscar_codigo_vendedor(request: Request):
     """
     Busca o código do vendedor na base da empresa selecionada.
     """
     try:
-        # Obtém o token da requisição
-        authorization = request.headers.get("Authorization")
-        if not authorization or not authorization.startswith("Bearer "):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Não autorizado",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        token = authorization.replace("Bearer ", "")
+        from contexto import resolver_contexto, liberar_contexto
         
-        # Decodifica o token
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            usuario_email = payload.get("sub")
-            usuario_nivel = payload.get("nivel")
-            if not usuario_email:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token inválido",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except JWTError:
+        # Token decodificado uma vez por requisição
+        payload = obter_payload_token(request)
+        usuario_email = payload.get("sub")
+        usuario_nivel = payload.get("nivel")
+        if not usuario_email:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token inválido",
@@ -440,83 +456,38 @@ async def buscar_codigo_vendedor(request: Request):
                 detail="Código da empresa não fornecido"
             )
         
-        # Busca o código do vendedor na base da empresa
+        # O contexto da requisição resolve a empresa (cache) e o vendedor (cache + conexão do pool)
         try:
-            from conexao_firebird import obter_conexao_cliente, obter_conexao_controladora
-            
-            # Converter empresa_codigo para inteiro
-            empresa_id = int(empresa_codigo)
-            logging.info(f"Buscando dados da empresa {empresa_id}")
-            
-            # Primeiro buscar dados completos da empresa na base controladora
-            conn_ctrl = obter_conexao_controladora()
-            cursor_ctrl = conn_ctrl.cursor()
-            
-            cursor_ctrl.execute("""
-                SELECT CLI_CODIGO, CLI_NOME, CLI_CAMINHO_BASE, CLI_IP_SERVIDOR, 
-                       CLI_NOME_BASE, CLI_PORTA 
-                FROM CLIENTES 
-                WHERE CLI_CODIGO = ?
-            """, (empresa_id,))
-            
-            empresa_dados = cursor_ctrl.fetchone()
-            conn_ctrl.close()
-            
-            if not empresa_dados:
-                logging.error(f"Empresa {empresa_id} não encontrada na base controladora")
-                return {
-                    "codigo_vendedor": None,
-                    "message": f"Empresa {empresa_id} não encontrada"
-                }
-            
-            # Montar dicionário da empresa
-            empresa_dict = {
-                'cli_codigo': empresa_dados[0],
-                'cli_nome': empresa_dados[1],
-                'cli_caminho_base': empresa_dados[2],
-                'cli_ip_servidor': empresa_dados[3],
-                'cli_nome_base': empresa_dados[4],
-                'cli_porta': empresa_dados[5] or '3050'
-            }
-            
-            logging.info(f"Dados da empresa {empresa_id}: {empresa_dict['cli_nome']}")
-            
-            # Conectar na base da empresa
-            conn = obter_conexao_cliente(empresa_dict)
-            cursor = conn.cursor()
-            
-            # Busca por email
-            cursor.execute("""
-                SELECT VEN_CODIGO, VEN_NOME FROM VENDEDOR 
-                WHERE VEN_EMAIL = ?
-            """, (usuario_email,))
-            
-            vendedor = cursor.fetchone()
-            conn.close()
-            
-            if vendedor:
-                codigo_vendedor = str(vendedor[0]).strip()
-                nome_vendedor = vendedor[1].strip() if vendedor[1] else ""
-                logging.info(f"Código do vendedor encontrado na empresa {empresa_codigo}: {codigo_vendedor} - {nome_vendedor}")
-                return {
-                    "codigo_vendedor": codigo_vendedor,
-                    "nome_vendedor": nome_vendedor,
-                    "message": "Código encontrado com sucesso"
-                }
-            else:
-                logging.warning(f"Código do vendedor não encontrado na empresa {empresa_codigo} para email {usuario_email}")
-                return {
-                    "codigo_vendedor": None,
-                    "message": "Código do vendedor não encontrado nesta empresa"
-                }
-                
-        except Exception as e:
-            logging.error(f"Erro ao buscar código do vendedor na empresa {empresa_codigo}: {str(e)}")
+            contexto = await resolver_contexto(request)
+        except HTTPException as e:
+            logging.error(f"Erro ao resolver contexto da empresa {empresa_codigo}: {e.detail}")
             # Em caso de erro na conexão, retornar null ao invés de erro 500
-            logging.warning(f"Falha na conexão com empresa {empresa_codigo}, retornando código null")
             return {
                 "codigo_vendedor": None,
-                "message": f"Erro na conexão com a empresa: {str(e)}"
+                "message": f"Erro na conexão com a empresa: {e.detail}"
+            }
+        finally:
+            liberar_contexto(request)
+        
+        if not contexto.empresa:
+            logging.error(f"Empresa {empresa_codigo} não encontrada na base controladora")
+            return {
+                "codigo_vendedor": None,
+                "message": f"Empresa {empresa_codigo} não encontrada"
+            }
+        
+        if contexto.codigo_vendedor:
+            logging.info(f"Código do vendedor encontrado na empresa {empresa_codigo}: {contexto.codigo_vendedor} - {contexto.nome_vendedor}")
+            return {
+                "codigo_vendedor": contexto.codigo_vendedor,
+                "nome_vendedor": contexto.nome_vendedor,
+                "message": "Código encontrado com sucesso"
+            }
+        else:
+            logging.warning(f"Código do vendedor não encontrado na empresa {empresa_codigo} para email {usuario_email}")
+            return {
+                "codigo_vendedor": None,
+                "message": "Código do vendedor não encontrado nesta empresa"
             }
             
     except HTTPException:
@@ -0,0 +1,188 @@
+"""
+Cache dos resultados dos relatórios por período.
+
+A chave é (empresa, endpoint, vendedor, data_inicial, data_final): um
+vendedor nunca recebe o resultado calculado para outro vendedor ou para o
+gerente. Períodos inteiramente passados quase não mudam e ficam
+relatorio_cache_ttl_passado segundos; períodos que incluem hoje (e
+relatórios que sempre mostram o dia, como dashboard-stats) ficam só
+relatorio_cache_ttl_atual. O descarte é LRU, por quantidade e por memória
+(tamanho estimado do JSON de cada resultado).
+
+Numa falta de cache, pedidos com a mesma chave que chegam enquanto o
+cálculo está em andamento esperam por ele (execucao_unica.py) em vez de
+repetir a consulta; "compartilhadas" conta as execuções poupadas.
+
+obter_com_revalidacao (stale-while-revalidate, usado por dashboard-stats,
+top-vendedores e vendas-por-dia): um resultado com mais que o TTL acima
+ainda é devolvido na hora, com a idade, por até relatorio_swr_segundos a
+mais, e dispara uma atualização em segundo plano. Cada empresa tem no
+máximo relatorio_swr_revalidacoes_por_empresa atualizações ao mesmo tempo
+(as demais ficam para o próximo pedido), e as consultas delas passam pelos
+limites por base de db_async.py como qualquer outra. obter_ou_calcular
+trata o resultado vencido como falta de cache.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from cache_ttl import CacheTTL, AUSENTE
+from config import get_settings
+from db_async import desvincular_da_requisicao
+from execucao_unica import ExecucaoUnica
+
+log = logging.getLogger("cache_relatorios")
+settings = get_settings()
+
+_cache = CacheTTL(
+    ttl=settings.relatorio_cache_ttl_atual,
+    max_itens=settings.relatorio_cache_max_itens,
+    max_bytes=settings.relatorio_cache_max_mb * 1024 * 1024,
+)
+
+_execucao_unica = ExecucaoUnica()
+
+# hits/misses, cálculos compartilhados e, no modo stale-while-revalidate,
+# resultados vencidos entregues e atualizações adiadas por endpoint (os
+# totais ficam no próprio CacheTTL e em _execucao_unica)
+_contadores: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {"hits": 0, "misses": 0, "compartilhadas": 0, "vencidos": 0, "revalidacoes_adiadas": 0}
+)
+
+# Atualizações em segundo plano em andamento por empresa
+_revalidacoes: Dict[Any, int] = defaultdict(int)
+_tarefas: Set[asyncio.Task] = set()
+
+ChaveRelatorio = Tuple[Any, str, str, str, str, str]
+
+
+def chave_relatorio(empresa_codigo, endpoint: str, codigo_vendedor: Optional[str],
+                    data_inicial: str, data_final: str, data_hoje: Optional[str] = None) -> ChaveRelatorio:
+    """data_hoje entra na chave dos relatórios que também trazem os valores do dia (dashboard-stats)."""
+    return (empresa_codigo, endpoint, codigo_vendedor or "", str(data_inicial)[:10], str(data_final)[:10],
+            str(data_hoje)[:10] if data_hoje else "")
+
+
+def ttl_periodo(data_final: str, inclui_hoje: bool = False) -> int:
+    """TTL longo para períodos já encerrados, curto para os que chegam até hoje."""
+    if inclui_hoje or date.fromisoformat(str(data_final)[:10]) >= date.today():
+        return settings.relatorio_cache_ttl_atual
+    return settings.relatorio_cache_ttl_passado
+
+
+def _tamanho(valor: Any) -> int:
+    return len(json.dumps(jsonable_encoder(valor), default=str))
+
+
+def _guardar(chave: ChaveRelatorio, valor: Any, inclui_hoje: bool):
+    # Cada item guarda quando foi calculado e o TTL; fica no cache pelo
+    # tempo extra em que ainda pode ser entregue vencido
+    ttl = ttl_periodo(chave[4], inclui_hoje)
+    _cache.guardar(chave, (valor, time.monotonic(), ttl),
+                   ttl=ttl + settings.relatorio_swr_segundos, tamanho=_tamanho(valor))
+
+
+async def _calcular(chave: ChaveRelatorio, calcular: Callable[[], Awaitable[Any]], inclui_hoje: bool) -> Any:
+    """Executa calcular() (uma vez só para pedidos simultâneos) e guarda o resultado."""
+    async def calcular_e_guardar():
+        resultado = await calcular()
+        _guardar(chave, resultado, inclui_hoje)
+        return resultado
+
+    if not settings.relatorio_execucao_unica:
+        return await calcular_e_guardar()
+    valor, compartilhado = await _execucao_unica.executar(chave, calcular_e_guardar)
+    if compartilhado:
+        _contadores[chave[1]]["compartilhadas"] += 1
+    return valor
+
+
+async def obter_ou_calcular(chave: ChaveRelatorio, calcular: Callable[[], Awaitable[Any]],
+                            inclui_hoje: bool = False) -> Any:
+    """
+    Devolve o resultado guardado para a chave ou executa calcular() e guarda.
+    Se o mesmo cálculo já estiver em andamento, espera por ele.
+    inclui_hoje força o TTL curto mesmo para períodos passados.
+    """
+    endpoint = chave[1]
+    item = _cache.obter(chave)
+    if item is not AUSENTE:
+        valor, calculado_em, ttl = item
+        if time.monotonic() - calculado_em < ttl:
+            _contadores[endpoint]["hits"] += 1
+            return valor
+
+    _contadores[endpoint]["misses"] += 1
+    return await _calcular(chave, calcular, inclui_hoje)
+
+
+async def obter_com_revalidacao(chave: ChaveRelatorio, calcular: Callable[[], Awaitable[Any]],
+                                inclui_hoje: bool = False) -> Tuple[Any, float]:
+    """
+    Como obter_ou_calcular, mas entrega na hora o resultado vencido (dentro
+    de relatorio_swr_segundos) e o atualiza em segundo plano. calcular()
+    não pode depender da conexão da requisição, que pode já ter terminado
+    quando a atualização rodar. Retorna (valor, idade em segundos).
+    """
+    if not settings.relatorio_swr_habilitado:
+        return await obter_ou_calcular(chave, calcular, inclui_hoje), 0.0
+
+    endpoint = chave[1]
+    item = _cache.obter(chave)
+    if item is AUSENTE:
+        _contadores[endpoint]["misses"] += 1
+        return await _calcular(chave, calcular, inclui_hoje), 0.0
+
+    valor, calculado_em, ttl = item
+    idade = time.monotonic() - calculado_em
+    _contadores[endpoint]["hits"] += 1
+    if idade >= ttl:
+        _contadores[endpoint]["vencidos"] += 1
+        _revalidar(chave, calcular, inclui_hoje)
+    return valor, idade
+
+
+def _revalidar(chave: ChaveRelatorio, calcular: Callable[[], Awaitable[Any]], inclui_hoje: bool):
+    """Agenda a atualização da chave, se não houver uma em andamento e a empresa tiver vaga."""
+    empresa, endpoint = chave[0], chave[1]
+    if _execucao_unica.em_andamento(chave):
+        return
+    if _revalidacoes[empresa] >= settings.relatorio_swr_revalidacoes_por_empresa:
+        _contadores[endpoint]["revalidacoes_adiadas"] += 1
+        return
+    _revalidacoes[empresa] += 1
+
+    async def revalidar():
+        # A tarefa herda o contexto da requisição; uma recusa da fila do
+        # banco aqui não pode transformar a resposta já entregue em 503
+        desvincular_da_requisicao()
+        inicio = time.perf_counter()
+        try:
+            await _calcular(chave, calcular, inclui_hoje)
+            log.info(f"{endpoint} da empresa {empresa} atualizado em segundo plano em "
+                     f"{(time.perf_counter() - inicio) * 1000:.1f} ms")
+        except Exception as e:
+            log.warning(f"Falha ao atualizar {endpoint} da empresa {empresa} em segundo plano: {e}")
+        finally:
+            _revalidacoes[empresa] -= 1
+            if not _revalidacoes[empresa]:
+                del _revalidacoes[empresa]
+
+    tarefa = asyncio.get_running_loop().create_task(revalidar())
+    _tarefas.add(tarefa)
+    tarefa.add_done_callback(_tarefas.discard)
+
+
+def estatisticas() -> Dict[str, Any]:
+    return {
+        **_cache.estatisticas(),
+        "execucao_unica": _execucao_unica.estatisticas(),
+        "revalidacoes_em_andamento": sum(_revalidacoes.values()),
+        "por_endpoint": {k: dict(v) for k, v in _contadores.items()},
+    }
@@ -0,0 +1,77 @@
+"""
+Cache em memória com expiração (TTL) e descarte LRU.
+Usado para dados que quase nunca mudam e são consultados a cada requisição.
+Opcionalmente limita também a memória: com max_bytes > 0 cada item é
+guardado com o tamanho informado pelo chamador e os menos usados são
+descartados até a soma caber no limite.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+# Retornado por CacheTTL.obter quando a chave não está no cache (ou expirou).
+# Permite guardar None como valor válido (cache negativo).
+AUSENTE = object()
+
+
+class CacheTTL:
+    def __init__(self, ttl: float, max_itens: int = 1000, max_bytes: int = 0):
+        self.ttl = ttl
+        self.max_itens = max(1, max_itens)
+        self.max_bytes = max_bytes
+        self._itens = OrderedDict()  # chave -> (valor, expira_em, tamanho)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.descartes = 0
+
+    def obter(self, chave: Hashable, padrao: Any = AUSENTE) -> Any:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.misses += 1
+                return padrao
+            valor, expira_em, tamanho = item
+            if time.monotonic() >= expira_em:
+                del self._itens[chave]
+                self._bytes -= tamanho
+                self.misses += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def guardar(self, chave: Hashable, valor: Any, ttl: float = None, tamanho: int = 0):
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if self.max_bytes and tamanho > self.max_bytes:
+                return  # maior que o cache inteiro: não vale guardar
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[2]
+            self._itens[chave] = (valor, expira_em, tamanho)
+            self._bytes += tamanho
+            while len(self._itens) > self.max_itens or (self.max_bytes and self._bytes > self.max_bytes):
+                _, descartado = self._itens.popitem(last=False)
+                self._bytes -= descartado[2]
+                self.descartes += 1
+
+    def invalidar(self, chave: Hashable):
+        with self._lock:
+            item = self._itens.pop(chave, None)
+            if item is not None:
+                self._bytes -= item[2]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            estatisticas = {"itens": len(self._itens), "hits": self.hits, "misses": self.misses}
+            if self.max_bytes:
+                estatisticas.update({"bytes": self._bytes, "max_bytes": self.max_bytes, "descartes": self.descartes})
+            return estatisticas
@@ -0,0 +1,246 @@
+"""
+Catálogo de produtos em memória por empresa, para o autocomplete.
+
+/relatorios/produtos era chamado a cada tecla do ProdutoAutocomplete e
+fazia LIKE '%termo%' em descrição, código e marca, varrendo PRODUTO toda
+vez. Aqui os itens ativos do tablet (ITEM_TABLET = 'S') são lidos uma vez
+e indexados por palavra: cada palavra da busca, sem acento e sem
+diferença de maiúsculas, precisa ser início de alguma palavra da descrição
+ou da marca; uma busca só com dígitos também encontra os códigos que
+começam por ela. A resposta sai do índice, sem ir ao banco.
+
+O catálogo inteiro é relido a cada catalogo_produtos_recarga_segundos
+(produtos novos, inativados ou renomeados). Preço e estoque mudam o tempo
+todo e são atualizados a cada catalogo_produtos_delta_segundos. PRODUTO não
+tem data de alteração, então essa atualização não é um delta: lê preço e
+estoque de todos os itens do tablet (só essas colunas) e não refaz o índice.
+
+Só a primeira carga da empresa faz a busca esperar. A releitura completa e
+a de preço/estoque rodam em segundo plano (uma por empresa de cada vez),
+enquanto as buscas usam o catálogo atual; o índice é montado no executor,
+fora do event loop. conectar() devolve uma conexão própria, que é fechada
+aqui depois da leitura.
+"""
+import asyncio
+import heapq
+import logging
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+from config import get_settings
+from db_async import desvincular_da_requisicao, executar, executar_na_conexao
+
+log = logging.getLogger("catalogo_produtos")
+settings = get_settings()
+
+FILTRO_TABLET = "P.ITEM_TABLET = 'S' AND (P.PRO_INATIVO = 'N' OR P.PRO_INATIVO IS NULL)"
+
+SQL_CATALOGO_PRODUTOS = f"""
+    SELECT
+        P.PRO_CODIGO,
+        P.PRO_DESCRICAO,
+        P.PRO_VENDA,
+        P.PRO_VENDAPZ,
+        P.PRO_DESCPROVLR,
+        P.PRO_MARCA,
+        P.UNI_CODIGO,
+        P.PRO_QUANTIDADE,
+        P.PRO_IMAGEM
+    FROM PRODUTO P
+    WHERE {FILTRO_TABLET}
+"""
+
+SQL_PRECO_ESTOQUE = f"""
+    SELECT P.PRO_CODIGO, P.PRO_VENDA, P.PRO_VENDAPZ, P.PRO_DESCPROVLR, P.PRO_QUANTIDADE
+    FROM PRODUTO P
+    WHERE {FILTRO_TABLET}
+"""
+
+_SEPARADORES = re.compile(r"[^0-9A-Z]+")
+
+
+def normalizar(texto: Any) -> str:
+    """Maiúsculas e sem acentos: 'Pão de Açúcar' -> 'PAO DE ACUCAR'."""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    return "".join(c for c in texto if not unicodedata.combining(c)).upper()
+
+
+def palavras(texto: Any) -> List[str]:
+    return [p for p in _SEPARADORES.split(normalizar(texto)) if p]
+
+
+def _numero(valor) -> float:
+    return float(valor) if valor is not None else 0.0
+
+
+def _linha_para_produto(row) -> Dict[str, Any]:
+    # Mesmo formato que /relatorios/produtos sempre devolveu
+    return {
+        "pro_codigo": row[0],
+        "pro_descricao": row[1] or "",
+        "pro_venda": _numero(row[2]),
+        "pro_vendapz": _numero(row[3]),
+        "pro_descprovlr": _numero(row[4]),
+        "PRO_MARCA": row[5] if row[5] is not None else "",
+        "UNI_CODIGO": row[6] if row[6] is not None else "",
+        "pro_quantidade": _numero(row[7]),
+        "pro_imagem": row[8] or ""
+    }
+
+
+def ler_produtos(cursor) -> List[Dict[str, Any]]:
+    cursor.execute(SQL_CATALOGO_PRODUTOS)
+    produtos = []
+    for row in cursor.fetchall():
+        try:
+            produtos.append(_linha_para_produto(row))
+        except (ValueError, TypeError) as e:
+            log.error(f"Produto {row[0]} ignorado no catálogo: {e}")
+    return produtos
+
+
+def ler_precos_estoque(cursor) -> List[tuple]:
+    cursor.execute(SQL_PRECO_ESTOQUE)
+    return cursor.fetchall()
+
+
+class CatalogoProdutos:
+    """Produtos de uma base e o índice de palavras/códigos."""
+
+    def __init__(self, produtos: List[Dict[str, Any]]):
+        produtos = sorted(produtos, key=lambda p: normalizar(p["pro_descricao"]))
+        self.produtos: Dict[Any, Dict[str, Any]] = {}
+        self._posicao: Dict[Any, int] = {}
+        indice: Dict[str, Set[Any]] = {}
+        for posicao, produto in enumerate(produtos):
+            codigo = produto["pro_codigo"]
+            self.produtos[codigo] = produto
+            self._posicao[codigo] = posicao
+            for palavra in palavras(produto["pro_descricao"]) + palavras(produto["PRO_MARCA"]):
+                indice.setdefault(palavra, set()).add(codigo)
+        self._indice = indice
+        self._palavras = sorted(indice)
+        self._codigos = sorted((str(codigo).strip(), codigo) for codigo in self.produtos)
+        self.carregado_em = time.monotonic()
+        self.atualizado_em = self.carregado_em
+
+    def _com_prefixo(self, prefixo: str) -> Set[Any]:
+        achados: Set[Any] = set()
+        i = bisect_left(self._palavras, prefixo)
+        while i < len(self._palavras) and self._palavras[i].startswith(prefixo):
+            achados |= self._indice[self._palavras[i]]
+            i += 1
+        return achados
+
+    def _codigos_com_prefixo(self, prefixo: str) -> Set[Any]:
+        achados: Set[Any] = set()
+        i = bisect_left(self._codigos, (prefixo,))
+        while i < len(self._codigos) and self._codigos[i][0].startswith(prefixo):
+            achados.add(self._codigos[i][1])
+            i += 1
+        return achados
+
+    def buscar(self, q: str, limite: int = 20) -> List[Dict[str, Any]]:
+        """Até `limite` produtos em ordem de descrição (busca vazia: os primeiros)."""
+        termo = (q or "").replace("%", " ").strip()
+        termos = palavras(termo)
+        if not termos:
+            codigos = self.produtos.keys()
+        else:
+            codigos = None
+            for palavra in termos:
+                achados = self._com_prefixo(palavra)
+                codigos = achados if codigos is None else codigos & achados
+                if not codigos:
+                    break
+            if termo.isdigit():
+                codigos = codigos | self._codigos_com_prefixo(termo)
+        return [dict(self.produtos[c]) for c in heapq.nsmallest(limite, codigos, key=self._posicao.__getitem__)]
+
+    def aplicar_precos_estoque(self, linhas: List[tuple]):
+        for codigo, venda, prazo, minimo, quantidade in linhas:
+            produto = self.produtos.get(codigo)
+            if produto is not None:
+                produto["pro_venda"] = _numero(venda)
+                produto["pro_vendapz"] = _numero(prazo)
+                produto["pro_descprovlr"] = _numero(minimo)
+                produto["pro_quantidade"] = _numero(quantidade)
+        self.atualizado_em = time.monotonic()
+
+
+_catalogos: Dict[Any, CatalogoProdutos] = {}
+_cargas: Dict[Any, asyncio.Lock] = {}
+# Atualização em segundo plano em andamento por empresa
+_atualizacoes: Dict[Any, asyncio.Task] = {}
+
+
+async def _ler(conectar: Callable[[], Awaitable[Any]], leitura: Callable):
+    conn = await conectar()
+    try:
+        return await executar_na_conexao(conn, leitura, conn.cursor())
+    finally:
+        conn.close()
+
+
+async def _carregar(chave: Any, conectar: Callable[[], Awaitable[Any]]) -> CatalogoProdutos:
+    inicio = time.perf_counter()
+    produtos = await _ler(conectar, ler_produtos)
+    lidos_em = time.perf_counter()
+    # Indexar milhares de descrições é CPU: roda no executor, sem vaga da base
+    catalogo = _catalogos[chave] = await executar(None, CatalogoProdutos, produtos)
+    log.info(f"Catálogo de produtos da empresa {chave}: {len(produtos)} itens lidos em "
+             f"{(lidos_em - inicio) * 1000:.1f} ms e indexados em {(time.perf_counter() - lidos_em) * 1000:.1f} ms")
+    return catalogo
+
+
+async def _atualizar_precos_estoque(catalogo: CatalogoProdutos, conectar: Callable[[], Awaitable[Any]]):
+    catalogo.aplicar_precos_estoque(await _ler(conectar, ler_precos_estoque))
+
+
+def _em_segundo_plano(chave: Any, descricao: str, atualizar: Callable[[], Awaitable[Any]]):
+    if chave in _atualizacoes:
+        return
+
+    async def executar_atualizacao():
+        # A tarefa herda o contexto da requisição; uma recusa da fila do
+        # banco aqui não pode transformar a busca já respondida em 503
+        desvincular_da_requisicao()
+        try:
+            await atualizar()
+        except Exception as e:
+            log.warning(f"Falha na {descricao} do catálogo de produtos da empresa {chave}: {e}")
+        finally:
+            _atualizacoes.pop(chave, None)
+
+    _atualizacoes[chave] = asyncio.get_running_loop().create_task(executar_atualizacao())
+
+
+async def obter_catalogo_produtos(chave: Any, conectar: Callable[[], Awaitable[Any]]) -> CatalogoProdutos:
+    """
+    Catálogo da empresa `chave`. conectar() só é chamado quando é preciso
+    ler o banco. Só espera pela leitura na primeira carga; vencido, o
+    catálogo atual é devolvido e a atualização fica em segundo plano.
+    """
+    catalogo = _catalogos.get(chave)
+    if catalogo is None:
+        # Uma carga por empresa; quem chega durante a carga usa o resultado dela
+        async with _cargas.setdefault(chave, asyncio.Lock()):
+            catalogo = _catalogos.get(chave)
+            if catalogo is None:
+                catalogo = await _carregar(chave, conectar)
+        return catalogo
+
+    agora = time.monotonic()
+    if agora - catalogo.carregado_em >= settings.catalogo_produtos_recarga_segundos:
+        # Se a releitura falhar, tenta de novo depois de catalogo_produtos_delta_segundos
+        catalogo.carregado_em = (agora - settings.catalogo_produtos_recarga_segundos
+                                 + settings.catalogo_produtos_delta_segundos)
+        _em_segundo_plano(chave, "releitura", lambda: _carregar(chave, conectar))
+    elif agora - catalogo.atualizado_em >= settings.catalogo_produtos_delta_segundos:
+        catalogo.atualizado_em = agora
+        _em_segundo_plano(chave, "atualização de preço e estoque",
+                          lambda: _atualizar_precos_estoque(catalogo, conectar))
+    return catalogo
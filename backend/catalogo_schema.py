@@ -0,0 +1,82 @@
+"""
+Catálogo de tabelas e colunas de cada base de empresa.
+
+Os endpoints precisavam saber se uma tabela (ORCAMENT, ITORC, EMPRESA...)
+ou coluna (VENDAS.ECF_CX_DATA) existe e consultavam RDB$RELATIONS ou
+faziam SELECT FIRST 1 * a cada chamada. O catálogo é lido uma vez por base
+em uma única consulta e fica em cache por schema_cache_ttl segundos.
+"""
+import logging
+from typing import Dict, List, Optional, Set
+
+from cache_ttl import CacheTTL, AUSENTE
+from config import get_settings
+
+log = logging.getLogger("catalogo_schema")
+
+settings = get_settings()
+
+SQL_CATALOGO = """
+    SELECT RF.RDB$RELATION_NAME, RF.RDB$FIELD_NAME
+    FROM RDB$RELATION_FIELDS RF
+    JOIN RDB$RELATIONS R ON R.RDB$RELATION_NAME = RF.RDB$RELATION_NAME
+    WHERE COALESCE(R.RDB$SYSTEM_FLAG, 0) = 0
+"""
+
+# Catálogos por base (chave do pool = DSN)
+_catalogos = CacheTTL(ttl=settings.schema_cache_ttl, max_itens=500)
+
+
+class CatalogoSchema:
+    """Tabelas e colunas de uma base; nomes guardados em maiúsculas."""
+
+    def __init__(self, tabelas: Dict[str, Set[str]]):
+        self._tabelas = tabelas
+
+    def tem_tabela(self, tabela: str) -> bool:
+        return tabela.upper() in self._tabelas
+
+    def tem_coluna(self, tabela: str, coluna: str) -> bool:
+        return coluna.upper() in self._tabelas.get(tabela.upper(), ())
+
+    def colunas(self, tabela: str) -> Set[str]:
+        return set(self._tabelas.get(tabela.upper(), ()))
+
+    def tabelas(self) -> List[str]:
+        return sorted(self._tabelas)
+
+
+def carregar_catalogo(conn) -> CatalogoSchema:
+    """Lê todas as tabelas de usuário e suas colunas."""
+    cursor = conn.cursor()
+    cursor.execute(SQL_CATALOGO)
+    tabelas: Dict[str, Set[str]] = {}
+    for tabela, coluna in cursor.fetchall():
+        tabelas.setdefault(tabela.strip().upper(), set()).add(coluna.strip().upper())
+    log.info(f"Catálogo carregado: {len(tabelas)} tabelas")
+    return CatalogoSchema(tabelas)
+
+
+def obter_catalogo(conn, chave: Optional[str] = None) -> CatalogoSchema:
+    """
+    Retorna o catálogo da base da conexão, lendo do banco só quando não
+    estiver em cache. Conexões do pool já trazem a chave (DSN); para
+    conexões avulsas informe uma chave que identifique a base.
+    """
+    chave = chave or getattr(conn, "chave", None)
+    if chave is None:
+        return carregar_catalogo(conn)
+
+    catalogo = _catalogos.obter(chave)
+    if catalogo is AUSENTE:
+        catalogo = carregar_catalogo(conn)
+        _catalogos.guardar(chave, catalogo)
+    return catalogo
+
+
+def invalidar_catalogo(chave: Optional[str] = None):
+    """Descarta o catálogo de uma base (ou de todas) após mudanças de estrutura."""
+    if chave is None:
+        _catalogos.limpar()
+    else:
+        _catalogos.invalidar(chave)
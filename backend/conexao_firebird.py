@@ -3,6 +3,7 @@ import logging
 import os
 import sys
 from config import get_settings
+from pool_conexoes import obter_pool
 
 # Configura o caminho para a DLL do Firebird
 raiz_projeto = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,9 +25,11 @@ else:
 # Obtém as configurações
 settings = get_settings()
 
-def obter_conexao_controladora():
+CHAVE_POOL_CONTROLADORA = "controladora"
+
+def _conectar_controladora():
     """
-    Obtém uma conexão com o banco de dados controlador.
+    Abre uma conexão nova com o banco de dados controlador.
     """
     try:
         conn = fdb.connect(
@@ -41,37 +44,59 @@ def obter_conexao_controladora():
         logging.error(f"Erro ao conectar ao banco controlador: {str(e)}")
         raise Exception("Não foi possível conectar ao banco controlador. Verifique se o servidor está online ou tente novamente mais tarde.")
 
+def obter_conexao_controladora():
+    """
+    Obtém uma conexão com o banco de dados controlador.
+    A conexão vem de um pool pequeno e dedicado, compartilhado por login,
+    seleção de empresa e filtros de vendedor; conn.close() a devolve ao pool.
+    """
+    pool = obter_pool(
+        CHAVE_POOL_CONTROLADORA,
+        _conectar_controladora,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_controladora_max_size,
+        timeout=settings.db_pool_controladora_timeout,
+        idle_timeout=settings.db_pool_idle_timeout,
+        ping_intervalo=settings.db_pool_ping_intervalo
+    )
+    return pool.adquirir()
+
+def montar_dsn_cliente(empresa):
+    """
+    Monta o DSN da base do cliente a partir dos dados da empresa
+    (cli_ip_servidor, cli_porta, cli_caminho_base, cli_nome_base).
+    """
+    ip = empresa['cli_ip_servidor']
+    porta = empresa.get('cli_porta', '3050')
+    caminho_base = empresa['cli_caminho_base']
+    nome_base = empresa.get('cli_nome_base', '')
+    if not ip:
+        raise Exception("IP do servidor não configurado.")
+    if not caminho_base and not nome_base:
+        raise Exception("Caminho da base não configurado.")
+    if ip in ("localhost", "127.0.0.1"):
+        if not os.path.isabs(caminho_base):
+            caminho_base = os.path.abspath(caminho_base)
+        if nome_base:
+            dsn = os.path.join(caminho_base, nome_base)
+        else:
+            dsn = caminho_base
+        return dsn.replace("\\", "/")
+    if nome_base:
+        return f"{ip}/{porta}:{caminho_base}/{nome_base}"
+    return f"{ip}/{porta}:{caminho_base}"
+
 def obter_conexao_cliente(empresa):
     """
     Obtém uma conexão nova e independente com o banco de dados do cliente.
     NÃO usa pool/caching global. Cada chamada retorna uma conexão nova.
+    Para os endpoints, use obter_conexao_cliente_pool.
     Timeout de 5 segundos para evitar travamentos.
     """
-    import os
-    import fdb
     dsn = "Não definido"
     try:
-        ip = empresa['cli_ip_servidor']
-        porta = empresa.get('cli_porta', '3050')
+        dsn = montar_dsn_cliente(empresa)
         caminho_base = empresa['cli_caminho_base']
-        nome_base = empresa.get('cli_nome_base', '')
-        if not ip:
-            raise Exception("IP do servidor não configurado.")
-        if not caminho_base and not nome_base:
-            raise Exception("Caminho da base não configurado.")
-        if ip in ("localhost", "127.0.0.1"):
-            if not os.path.isabs(caminho_base):
-                caminho_base = os.path.abspath(caminho_base)
-            if nome_base:
-                dsn = os.path.join(caminho_base, nome_base)
-            else:
-                dsn = caminho_base
-            dsn = dsn.replace("\\", "/")
-        else:
-            if nome_base:
-                dsn = f"{ip}/{porta}:{caminho_base}/{nome_base}"
-            else:
-                dsn = f"{ip}/{porta}:{caminho_base}"
         caminho_base_absoluto = os.path.abspath(caminho_base) if not os.path.isabs(caminho_base) else caminho_base
         diretorio_banco = os.path.dirname(caminho_base_absoluto)
         dll_cliente_path = os.path.join(diretorio_banco, 'fbclient.dll')
@@ -99,6 +124,29 @@ def obter_conexao_cliente(empresa):
     except Exception as e:
         raise Exception(f"Erro ao conectar ao banco Firebird: {str(e)}\nDSN tentado: {dsn}")
 
+def obter_pool_cliente(empresa):
+    """Pool da base do cliente (um pool por DSN), criado na primeira chamada."""
+    dsn = montar_dsn_cliente(empresa)
+    return obter_pool(
+        dsn,
+        lambda: obter_conexao_cliente(empresa),
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+        timeout=settings.db_pool_timeout,
+        idle_timeout=settings.db_pool_idle_timeout,
+        ping_intervalo=settings.db_pool_ping_intervalo,
+        instrucoes_max=settings.db_pool_instrucoes_max
+    )
+
+def obter_conexao_cliente_pool(empresa):
+    """
+    Empresta uma conexão do pool da base do cliente (um pool por DSN).
+    conn.close() devolve a conexão ao pool. Levanta PoolEsgotado se nenhuma
+    conexão ficar livre dentro de db_pool_timeout segundos. Bloqueante: no
+    código async use obter_pool_cliente(empresa).adquirir_async(...).
+    """
+    return obter_pool_cliente(empresa).adquirir()
+
 async def testar_conexao(connection):
     """
     Testa a conexão com o banco de dados fazendo uma consulta simples.
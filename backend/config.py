@@ -21,6 +21,79 @@ class Settings(BaseSettings):
     db_pool_min_size: int = 1
     db_pool_max_size: int = 5
     db_pool_timeout: int = 30  # segundos
+    db_pool_idle_timeout: int = 300  # segundos ociosa antes de ser fechada
+    db_pool_ping_intervalo: int = 30  # segundos ociosa antes de testar a conexão
+    # Pool dedicado do banco controlador: login, seleção de empresa e filtro de
+    # vendedor pegam e devolvem uma conexão por chamada, mas o get_db de main.py
+    # segura uma durante a requisição inteira, então o pool acompanha o número
+    # de requisições simultâneas, e a espera é curta para falhar cedo.
+    db_pool_controladora_max_size: int = 10
+    db_pool_controladora_timeout: int = 10  # segundos
+    db_pool_instrucoes_max: int = 64  # instruções preparadas guardadas por conexão das empresas (0 desliga)
+    
+    # Executor das chamadas bloqueantes do fdb (db_async.py)
+    db_executor_workers: int = 20
+    db_limite_por_base: int = 5  # chamadas simultâneas por base (igual ao db_pool_max_size)
+    db_limite_por_servidor: int = 8  # chamadas simultâneas por servidor Firebird (cli_ip_servidor)
+    db_fila_maxima_por_servidor: int = 50  # acima disso a chamada é recusada com 503
+    db_fila_maxima_por_base: int = 20  # parte da fila que uma só base pode ocupar
+    db_retry_after: int = 5  # segundos sugeridos no Retry-After
+    
+    # Cache dos dados de conexão das empresas (banco controlador)
+    empresa_cache_ttl: int = 300  # segundos
+    empresa_cache_max_itens: int = 500
+    
+    # Cache do código de vendedor por (empresa, e-mail) usado no filtro dos relatórios
+    vendedor_cache_ttl: int = 600  # segundos
+    vendedor_cache_ttl_negativo: int = 60  # e-mails sem vendedor cadastrado
+    vendedor_cache_max_itens: int = 5000
+    
+    # Cache do catálogo de tabelas/colunas de cada base de empresa
+    schema_cache_ttl: int = 1800  # segundos
+    
+    # Cache dos resultados dos relatórios por período (cache_relatorios.py)
+    relatorio_cache_ttl_passado: int = 21600  # segundos, períodos já encerrados
+    relatorio_cache_ttl_atual: int = 60  # segundos, períodos que incluem hoje
+    relatorio_cache_max_itens: int = 5000
+    relatorio_cache_max_mb: int = 64
+    relatorio_execucao_unica: bool = True  # pedidos iguais simultâneos esperam o mesmo cálculo
+    dashboard_conexoes_por_requisicao: int = 2  # conexões simultâneas do /relatorios/dashboard
+    # Stale-while-revalidate de dashboard-stats, top-vendedores e vendas-por-dia
+    relatorio_swr_habilitado: bool = True
+    relatorio_swr_segundos: int = 600  # tempo após o TTL em que o resultado ainda é entregue (vencido)
+    relatorio_swr_revalidacoes_por_empresa: int = 1  # atualizações em segundo plano simultâneas por empresa
+    
+    # Agregado diário de vendas por base (agregado_diario.py)
+    agregado_diario_habilitado: bool = True
+    agregado_diario_janela_dias: int = 3  # dias anteriores a hoje relidos a cada atualização
+    agregado_diario_max_dias: int = 400  # dias guardados por base (despejo do usado há mais tempo)
+    agregado_diario_max_bases: int = 50
+    agregado_diario_refresh_segundos: int = 60
+    agregado_diario_reconstrucao_horas: int = 24
+    
+    # Catálogo de produtos em memória do autocomplete (catalogo_produtos.py)
+    catalogo_produtos_habilitado: bool = True
+    catalogo_produtos_recarga_segundos: int = 900  # releitura completa (produtos novos/inativados)
+    catalogo_produtos_delta_segundos: int = 30  # preço e estoque
+    
+    # Diretório de clientes em memória das buscas (diretorio_clientes.py)
+    clientes_diretorio_habilitado: bool = True
+    clientes_diretorio_recarga_segundos: int = 1800  # releitura completa de CLIENTES
+    clientes_diretorio_novos_segundos: int = 60  # clientes novos e alterados pelo app
+    clientes_diretorio_max_codigos_sql: int = 1000  # acima disso a positivação volta ao LIKE
+    
+    # Números de orçamento reservados por vez na tabela CODIGO (numeracao_orcamentos.py)
+    orcamento_numeracao_bloco: int = 20
+    orcamento_itens_lote: int = 200  # itens por executemany ao gravar um orçamento
+    
+    # Limites de resultados dos relatórios
+    positivacao_produtos_limite_maximo: int = 500
+    vendas_limite_padrao: int = 500  # /relatorios/vendas sem limit
+    vendas_limite_maximo: int = 2000
+    clientes_limite_padrao: int = 20  # /relatorios/clientes (autocomplete)
+    clientes_new_limite_padrao: int = 100  # /relatorios/clientes-new
+    clientes_limite_maximo: int = 500
+    stream_lote: int = 500  # linhas por fetchmany nas respostas ?stream=ndjson
     
     # Configurações da API
     api_host: str = "0.0.0.0"
@@ -0,0 +1,189 @@
+"""
+Consultas da positivação de clientes e de produtos.
+
+As vendas do período são agregadas uma única vez em uma tabela derivada
+(por cliente, ou por produto no histórico de um cliente) e depois ligadas
+a CLIENTES / ao mix de PRODUTO com LEFT JOIN. A versão anterior fazia
+quatro subconsultas correlacionadas (MAX, EXISTS, SUM e COUNT) para cada
+linha do resultado.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from filtros_sql import filtro_periodo, paginacao
+
+
+def sql_positivacao_clientes(data_inicial: str, data_final: str, filtro_vendedor: str = "",
+                             filtro_busca: str = "", params_busca: Optional[List[Any]] = None,
+                             limit: Optional[int] = None, offset: int = 0,
+                             params_vendedor: Optional[List[Any]] = None) -> Tuple[str, List[Any], Optional[int]]:
+    """
+    Monta a consulta de positivação de clientes.
+    filtro_vendedor e filtro_busca usam o alias c (CLIENTES); params_vendedor
+    e params_busca são os seus parâmetros (?).
+    Retorna (sql, params, limite efetivo da paginação).
+    """
+    periodo_sql, periodo_params = filtro_periodo("v.ECF_DATA", data_inicial, data_final)
+    rows_sql, limite = paginacao(limit, offset)
+    sql = f'''
+        SELECT
+          c.CLI_CODIGO,
+          c.CLI_NOME,
+          c.CNPJ,
+          c.CIDADE,
+          c.UF,
+          a.ULTIMA_OPERACAO,
+          CASE WHEN a.CLI_CODIGO IS NULL THEN 0 ELSE 1 END AS POSITIVADO,
+          COALESCE(a.TOTAL_COMPRAS, 0) AS TOTAL_COMPRAS,
+          COALESCE(a.QTDE_COMPRAS, 0) AS QTDE_COMPRAS
+        FROM CLIENTES c
+        LEFT JOIN (
+          SELECT
+            v.CLI_CODIGO,
+            MAX(v.ECF_DATA) AS ULTIMA_OPERACAO,
+            SUM(v.ECF_TOTAL) AS TOTAL_COMPRAS,
+            COUNT(v.ECF_NUMERO) AS QTDE_COMPRAS
+          FROM VENDAS v
+          WHERE v.ECF_CANCELADA = 'N'
+            AND v.ECF_CONCLUIDA = 'S'
+            AND {periodo_sql}
+          GROUP BY v.CLI_CODIGO
+        ) a ON a.CLI_CODIGO = c.CLI_CODIGO
+        WHERE (c.CLI_INATIVO = 'N' OR c.CLI_INATIVO IS NULL)
+        {filtro_vendedor}
+        {filtro_busca}
+        ORDER BY c.CLI_NOME
+        {rows_sql}
+    '''
+    return sql, list(periodo_params) + list(params_vendedor or []) + list(params_busca or []), limite
+
+
+def linha_para_cliente(row) -> Dict[str, Any]:
+    return {
+        "cli_codigo": row[0],
+        "cli_nome": row[1],
+        "cnpj": row[2] or "",
+        "cidade": row[3],
+        "uf": row[4],
+        "ultima_operacao": row[5],
+        "positivado": bool(row[6]),
+        "total_compras": float(row[7] or 0),
+        "qtde_compras": int(row[8] or 0)
+    }
+
+
+def _origem_positivacao_produtos(cli_codigo: str, data_inicial: str, data_final: str,
+                                 filtro_produto: str = "", params_produto: Optional[List[Any]] = None,
+                                 positivado: Optional[bool] = None) -> Tuple[str, List[Any]]:
+    """FROM/WHERE da positivação de produtos, comum à listagem e à contagem."""
+    periodo_sql, periodo_params = filtro_periodo("v.ECF_DATA", data_inicial, data_final)
+    filtro_positivado = ""
+    if positivado is not None:
+        filtro_positivado = "AND h.PRO_CODIGO IS NOT NULL" if positivado else "AND h.PRO_CODIGO IS NULL"
+    sql = f'''
+        FROM PRODUTO p
+        LEFT JOIN (
+          SELECT
+            i.PRO_CODIGO,
+            MAX(v.ECF_DATA) AS ULTIMA_COMPRA,
+            SUM(i.PRO_QUANTIDADE) AS QTDE_COMPRADA,
+            SUM(i.PRO_QUANTIDADE * i.PRO_VENDA) AS VALOR_COMPRADO
+          FROM VENDAS v
+          JOIN ITVENDA i ON i.ECF_NUMERO = v.ECF_NUMERO
+          WHERE v.CLI_CODIGO = ?
+            AND v.ECF_CANCELADA = 'N'
+            AND v.ECF_CONCLUIDA = 'S'
+            AND {periodo_sql}
+          GROUP BY i.PRO_CODIGO
+        ) h ON h.PRO_CODIGO = p.PRO_CODIGO
+        WHERE p.PRO_INATIVO = 'N' AND p.ITEM_TABLET = 'S'
+        {filtro_produto}
+        {filtro_positivado}
+    '''
+    return sql, [cli_codigo, *periodo_params] + list(params_produto or [])
+
+
+def sql_positivacao_produtos(cli_codigo: str, data_inicial: str, data_final: str,
+                             filtro_produto: str = "", params_produto: Optional[List[Any]] = None,
+                             limit: Optional[int] = None, offset: int = 0,
+                             limite_maximo: Optional[int] = None,
+                             positivado: Optional[bool] = None) -> Tuple[str, List[Any], Optional[int]]:
+    """
+    Monta a consulta do mix de produtos (ITEM_TABLET = 'S') com o histórico
+    de compras do cliente no período agregado por PRO_CODIGO.
+    filtro_produto usa o alias p (PRODUTO); positivado (True/False) deixa só
+    os produtos comprados / não comprados no período.
+    Retorna (sql, params, limite efetivo da paginação).
+    """
+    origem_sql, params = _origem_positivacao_produtos(cli_codigo, data_inicial, data_final,
+                                                      filtro_produto, params_produto, positivado)
+    rows_sql, limite = paginacao(limit, offset, limite_maximo)
+    sql = f'''
+        SELECT
+          p.PRO_CODIGO,
+          p.PRO_DESCRICAO,
+          p.PRO_MARCA,
+          p.UNI_CODIGO,
+          h.ULTIMA_COMPRA,
+          h.QTDE_COMPRADA,
+          h.VALOR_COMPRADO,
+          CASE WHEN h.PRO_CODIGO IS NULL THEN 0 ELSE 1 END AS POSITIVADO
+        {origem_sql}
+        ORDER BY p.PRO_DESCRICAO
+        {rows_sql}
+    '''
+    return sql, params, limite
+
+
+def sql_contagem_positivacao_produtos(cli_codigo: str, data_inicial: str, data_final: str,
+                                      filtro_produto: str = "", params_produto: Optional[List[Any]] = None,
+                                      positivado: Optional[bool] = None) -> Tuple[str, List[Any]]:
+    """Total de produtos da positivação, sem paginação."""
+    origem_sql, params = _origem_positivacao_produtos(cli_codigo, data_inicial, data_final,
+                                                      filtro_produto, params_produto, positivado)
+    return f"SELECT COUNT(*) {origem_sql}", params
+
+
+def sql_mix_produtos(filtro_produto: str = "", params_produto: Optional[List[Any]] = None,
+                     limit: Optional[int] = None, offset: int = 0,
+                     limite_maximo: Optional[int] = None) -> Tuple[str, List[Any], Optional[int]]:
+    """Mix de produtos sem cliente (sem informação de positivação)."""
+    rows_sql, limite = paginacao(limit, offset, limite_maximo)
+    sql = f'''
+        SELECT
+          p.PRO_CODIGO,
+          p.PRO_DESCRICAO,
+          p.PRO_MARCA,
+          p.UNI_CODIGO
+        FROM PRODUTO p
+        WHERE p.PRO_INATIVO = 'N' AND p.ITEM_TABLET = 'S'
+        {filtro_produto}
+        ORDER BY p.PRO_DESCRICAO
+        {rows_sql}
+    '''
+    return sql, list(params_produto or []), limite
+
+
+def sql_contagem_mix_produtos(filtro_produto: str = "",
+                              params_produto: Optional[List[Any]] = None) -> Tuple[str, List[Any]]:
+    """Total de produtos do mix, sem paginação."""
+    sql = f'''
+        SELECT COUNT(*)
+        FROM PRODUTO p
+        WHERE p.PRO_INATIVO = 'N' AND p.ITEM_TABLET = 'S'
+        {filtro_produto}
+    '''
+    return sql, list(params_produto or [])
+
+
+def linha_para_produto(row) -> Dict[str, Any]:
+    # Linhas do mix geral têm só as quatro primeiras colunas
+    return {
+        "pro_codigo": row[0],
+        "pro_descricao": row[1],
+        "pro_marca": row[2],
+        "uni_codigo": row[3],
+        "ultima_compra": row[4] if len(row) > 4 else None,
+        "qtde_comprada": float(row[5] or 0) if len(row) > 4 else 0,
+        "valor_comprado": float(row[6] or 0) if len(row) > 4 else 0,
+        "positivado": bool(row[7]) if len(row) > 4 else False
+    }
@@ -0,0 +1,58 @@
+"""
+Verificação dos índices usados pelos relatórios.
+
+Os relatórios filtram VENDAS por período, cliente e vendedor e juntam
+ITVENDA por venda e produto. Sem índice nessas colunas o Firebird varre
+as tabelas inteiras. Um índice serve se a coluna for o primeiro segmento
+dele e o índice estiver ativo.
+"""
+from typing import Any, Dict, List, Tuple
+
+# (tabela, coluna) que precisam de índice
+INDICES_NECESSARIOS: List[Tuple[str, str]] = [
+    ("VENDAS", "ECF_DATA"),
+    ("VENDAS", "CLI_CODIGO"),
+    ("VENDAS", "VEN_CODIGO"),
+    ("ITVENDA", "ECF_NUMERO"),
+    ("ITVENDA", "PRO_CODIGO"),
+]
+
+# Primeiro segmento de cada índice ativo das tabelas verificadas
+SQL_INDICES = """
+    SELECT I.RDB$RELATION_NAME, S.RDB$FIELD_NAME, I.RDB$INDEX_NAME
+    FROM RDB$INDICES I
+    JOIN RDB$INDEX_SEGMENTS S ON S.RDB$INDEX_NAME = I.RDB$INDEX_NAME
+    WHERE S.RDB$FIELD_POSITION = 0
+    AND COALESCE(I.RDB$INDEX_INACTIVE, 0) = 0
+    AND I.RDB$RELATION_NAME IN ({tabelas})
+"""
+
+
+def verificar_indices(conn) -> Dict[str, Any]:
+    """
+    Confere na base da conexão se cada (tabela, coluna) de INDICES_NECESSARIOS
+    tem índice. Para os que faltam devolve o CREATE INDEX sugerido.
+    """
+    tabelas = sorted({tabela for tabela, _ in INDICES_NECESSARIOS})
+    cursor = conn.cursor()
+    cursor.execute(
+        SQL_INDICES.format(tabelas=", ".join("?" for _ in tabelas)),
+        tabelas
+    )
+
+    existentes: Dict[Tuple[str, str], List[str]] = {}
+    for tabela, coluna, indice in cursor.fetchall():
+        chave = (tabela.strip().upper(), coluna.strip().upper())
+        existentes.setdefault(chave, []).append(indice.strip())
+
+    verificados = []
+    faltando = []
+    for tabela, coluna in INDICES_NECESSARIOS:
+        indices = existentes.get((tabela, coluna), [])
+        item = {"tabela": tabela, "coluna": coluna, "indices": indices}
+        if not indices:
+            item["sugestao"] = f"CREATE INDEX IDX_{tabela}_{coluna} ON {tabela} ({coluna})"
+            faltando.append(item)
+        verificados.append(item)
+
+    return {"verificados": verificados, "faltando": faltando, "ok": not faltando}
@@ -0,0 +1,150 @@
+"""
+Contexto da requisição.
+
+Reúne o que os endpoints das empresas precisam a cada chamada: payload do
+token, usuário, empresa selecionada, código do vendedor e a conexão do pool.
+Tudo é resolvido uma única vez por requisição e guardado em request.state,
+então get_empresa_atual, get_empresa_connection e obter_filtro_vendedor
+deixam de decodificar o token e de consultar os bancos repetidamente.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import logging
+
+from fastapi import HTTPException, Request
+
+from auth import obter_payload_token
+from cache_ttl import CacheTTL, AUSENTE
+from config import get_settings
+from db_async import executar_na_conexao
+from empresa_manager import get_empresa_connection, resolver_empresa_atual
+
+log = logging.getLogger("contexto")
+
+settings = get_settings()
+
+# Cache (empresa_codigo, email) -> (VEN_CODIGO, VEN_NOME). E-mails sem vendedor
+# cadastrado ficam guardados como None por um tempo menor (cache negativo).
+_cache_vendedores = CacheTTL(ttl=settings.vendedor_cache_ttl, max_itens=settings.vendedor_cache_max_itens)
+
+
+@dataclass
+class ContextoRequisicao:
+    payload: Dict[str, Any]
+    usuario_id: Optional[int] = None
+    usuario_email: Optional[str] = None
+    usuario_nivel: Optional[str] = None
+    empresa: Optional[Dict[str, Any]] = None
+    codigo_vendedor: Optional[str] = None
+    nome_vendedor: Optional[str] = None
+    # Conexão emprestada do pool; get_empresa_connection a reaproveita
+    conexao: Any = field(default=None, repr=False)
+
+    @property
+    def eh_vendedor(self) -> bool:
+        return (self.usuario_nivel or "").lower() == "vendedor"
+
+    @property
+    def empresa_codigo(self) -> Optional[int]:
+        return self.empresa.get("cli_codigo") if self.empresa else None
+
+
+def buscar_vendedor_por_email(conn, empresa_codigo: int, usuario_email: str):
+    """
+    Retorna (codigo_vendedor, nome_vendedor) do e-mail na base da empresa, ou None.
+    Consulta a tabela VENDEDOR usando a conexão informada apenas quando o
+    resultado não estiver no cache.
+    """
+    chave = (empresa_codigo, (usuario_email or "").lower())
+    vendedor = _cache_vendedores.obter(chave)
+    if vendedor is not AUSENTE:
+        return vendedor
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT VEN_CODIGO, VEN_NOME FROM VENDEDOR 
+        WHERE VEN_EMAIL = ?
+    """, (usuario_email,))
+    row = cursor.fetchone()
+
+    if row:
+        vendedor = (str(row[0]).strip(), row[1].strip() if row[1] else "")
+        _cache_vendedores.guardar(chave, vendedor)
+    else:
+        vendedor = None
+        _cache_vendedores.guardar(chave, None, ttl=settings.vendedor_cache_ttl_negativo)
+    return vendedor
+
+
+async def resolver_contexto(request: Request) -> ContextoRequisicao:
+    """
+    Retorna o contexto da requisição, montando-o na primeira chamada.
+    Lança 401 se o token estiver ausente ou inválido.
+    """
+    contexto = getattr(request.state, "contexto", None)
+    if contexto is not None:
+        return contexto
+
+    payload = obter_payload_token(request)
+    contexto = ContextoRequisicao(
+        payload=payload,
+        usuario_id=payload.get("id"),
+        usuario_email=payload.get("sub"),
+        usuario_nivel=payload.get("nivel"),
+    )
+    request.state.contexto = contexto
+
+    # A empresa pode exigir leitura do banco controlador: sai do event loop
+    empresa = await resolver_empresa_atual(request)
+    if empresa and not empresa.get("empresa_nao_selecionada") and empresa.get("cli_codigo"):
+        contexto.empresa = empresa
+
+    # Só vendedores precisam do código; para os demais a conexão é aberta sob demanda
+    if contexto.eh_vendedor and contexto.empresa and contexto.usuario_email:
+        try:
+            conn = await get_empresa_connection(request)
+            vendedor = await executar_na_conexao(
+                conn, buscar_vendedor_por_email, conn, contexto.empresa_codigo, contexto.usuario_email
+            )
+            if vendedor:
+                contexto.codigo_vendedor, contexto.nome_vendedor = vendedor
+        except HTTPException:
+            # Sem conexão não há como filtrar: melhor falhar do que mostrar tudo ao vendedor
+            raise
+        except Exception as e:
+            log.error(f"Erro ao buscar código do vendedor {contexto.usuario_email}: {str(e)}")
+
+    return contexto
+
+
+def liberar_contexto(request: Request):
+    """Devolve ao pool a conexão que ainda estiver presa ao contexto."""
+    contexto = getattr(request.state, "contexto", None)
+    if contexto is not None and contexto.conexao is not None:
+        try:
+            contexto.conexao.close()
+        except Exception:
+            pass
+        contexto.conexao = None
+
+
+def desligar_conexao(request: Request, conn):
+    """
+    Tira a conexão do contexto sem fechá-la: quem chamou passa a ser o
+    responsável por devolvê-la ao pool (ex.: respostas em stream).
+    """
+    contexto = getattr(request.state, "contexto", None)
+    if contexto is not None and contexto.conexao is conn:
+        contexto.conexao = None
+
+
+async def contexto_requisicao(request: Request):
+    """
+    Dependência FastAPI: resolve o contexto antes do endpoint e devolve a
+    conexão ao pool ao final da requisição.
+    """
+    contexto = await resolver_contexto(request)
+    try:
+        yield contexto
+    finally:
+        liberar_contexto(request)
@@ -0,0 +1,375 @@
+"""
+Acesso assíncrono às bases Firebird.
+
+O fdb é bloqueante: um execute/fetchall chamado direto num endpoint async
+trava o event loop e, com ele, todas as requisições do worker. Aqui todo
+trabalho de banco roda no executor dedicado (db_executor_workers threads).
+
+Antes de ir para o executor cada chamada pega uma vaga no servidor
+Firebird da empresa (cli_ip_servidor). Cada servidor aceita
+db_limite_por_servidor chamadas simultâneas e cada base (chave do pool, o
+DSN) no máximo db_limite_por_base delas. Quem não consegue vaga entra na
+fila da sua base; ao liberar uma vaga o servidor atende as bases em
+rodízio, uma chamada de cada vez, então uma empresa com muitos relatórios
+abertos não passa na frente das outras do mesmo servidor. Com
+db_fila_maxima_por_servidor chamadas esperando no servidor (ou
+db_fila_maxima_por_base na mesma base) as próximas são recusadas com
+BancoOcupado (503 + Retry-After); o limite por base impede que uma empresa
+ocupe a fila inteira e faça as outras serem recusadas.
+
+    cursor = cursor_async(conn)
+    await cursor.execute(sql, params)
+    rows = await cursor.fetchall()
+
+    stats = await executar_na_conexao(conn, funcao_bloqueante, conn.cursor(), ...)
+
+estado_db() informa threads ocupadas, fila do executor e, por servidor e
+por base, chamadas ativas, aguardando, recusadas e tempo de espera.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+
+from config import get_settings
+
+log = logging.getLogger("db_async")
+settings = get_settings()
+
+_executor = ThreadPoolExecutor(max_workers=settings.db_executor_workers, thread_name_prefix="fdb")
+
+# Contadores do executor (alterados nas threads do executor)
+_lock = threading.Lock()
+_na_fila = 0
+_em_execucao = 0
+_executadas = 0
+
+
+class BancoOcupado(HTTPException):
+    """Fila do servidor Firebird cheia: a requisição deve ser repetida depois."""
+
+    def __init__(self, servidor: str):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor da empresa ocupado. Tente novamente em instantes.",
+            headers={"Retry-After": str(settings.db_retry_after)},
+        )
+        self.servidor = servidor
+
+
+# Marca da requisição em andamento: muitos endpoints transformam qualquer
+# exceção em 500 ou em lista vazia, então a recusa também fica registrada
+# aqui e middleware_banco_ocupado troca a resposta por 503.
+_recusa_requisicao: ContextVar[Optional[dict]] = ContextVar("recusa_requisicao", default=None)
+
+
+def desvincular_da_requisicao():
+    """
+    Para tarefas em segundo plano criadas durante uma requisição (que rodam
+    numa cópia do contexto dela): recusas da fila deixam de marcar a requisição.
+    """
+    _recusa_requisicao.set(None)
+
+
+def marcar_recusa(e: BancoOcupado):
+    """Registra a recusa na requisição em andamento (se houver)."""
+    recusa = _recusa_requisicao.get()
+    if recusa is not None:
+        recusa["servidor"] = e.servidor
+
+
+class _EstadoBase:
+    """Contadores de uma base (alterados só no event loop)."""
+
+    def __init__(self, limite: int):
+        self.limite = limite
+        self.ativos = 0
+        self.aguardando = 0
+        self.executadas = 0
+        self.recusadas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "limite": self.limite,
+            "ativos": self.ativos,
+            "aguardando": self.aguardando,
+            "executadas": self.executadas,
+            "recusadas": self.recusadas,
+            "espera_media_ms": round(self.espera_total / self.executadas * 1000, 1) if self.executadas else 0.0,
+            "espera_maxima_ms": round(self.espera_maxima * 1000, 1),
+        }
+
+
+class _FilaServidor:
+    """Vagas de um servidor Firebird, distribuídas em rodízio entre as bases."""
+
+    def __init__(self, servidor: str, limite: int, fila_maxima: int):
+        self.servidor = servidor
+        self.limite = limite
+        self.fila_maxima = fila_maxima
+        self.em_execucao = 0
+        self.aguardando = 0
+        self.recusadas = 0
+        self._filas: Dict[str, Deque[asyncio.Future]] = {}
+        self._rodizio: Deque[str] = deque()
+
+    def _ocupar(self, chave: str):
+        self.em_execucao += 1
+        _base(chave).ativos += 1
+
+    async def entrar(self, chave: str):
+        base = _base(chave)
+        if self.em_execucao < self.limite and base.ativos < base.limite and not self._filas.get(chave):
+            self._ocupar(chave)
+            return
+        if self.aguardando >= self.fila_maxima or base.aguardando >= settings.db_fila_maxima_por_base:
+            self.recusadas += 1
+            base.recusadas += 1
+            log.warning(f"Fila do servidor {self.servidor} cheia ({self.aguardando} aguardando): chamada recusada")
+            raise BancoOcupado(self.servidor)
+
+        futuro = asyncio.get_running_loop().create_future()
+        fila = self._filas.setdefault(chave, deque())
+        if not fila:
+            self._rodizio.append(chave)
+        fila.append(futuro)
+        self.aguardando += 1
+        base.aguardando += 1
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            if futuro.done() and not futuro.cancelled():
+                # A vaga chegou junto com o cancelamento: devolve para o próximo
+                self.sair(chave)
+            else:
+                self._remover(chave, futuro)
+            raise
+
+    def _remover(self, chave: str, futuro: asyncio.Future):
+        fila = self._filas.get(chave)
+        if fila and futuro in fila:
+            fila.remove(futuro)
+            self.aguardando -= 1
+            _base(chave).aguardando -= 1
+            if not fila:
+                del self._filas[chave]
+                self._rodizio.remove(chave)
+
+    def sair(self, chave: str):
+        self.em_execucao -= 1
+        _base(chave).ativos -= 1
+        self._despachar()
+
+    def _despachar(self):
+        # Uma vaga por base a cada volta; bases no próprio limite esperam a próxima volta
+        while self.em_execucao < self.limite and self._rodizio:
+            for _ in range(len(self._rodizio)):
+                chave = self._rodizio[0]
+                self._rodizio.rotate(-1)
+                if _base(chave).ativos < _base(chave).limite:
+                    break
+            else:
+                return
+            fila = self._filas[chave]
+            futuro = fila.popleft()
+            self.aguardando -= 1
+            _base(chave).aguardando -= 1
+            if not fila:
+                del self._filas[chave]
+                self._rodizio.remove(chave)
+            self._ocupar(chave)
+            futuro.set_result(None)
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "limite": self.limite,
+            "em_execucao": self.em_execucao,
+            "aguardando": self.aguardando,
+            "fila_maxima": self.fila_maxima,
+            "recusadas": self.recusadas,
+        }
+
+
+_bases: Dict[str, _EstadoBase] = {}
+_servidores: Dict[str, _FilaServidor] = {}
+_servidor_da_base: Dict[str, str] = {}
+
+
+def _base(chave: str) -> _EstadoBase:
+    base = _bases.get(chave)
+    if base is None:
+        base = _bases[chave] = _EstadoBase(settings.db_limite_por_base)
+    return base
+
+
+def _fila_servidor(chave: str) -> _FilaServidor:
+    # Base sem servidor registrado fica com uma fila só dela
+    servidor = _servidor_da_base.get(chave, chave)
+    fila = _servidores.get(servidor)
+    if fila is None:
+        fila = _servidores[servidor] = _FilaServidor(
+            servidor, settings.db_limite_por_servidor, settings.db_fila_maxima_por_servidor
+        )
+    return fila
+
+
+def registrar_servidor(chave: str, servidor: str):
+    """Associa a base (DSN) ao servidor Firebird (cli_ip_servidor) que a hospeda."""
+    if servidor and _servidor_da_base.get(chave) != servidor:
+        _servidor_da_base[chave] = servidor
+
+
+def _rodar(funcao: Callable, args, kwargs):
+    global _na_fila, _em_execucao, _executadas
+    with _lock:
+        _na_fila -= 1
+        _em_execucao += 1
+    try:
+        return funcao(*args, **kwargs)
+    finally:
+        with _lock:
+            _em_execucao -= 1
+            _executadas += 1
+
+
+async def _submeter(funcao: Callable, args, kwargs):
+    global _na_fila
+    with _lock:
+        _na_fila += 1
+    loop = asyncio.get_running_loop()
+    futuro = loop.run_in_executor(_executor, _rodar, funcao, args, kwargs)
+    try:
+        return await asyncio.shield(futuro)
+    except asyncio.CancelledError:
+        # A thread não é interrompida: quem foi cancelado só segue (liberando
+        # a vaga e devolvendo a conexão ao pool) depois que a chamada terminar
+        while not futuro.done():
+            try:
+                await asyncio.wait([futuro])
+            except asyncio.CancelledError:
+                pass
+        if not futuro.cancelled():
+            futuro.exception()  # marca como lida
+        raise
+
+
+async def executar(chave: Optional[str], funcao: Callable, *args, **kwargs):
+    """
+    Roda funcao(*args, **kwargs) no executor do banco depois de conseguir
+    vaga no servidor da base `chave`. Sem chave (banco controlador, tarefas
+    administrativas) só o tamanho do executor limita. Levanta BancoOcupado
+    se a fila do servidor estiver cheia.
+    """
+    if chave is None:
+        return await _submeter(funcao, args, kwargs)
+
+    fila = _fila_servidor(chave)
+    base = _base(chave)
+    inicio = time.monotonic()
+    try:
+        await fila.entrar(chave)
+    except BancoOcupado as e:
+        marcar_recusa(e)
+        raise
+    espera = time.monotonic() - inicio
+    base.espera_total += espera
+    base.espera_maxima = max(base.espera_maxima, espera)
+    try:
+        return await _submeter(funcao, args, kwargs)
+    finally:
+        base.executadas += 1
+        fila.sair(chave)
+
+
+async def executar_na_conexao(conn, funcao: Callable, *args, **kwargs):
+    """executar() usando a base da conexão (conn.chave, o DSN do pool)."""
+    return await executar(getattr(conn, "chave", None), funcao, *args, **kwargs)
+
+
+class CursorAsync:
+    """Cursor fdb com execute/fetch aguardáveis, rodando no executor do banco."""
+
+    def __init__(self, conn, chave: Optional[str] = None):
+        self.conn = conn
+        self.chave = chave if chave is not None else getattr(conn, "chave", None)
+        self._cursor = conn.cursor()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    async def execute(self, sql: str, params=None):
+        if params is None:
+            return await executar(self.chave, self._cursor.execute, sql)
+        return await executar(self.chave, self._cursor.execute, sql, params)
+
+    async def executemany(self, sql: str, seq_params):
+        """Prepara sql uma vez e executa para cada conjunto de parâmetros."""
+        return await executar(self.chave, self._cursor.executemany, sql, seq_params)
+
+    async def fetchall(self):
+        return await executar(self.chave, self._cursor.fetchall)
+
+    async def fetchone(self):
+        return await executar(self.chave, self._cursor.fetchone)
+
+    async def fetchmany(self, tamanho: int):
+        return await executar(self.chave, self._cursor.fetchmany, tamanho)
+
+    def close(self):
+        self._cursor.close()
+
+
+def cursor_async(conn, chave: Optional[str] = None) -> CursorAsync:
+    return CursorAsync(conn, chave)
+
+
+async def middleware_banco_ocupado(request: Request, call_next):
+    """
+    Responde 503 + Retry-After quando alguma chamada da requisição foi
+    recusada por fila cheia, mesmo que o endpoint tenha tratado a exceção.
+    """
+    recusa: dict = {}
+    token = _recusa_requisicao.set(recusa)
+    try:
+        resposta = await call_next(request)
+    except BancoOcupado as e:
+        recusa["servidor"] = e.servidor
+        resposta = None
+    finally:
+        _recusa_requisicao.reset(token)
+    if recusa:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Servidor da empresa ocupado. Tente novamente em instantes."},
+            headers={"Retry-After": str(settings.db_retry_after)},
+        )
+    return resposta
+
+
+def estado_db() -> Dict[str, Any]:
+    """Ocupação do executor e filas por servidor e por base."""
+    with _lock:
+        executor = {
+            "workers": settings.db_executor_workers,
+            "em_execucao": _em_execucao,
+            "na_fila": _na_fila,
+            "executadas": _executadas,
+        }
+    servidores = {}
+    for servidor, fila in list(_servidores.items()):
+        servidores[servidor] = fila.estado()
+        servidores[servidor]["bases"] = {
+            chave: base.estado() for chave, base in list(_bases.items())
+            if _servidor_da_base.get(chave, chave) == servidor
+        }
+    return {"executor": executor, "servidores": servidores}
@@ -0,0 +1,250 @@
+"""
+Diretório de clientes em memória por empresa.
+
+As buscas de clientes (/relatorios/clientes do ClienteAutocomplete,
+/relatorios/clientes-new e o q da positivação) faziam LIKE '%termo%' em
+CLI_NOME, CNPJ e CPF, varrendo CLIENTES a cada busca. Aqui a tabela é lida
+na primeira busca da empresa e indexada:
+
+- nome: palavras em maiúsculas e sem acento; cada palavra da busca precisa
+  ser início de alguma palavra do nome;
+- documento: só os dígitos do CNPJ/CPF; uma busca só com dígitos (e
+  pontuação) encontra os documentos que começam por eles.
+
+O resultado vem ordenado: primeiro nomes que começam pela busca e
+documentos encontrados, depois os demais, em ordem alfabética.
+
+CLIENTES não tem data de alteração. A cada clientes_diretorio_novos_segundos
+são lidos só os clientes com CLI_CODIGO maior que o último conhecido e os
+marcados por marcar_clientes_alterados() (cadastro e edição pelo app); a
+tabela inteira é relida a cada clientes_diretorio_recarga_segundos. A
+montagem dos índices na carga completa roda no executor, fora do event loop.
+"""
+import asyncio
+import heapq
+import logging
+import re
+import time
+from bisect import bisect_left, insort
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from catalogo_produtos import normalizar, palavras
+from config import get_settings
+from db_async import executar, executar_na_conexao
+
+log = logging.getLogger("diretorio_clientes")
+settings = get_settings()
+
+COLUNAS = ("CLI_CODIGO", "CLI_NOME", "APELIDO", "CONTATO", "CPF", "CNPJ", "ENDERECO", "NUMERO",
+           "BAIRRO", "CIDADE", "UF", "TEL_WHATSAPP", "CLI_EMAIL", "CLI_TIPO", "CLI_INATIVO")
+
+SQL_CLIENTES = f"SELECT {', '.join(COLUNAS)} FROM CLIENTES"
+
+# Códigos por IN na releitura dos clientes alterados (o Firebird aceita até 1500)
+LOTE_CODIGOS = 1000
+
+_NAO_DIGITOS = re.compile(r"\D+")
+_DOCUMENTO = re.compile(r"^[\d./\-\s]+$")
+
+
+def _digitos(valor: Any) -> str:
+    return _NAO_DIGITOS.sub("", str(valor or ""))
+
+
+def ler_clientes(cursor, desde: Any = None, codigos: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Todos os clientes, ou só os de CLI_CODIGO > desde e os de `codigos`
+    (em consultas de até LOTE_CODIGOS códigos).
+    """
+    if desde is None and not codigos:
+        consultas = [(SQL_CLIENTES, [])]
+    else:
+        consultas = [(f"{SQL_CLIENTES} WHERE CLI_CODIGO > ?", [desde])] if desde is not None else []
+        codigos = list(codigos or [])
+        for i in range(0, len(codigos), LOTE_CODIGOS):
+            lote = codigos[i:i + LOTE_CODIGOS]
+            consultas.append((f"{SQL_CLIENTES} WHERE CLI_CODIGO IN ({', '.join('?' * len(lote))})", lote))
+    clientes: Dict[Any, Dict[str, Any]] = {}
+    for sql, params in consultas:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            cliente = dict(zip((c.lower() for c in COLUNAS), row))
+            clientes[cliente["cli_codigo"]] = cliente
+    return list(clientes.values())
+
+
+def documentos(cliente: Dict[str, Any]) -> Set[str]:
+    return {_digitos(cliente.get("cnpj")), _digitos(cliente.get("cpf"))} - {""}
+
+
+class DiretorioClientes:
+    """Clientes de uma base com os índices de nome e de documento."""
+
+    def __init__(self, clientes: Iterable[Dict[str, Any]]):
+        self.clientes: Dict[Any, Dict[str, Any]] = {}
+        self._ordem: Dict[Any, Tuple[str, str]] = {}
+        self._nomes: Dict[Any, str] = {}
+        self._indice: Dict[str, Set[Any]] = {}
+        self._palavras: List[str] = []
+        self._documentos: List[Tuple[str, Any]] = []
+        self.ultimo_codigo: Any = None
+        self.pendentes: Set[Any] = set()
+        for cliente in clientes:
+            self._adicionar(cliente, ordenar=False)
+        self._palavras.sort()
+        self._documentos.sort()
+        self.carregado_em = time.monotonic()
+        self.atualizado_em = self.carregado_em
+        self.lock = asyncio.Lock()
+
+    def _adicionar(self, cliente: Dict[str, Any], ordenar: bool = True):
+        codigo = cliente["cli_codigo"]
+        if codigo in self.clientes:
+            self._remover(codigo)
+        self.clientes[codigo] = cliente
+        nome = normalizar(cliente.get("cli_nome")).strip()
+        self._nomes[codigo] = nome
+        self._ordem[codigo] = (nome, str(codigo))
+        for palavra in palavras(nome):
+            if palavra not in self._indice:
+                self._indice[palavra] = set()
+                if ordenar:
+                    insort(self._palavras, palavra)
+                else:
+                    self._palavras.append(palavra)
+            self._indice[palavra].add(codigo)
+        for documento in documentos(cliente):
+            if ordenar:
+                insort(self._documentos, (documento, codigo))
+            else:
+                self._documentos.append((documento, codigo))
+        if self.ultimo_codigo is None or codigo > self.ultimo_codigo:
+            self.ultimo_codigo = codigo
+
+    def _remover(self, codigo: Any):
+        # Palavras que ficarem sem clientes continuam na lista, com conjunto vazio
+        for palavra in palavras(self._nomes.get(codigo, "")):
+            self._indice.get(palavra, set()).discard(codigo)
+        for documento in documentos(self.clientes.get(codigo, {})):
+            i = bisect_left(self._documentos, (documento, codigo))
+            if i < len(self._documentos) and self._documentos[i] == (documento, codigo):
+                del self._documentos[i]
+        self.clientes.pop(codigo, None)
+
+    def atualizar(self, clientes: Iterable[Dict[str, Any]]):
+        for cliente in clientes:
+            self._adicionar(cliente)
+        self.atualizado_em = time.monotonic()
+
+    def _com_prefixo(self, prefixo: str) -> Set[Any]:
+        achados: Set[Any] = set()
+        i = bisect_left(self._palavras, prefixo)
+        while i < len(self._palavras) and self._palavras[i].startswith(prefixo):
+            achados |= self._indice[self._palavras[i]]
+            i += 1
+        return achados
+
+    def _documentos_com_prefixo(self, prefixo: str) -> Set[Any]:
+        achados: Set[Any] = set()
+        i = bisect_left(self._documentos, (prefixo,))
+        while i < len(self._documentos) and self._documentos[i][0].startswith(prefixo):
+            achados.add(self._documentos[i][1])
+            i += 1
+        return achados
+
+    def codigos(self, q: str) -> Tuple[Iterable[Any], Set[Any]]:
+        """(clientes encontrados, os que casam melhor: documento ou início do nome)."""
+        termo = (q or "").replace("%", " ").strip()
+        termos = palavras(termo)
+        if not termos:
+            return self.clientes.keys(), set()
+        encontrados: Optional[Set[Any]] = None
+        for palavra in termos:
+            achados = self._com_prefixo(palavra)
+            encontrados = achados if encontrados is None else encontrados & achados
+            if not encontrados:
+                break
+        inicio_nome = " ".join(termos)
+        melhores = {c for c in encontrados if self._nomes[c].startswith(inicio_nome)}
+        if _DOCUMENTO.match(termo):
+            por_documento = self._documentos_com_prefixo(_digitos(termo))
+            encontrados = encontrados | por_documento
+            melhores |= por_documento
+        return encontrados, melhores
+
+    def buscar(self, q: str, limite: int, offset: int = 0,
+               filtro: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """
+        Clientes da posição offset em diante, no máximo limite + 1 (a linha
+        extra indica que há mais, como em filtros_sql.paginacao).
+        """
+        encontrados, melhores = self.codigos(q)
+        if filtro is not None:
+            encontrados = [c for c in encontrados if filtro(self.clientes[c])]
+        ordem = self._ordem
+        escolhidos = heapq.nsmallest(
+            offset + limite + 1, encontrados, key=lambda c: (c not in melhores, ordem[c])
+        )
+        return [dict(self.clientes[c]) for c in escolhidos[offset:]]
+
+
+def ativo(cliente: Dict[str, Any]) -> bool:
+    """Mesmo critério dos SQLs: CLI_INATIVO = 'N' OR CLI_INATIVO IS NULL."""
+    return cliente.get("cli_inativo") is None or str(cliente["cli_inativo"]).strip() == "N"
+
+
+def tipo(cliente: Dict[str, Any]) -> str:
+    return str(cliente.get("cli_tipo") or "").strip()
+
+
+_diretorios: Dict[Any, DiretorioClientes] = {}
+_cargas: Dict[Any, asyncio.Lock] = {}
+
+
+def marcar_clientes_alterados(chave: Any, codigos: Iterable[Any]):
+    """Relê esses clientes na próxima busca da empresa (cadastro/edição pelo app)."""
+    diretorio = _diretorios.get(chave)
+    if diretorio is not None:
+        diretorio.pendentes.update(codigos)
+        diretorio.atualizado_em = 0.0
+
+
+async def obter_diretorio(chave: Any, conectar: Callable[[], Awaitable[Any]]) -> DiretorioClientes:
+    """
+    Diretório da empresa `chave`. conectar() só é chamado quando é preciso
+    ler o banco; o chamador fecha a conexão.
+    """
+    def vencido(diretorio):
+        return diretorio is None or time.monotonic() - diretorio.carregado_em >= settings.clientes_diretorio_recarga_segundos
+
+    diretorio = _diretorios.get(chave)
+    if vencido(diretorio):
+        async with _cargas.setdefault(chave, asyncio.Lock()):
+            diretorio = _diretorios.get(chave)
+            if vencido(diretorio):
+                conn = await conectar()
+                inicio = time.perf_counter()
+                clientes = await executar_na_conexao(conn, ler_clientes, conn.cursor())
+                lidos_em = time.perf_counter()
+                # Indexar milhares de nomes é CPU: roda no executor, sem vaga da base
+                diretorio = _diretorios[chave] = await executar(None, DiretorioClientes, clientes)
+                log.info(f"Diretório de clientes da empresa {chave}: {len(clientes)} clientes lidos em "
+                         f"{(lidos_em - inicio) * 1000:.1f} ms e indexados em "
+                         f"{(time.perf_counter() - lidos_em) * 1000:.1f} ms")
+        return diretorio
+
+    if time.monotonic() - diretorio.atualizado_em >= settings.clientes_diretorio_novos_segundos:
+        async with diretorio.lock:
+            if time.monotonic() - diretorio.atualizado_em >= settings.clientes_diretorio_novos_segundos:
+                pendentes = list(diretorio.pendentes)
+                diretorio.pendentes.clear()
+                try:
+                    conn = await conectar()
+                    novos = await executar_na_conexao(
+                        conn, ler_clientes, conn.cursor(), diretorio.ultimo_codigo, pendentes
+                    )
+                except Exception:
+                    diretorio.pendentes.update(pendentes)
+                    raise
+                diretorio.atualizar(novos)
+    return diretorio
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import Dict, Any
 import logging
 from empresa_manager import get_empresa_connection, get_empresa_atual
+from catalogo_schema import obter_catalogo
 
 # Configurar logger
 logging.basicConfig(level=logging.INFO)
@@ -43,19 +44,17 @@ async def obter_empresa_info_detalhada(request: Request) -> Dict[str, Any]:
             try:
                 # Criar cursor
                 cursor = conn.cursor()
+                catalogo = None
                 
                 # Primeiro verifica se a tabela EMPRESA existe
                 log.info("Verificando se a tabela EMPRESA existe")
                 try:
-                    # Tenta esta consulta para verificar se a tabela existe
-                    cursor.execute("""SELECT first 1 * FROM RDB$RELATIONS 
-                                      WHERE RDB$RELATION_NAME = 'EMPRESA'""")
-                    has_empresa_table = cursor.fetchone() is not None
+                    # Catálogo da base (em cache por empresa)
+                    catalogo = obter_catalogo(conn)
+                    has_empresa_table = catalogo.tem_tabela("EMPRESA")
                     
                     # Verifica se a tabela PARAMET existe
-                    cursor.execute("""SELECT first 1 * FROM RDB$RELATIONS 
-                                      WHERE RDB$RELATION_NAME = 'PARAMET'""")
-                    has_paramet_table = cursor.fetchone() is not None
+                    has_paramet_table = catalogo.tem_tabela("PARAMET")
                     
                     if has_empresa_table and has_paramet_table:
                         log.info("Tabelas EMPRESA e PARAMET encontradas, tentando consulta original")
@@ -100,9 +99,7 @@ async def obter_empresa_info_detalhada(request: Request) -> Dict[str, Any]:
                 # Tentativa alternativa - buscar apenas da tabela empresa
                 log.info("Tentando abordagem alternativa - apenas tabela empresa")
                 try:
-                    cursor.execute("""SELECT first 1 * FROM RDB$RELATIONS 
-                                      WHERE RDB$RELATION_NAME = 'EMPRESA'""")
-                    if cursor.fetchone():
+                    if catalogo and catalogo.tem_tabela("EMPRESA"):
                         cursor.execute("""
                             SELECT first 1
                                 emp_cod,
@@ -133,8 +130,7 @@ async def obter_empresa_info_detalhada(request: Request) -> Dict[str, Any]:
                 log.info("Tentando obter metadados das tabelas")
                 try:
                     # Listar todas as tabelas 
-                    cursor.execute("SELECT first 10 RDB$RELATION_NAME FROM RDB$RELATIONS WHERE RDB$SYSTEM_FLAG = 0")
-                    tables = [row[0].strip() for row in cursor.fetchall()]
+                    tables = catalogo.tabelas()[:10] if catalogo else []
                     log.info(f"Tabelas encontradas no banco: {tables}")
                     
                     # Se encontrou alguma tabela, tenta obter algumas informações
@@ -5,12 +5,14 @@ from jose import JWTError, jwt
 import os
 import fdb
 import logging
-from auth import SECRET_KEY, ALGORITHM
-from conexao_firebird import obter_conexao_cliente, obter_conexao_controladora
+from auth import SECRET_KEY, ALGORITHM, obter_payload_token
+from conexao_firebird import obter_conexao_cliente, obter_pool_cliente, obter_conexao_controladora, montar_dsn_cliente
+from pool_conexoes import PoolEsgotado
 import database
 import models
-from server_config import thread_pool
-import asyncio
+from db_async import executar, registrar_servidor, BancoOcupado
+from cache_ttl import CacheTTL, AUSENTE
+from config import get_settings
 
 # Configurar o logger
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +22,8 @@ log = logging.getLogger("empresa_manager")
 SECRET_KEY = os.getenv("SECRET_KEY", "chave_secreta_temporaria_mude_em_producao")
 ALGORITHM = "HS256"
 
+settings = get_settings()
+
 # Modelo para seleção de empresa
 class EmpresaSelect(BaseModel):
     cli_codigo: int
@@ -50,6 +54,9 @@ empresa_sessions = {}
 # Chave: ID do usuário, Valor: Lista de empresas liberadas
 empresas_liberadas = {}
 
+# Cache dos dados de conexão das empresas, por CLI_CODIGO
+_cache_empresas = CacheTTL(ttl=settings.empresa_cache_ttl, max_itens=settings.empresa_cache_max_itens)
+
 async def obter_empresas_usuario(email: str) -> List[Dict[str, Any]]:
     """
     Obtém as empresas liberadas para o usuário pelo email.
@@ -61,7 +68,7 @@ async def obter_empresas_usuario(email: str) -> List[Dict[str, Any]]:
         return []
     
     try:
-        conn = obter_conexao_controladora()
+        conn = await executar(None, obter_conexao_controladora)
         cursor = conn.cursor()
         
         # Primeiro verifica se o usuário existe e está ativo
@@ -170,7 +177,7 @@ async def obter_empresa_controladora(usuario_id: int):
     Obtém os dados da empresa controladora para um usuário.
     """
     try:
-        conn = obter_conexao_controladora()
+        conn = await executar(None, obter_conexao_controladora)
         cursor = conn.cursor()
         
         # Consulta a empresa controladora do usuário
@@ -213,7 +220,7 @@ async def obter_empresa_por_codigo(cli_codigo: int):
     Obtém os dados de uma empresa pelo código.
     """
     try:
-        conn = obter_conexao_controladora()
+        conn = await executar(None, obter_conexao_controladora)
         cursor = conn.cursor()
         
         # Consulta a empresa pelo código
@@ -256,7 +263,7 @@ async def verificar_acesso_empresa(usuario_id: int, cli_codigo: int):
     Verifica se o usuário tem acesso à empresa.
     """
     try:
-        conn = obter_conexao_controladora()
+        conn = await executar(None, obter_conexao_controladora)
         cursor = conn.cursor()
         
         # Verifica se o usuário tem acesso à empresa
@@ -282,11 +289,13 @@ async def selecionar_empresa(usuario_id: int, cli_codigo: int):
     """
     log.info(f"Selecionando empresa {cli_codigo} para usuário {usuario_id}")
     
+    # Reler os dados da empresa do banco: a seleção é o momento de renovar o cache
+    invalidar_empresa_cache(cli_codigo)
+    
     # Verificar se o usuário existe
     try:
         # Usar pool de threads para operações bloqueantes
-        loop = asyncio.get_event_loop()
-        conn_controladora = await loop.run_in_executor(thread_pool, obter_conexao_controladora)
+        conn_controladora = await executar(None, obter_conexao_controladora)
         cursor_controladora = conn_controladora.cursor()
         
         cursor_controladora.execute("""
@@ -315,8 +324,7 @@ async def selecionar_empresa(usuario_id: int, cli_codigo: int):
     # Obter dados da empresa
     try:
         # Usar pool de threads para operações bloqueantes
-        loop = asyncio.get_event_loop()
-        conn_controladora = await loop.run_in_executor(thread_pool, obter_conexao_controladora)
+        conn_controladora = await executar(None, obter_conexao_controladora)
         cursor_controladora = conn_controladora.cursor()
         
         cursor_controladora.execute("""
@@ -371,8 +379,7 @@ async def selecionar_empresa(usuario_id: int, cli_codigo: int):
     # Verificar se o usuário tem acesso à empresa
     try:
         # Usar pool de threads para operações bloqueantes
-        loop = asyncio.get_event_loop()
-        conn_controladora = await loop.run_in_executor(thread_pool, obter_conexao_controladora)
+        conn_controladora = await executar(None, obter_conexao_controladora)
         cursor_controladora = conn_controladora.cursor()
         
         cursor_controladora.execute("""
@@ -400,8 +407,7 @@ async def selecionar_empresa(usuario_id: int, cli_codigo: int):
     # Testar conexão com a empresa de forma assíncrona
     try:
         # Usar pool de threads para operações bloqueantes
-        loop = asyncio.get_event_loop()
-        connection = await loop.run_in_executor(thread_pool, obter_conexao_cliente, empresa)
+        connection = await executar(None, obter_conexao_cliente, empresa)
         
         # Testa a conexão fazendo uma consulta simples
         conexao_ok, info = await testar_conexao(connection)
@@ -416,8 +422,7 @@ async def selecionar_empresa(usuario_id: int, cli_codigo: int):
             # Obter dados do usuário para verificar se é vendedor
             try:
                 # Usar pool de threads para operações bloqueantes
-                loop = asyncio.get_event_loop()
-                conn_controladora = await loop.run_in_executor(thread_pool, obter_conexao_controladora)
+                conn_controladora = await executar(None, obter_conexao_controladora)
                 cursor_controladora = conn_controladora.cursor()
                 
                 cursor_controladora.execute("""
@@ -479,6 +484,50 @@ async def selecionar_empresa(usuario_id: int, cli_codigo: int):
     log.info(f"Empresa {cli_codigo} selecionada com sucesso para o usuário {usuario_id}")
     return empresa_dict
 
+def buscar_empresa_cache(empresa_codigo: int) -> Optional[Dict[str, Any]]:
+    """
+    Retorna o descritor de conexão da empresa (caminho_base, ip, porta, nome_base).
+    Os dados ficam em cache por empresa_cache_ttl segundos; o banco controlador
+    só é consultado quando o registro não está no cache ou expirou.
+    Empresas inexistentes também ficam em cache (retorna None).
+    """
+    empresa = _cache_empresas.obter(empresa_codigo)
+    if empresa is AUSENTE:
+        conn = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT 
+                    CLI_CODIGO, 
+                    CLI_NOME, 
+                    CLI_CAMINHO_BASE, 
+                    CLI_IP_SERVIDOR, 
+                    CLI_NOME_BASE, 
+                    CAST(CLI_PORTA AS VARCHAR(10)) as CLI_PORTA 
+                FROM CLIENTES 
+                WHERE CLI_CODIGO = ?
+            """, (empresa_codigo,))
+            empresa_db = cursor.fetchone()
+        finally:
+            conn.close()
+        empresa = None
+        if empresa_db:
+            empresa = {
+                "cli_codigo": empresa_db[0],
+                "cli_nome": empresa_db[1],
+                "cli_caminho_base": empresa_db[2] or '',
+                "cli_ip_servidor": empresa_db[3] or '127.0.0.1',
+                "cli_nome_base": empresa_db[4] or '',
+                "cli_porta": str(empresa_db[5]) if empresa_db[5] is not None else '3050',
+            }
+        _cache_empresas.guardar(empresa_codigo, empresa)
+    # Cópia: os chamadores ajustam campos (ex.: cli_porta) no dicionário recebido
+    return dict(empresa) if empresa else None
+
+def invalidar_empresa_cache(empresa_codigo: int):
+    """Remove a empresa do cache para que a próxima leitura vá ao banco controlador."""
+    _cache_empresas.invalidar(empresa_codigo)
+
 def get_empresa_atual(request: Request):
     """
     Obtém a empresa atual do usuário a partir do token JWT e/ou cabeçalhos.
@@ -486,31 +535,33 @@ def get_empresa_atual(request: Request):
     1. Cabeçalho x-empresa-codigo (para componentes como TopClientes)
     2. Sessão do usuário (para aplicação completa)
     """
+    # Já resolvida nesta requisição (contexto, filtro de vendedor, conexão)
+    empresa = getattr(request.state, "empresa_atual", None)
+    if empresa is not None:
+        return empresa
+    empresa = _resolver_empresa_atual(request)
+    request.state.empresa_atual = empresa
+    return empresa
+
+async def resolver_empresa_atual(request: Request):
+    """
+    Como get_empresa_atual, mas fora do event loop: com o cache de empresas
+    vencido a leitura espera por uma conexão do pool da controladora.
+    """
+    empresa = getattr(request.state, "empresa_atual", None)
+    if empresa is None:
+        empresa = await executar(None, _resolver_empresa_atual, request)
+        request.state.empresa_atual = empresa
+    return empresa
+
+def _resolver_empresa_atual(request: Request):
     log.info("=== INICIANDO GET_EMPRESA_ATUAL ===")
     log.info(f"Headers disponíveis: {list(request.headers.keys())}")
     try:
-        # Obtém o token da requisição
-        authorization = request.headers.get("Authorization")
-        if not authorization or not authorization.startswith("Bearer "):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Não autorizado",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        token = authorization.replace("Bearer ", "")
-        
-        # Decodifica o token
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            usuario_id = payload.get("id")
-            if not usuario_id:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token inválido",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except JWTError:
+        # Decodifica o token (uma vez por requisição)
+        payload = obter_payload_token(request)
+        usuario_id = payload.get("id")
+        if not usuario_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token inválido",
@@ -536,48 +587,14 @@ def get_empresa_atual(request: Request):
                 log.info(f"Buscando empresa no banco com código {empresa_codigo}...")
                 
                 try:
-                    # Usar a conexão direta ao invés de ORM
-                    conn = database.get_connection()
-                    cursor = conn.cursor()
-                    
-                    # Buscar diretamente a empresa especificada sem listar todas
-                    log.info(f"Buscando empresa com código {empresa_codigo}...")
-                    cursor.execute("""
-                        SELECT 
-                            CLI_CODIGO, 
-                            CLI_NOME, 
-                            CLI_CAMINHO_BASE, 
-                            CLI_IP_SERVIDOR, 
-                            CLI_NOME_BASE, 
-                            CAST(CLI_PORTA AS VARCHAR(10)) as CLI_PORTA 
-                        FROM CLIENTES 
-                        WHERE CLI_CODIGO = ?
-                    """, (empresa_codigo,))
-                    empresa_db = cursor.fetchone()
-                
-                    if empresa_db:
-                        log.info(f"Empresa encontrada: {empresa_db[1]}")
-                        # Converter para dicionário com os campos corretos
-                        empresa = {
-                            "cli_codigo": empresa_db[0],
-                            "cli_nome": empresa_db[1],
-                            "cli_caminho_base": empresa_db[2] or '',
-                            "cli_ip_servidor": empresa_db[3] or '127.0.0.1',
-                            "cli_nome_base": empresa_db[4] or '',
-                            "cli_porta": str(empresa_db[5]) if empresa_db[5] is not None else '3050',
-                        }
-                        conn.close()
+                    empresa = buscar_empresa_cache(empresa_codigo)
+                    if empresa:
+                        log.info(f"Empresa encontrada: {empresa['cli_nome']}")
                         return empresa
                     else:
                         log.warning(f"Empresa com código {empresa_codigo} não encontrada no banco de dados")
-                        conn.close()
                 except Exception as db_err:
                     log.error(f"Erro ao consultar empresa no banco: {str(db_err)}")
-                    if 'conn' in locals():
-                        try:
-                            conn.close()
-                        except:
-                            pass
             except Exception as e:
                 log.error(f"Erro ao processar cabeçalho x-empresa-codigo: {str(e)}")
                 # Continue para a próxima opção (sessão do usuário)
@@ -626,11 +643,30 @@ def get_empresa_atual(request: Request):
 async def get_empresa_connection(request: Request):
     """
     Obtém uma conexão com a empresa atual do usuário.
+    A conexão é emprestada do pool da base; conn.close() a devolve ao pool.
+    Se a requisição tem contexto (contexto.py), a conexão fica nele e é
+    reaproveitada pelas chamadas seguintes até ser fechada.
     """
-    empresa = get_empresa_atual(request)
+    contexto = getattr(request.state, "contexto", None)
+    if contexto is not None and contexto.conexao is not None and not contexto.conexao.closed:
+        return contexto.conexao
     
+    conn = await emprestar_conexao_empresa(await resolver_empresa_atual(request))
+    if contexto is not None:
+        contexto.conexao = conn
+    return conn
+
+async def _executar_sem_vaga(funcao, *args):
+    return await executar(None, funcao, *args)
+
+async def emprestar_conexao_empresa(empresa: Dict[str, Any]):
+    """
+    Empresta uma conexão nova do pool da base da empresa, sem ligá-la à
+    requisição. Usada quando uma mesma requisição precisa de várias
+    conexões ao mesmo tempo (ex.: /relatorios/dashboard). O chamador fecha.
+    """
     # Verificar se a empresa é válida antes de tentar conectar
-    if empresa.get('empresa_nao_selecionada', False) or not empresa or empresa.get('cli_codigo', 0) == 0:
+    if not empresa or empresa.get('empresa_nao_selecionada', False) or empresa.get('cli_codigo', 0) == 0:
         logging.warning("Nenhuma empresa válida selecionada")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -659,7 +695,22 @@ async def get_empresa_connection(request: Request):
             empresa['cli_porta'] = '3050'
             
         logging.info(f"Tentando conectar à empresa com IP: {empresa.get('cli_ip_servidor')}, Porta: {empresa.get('cli_porta')}, Base: {empresa.get('cli_nome_base')}")
-        return obter_conexao_cliente(empresa)
+        # A espera por conexão livre fica no event loop e só conectar/testar vai
+        # para o executor, sem vaga da base: as vagas (db_limite_por_base) são
+        # das chamadas de quem já tem conexão, senão quem espera o pool ocupa
+        # todas e quem tem as conexões não consegue terminar para devolvê-las
+        dsn = montar_dsn_cliente(empresa)
+        registrar_servidor(dsn, empresa.get('cli_ip_servidor'))
+        return await obter_pool_cliente(empresa).adquirir_async(_executar_sem_vaga)
+    except BancoOcupado:
+        raise
+    except PoolEsgotado as e:
+        logging.error(f"Pool de conexões esgotado para empresa {empresa.get('cli_codigo')}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor da empresa ocupado. Tente novamente em instantes.",
+            headers={"Retry-After": "5"},
+        )
     except Exception as e:
         logging.error(f"Erro ao conectar à empresa: {str(e)}")
         raise HTTPException(
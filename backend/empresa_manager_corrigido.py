@@ -6,7 +6,7 @@ import os
 import fdb
 import logging
 from auth import SECRET_KEY, ALGORITHM
-from conexao_firebird import obter_conexao_cliente, obter_conexao_controladora
+from conexao_firebird import obter_conexao_cliente, obter_conexao_cliente_pool, obter_conexao_controladora
 import database
 import models
 
@@ -457,7 +457,7 @@ async def get_empresa_connection(request: Request):
                     # Tentar conectar à empresa
                     try:
                         log.info(f"Tentando conectar à empresa com IP: {empresa.get('cli_ip_servidor')}, Porta: {empresa.get('cli_porta')}, Base: {empresa.get('cli_nome_base')}")
-                        return obter_conexao_cliente(empresa)
+                        return obter_conexao_cliente_pool(empresa)
                     except Exception as conn_err:
                         log.error(f"Erro ao conectar à empresa do cabeçalho: {str(conn_err)}")
                         # Continuar para a próxima opção
@@ -475,7 +475,7 @@ async def get_empresa_connection(request: Request):
                 empresa['cli_porta'] = '3050'
                 
             logging.info(f"Tentando conectar à empresa com IP: {empresa.get('cli_ip_servidor')}, Porta: {empresa.get('cli_porta')}, Base: {empresa.get('cli_nome_base')}")
-            return obter_conexao_cliente(empresa)
+            return obter_conexao_cliente_pool(empresa)
         except Exception as e:
             log.error(f"Erro ao obter empresa pela sessão: {str(e)}")
             # Continuar para a próxima opção
@@ -498,7 +498,7 @@ async def get_empresa_connection(request: Request):
                 }
                 
                 log.info(f"Tentando conectar à empresa fallback com IP: {empresa.get('cli_ip_servidor')}, Porta: {empresa.get('cli_porta')}, Base: {empresa.get('cli_nome_base')}")
-                return obter_conexao_cliente(empresa)
+                return obter_conexao_cliente_pool(empresa)
             else:
                 log.error("Nenhuma empresa encontrada no banco de dados")
         except Exception as fallback_err:
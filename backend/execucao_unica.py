@@ -0,0 +1,82 @@
+"""
+Execução única (single-flight) de cálculos assíncronos por chave.
+
+Quando várias requisições iguais chegam juntas (o gerente recarrega o
+dashboard, vários gerentes da mesma empresa abrem o app às 8h), a
+primeira executa o cálculo e as que chegam enquanto ele está em andamento
+esperam por ele e recebem o mesmo resultado (ou a mesma exceção), em vez
+de repetir a consulta no Firebird.
+
+Se a requisição que está calculando for cancelada (cliente desconectou),
+as que esperavam não herdam o cancelamento: a próxima assume o cálculo.
+O cálculo roda na própria tarefa de quem o iniciou, porque usa a conexão
+do contexto daquela requisição. Por isso uma recusa da fila do banco
+(BancoOcupado) só marca a requisição de quem calculava; as que esperavam
+marcam a sua ao receber a exceção.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from db_async import BancoOcupado, marcar_recusa
+
+log = logging.getLogger("execucao_unica")
+
+
+class ExecucaoUnica:
+    def __init__(self):
+        self._em_andamento: Dict[Hashable, asyncio.Future] = {}
+        # Cálculos executados e chamadas atendidas pelo cálculo de outra
+        # (execuções poupadas no banco)
+        self.execucoes = 0
+        self.compartilhadas = 0
+
+    def em_andamento(self, chave: Hashable) -> bool:
+        return chave in self._em_andamento
+
+    async def executar(self, chave: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Executa calcular() se não houver cálculo da mesma chave em andamento;
+        se houver, espera por ele. Retorna (valor, compartilhado).
+        """
+        while True:
+            futuro = self._em_andamento.get(chave)
+            if futuro is None:
+                break
+            try:
+                valor = await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                if futuro.cancelled():
+                    continue  # quem calculava foi cancelado: esta assume
+                raise
+            except BancoOcupado as e:
+                marcar_recusa(e)
+                raise
+            self.compartilhadas += 1
+            return valor, True
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._em_andamento[chave] = futuro
+        self.execucoes += 1
+        try:
+            valor = await calcular()
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except BaseException as e:
+            futuro.set_exception(e)
+            futuro.exception()  # marca como lida quando ninguém estava esperando
+            raise
+        else:
+            futuro.set_result(valor)
+            return valor, False
+        finally:
+            if self._em_andamento.get(chave) is futuro:
+                del self._em_andamento[chave]
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "em_andamento": len(self._em_andamento),
+            "execucoes": self.execucoes,
+            "compartilhadas": self.compartilhadas,
+        }
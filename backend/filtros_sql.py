@@ -0,0 +1,70 @@
+"""
+Montagem de predicados SQL compartilhados pelos relatórios.
+
+Filtros de período comparam a coluna "crua" com limites semiabertos
+(coluna >= início AND coluna < dia seguinte ao fim). Assim o Firebird pode
+usar o índice da coluna de data; CAST(coluna AS DATE) BETWEEN ... obrigava
+a varrer a tabela inteira. Os limites são datetime à meia-noite e servem
+tanto para colunas DATE quanto TIMESTAMP.
+
+A paginação usa ROWS com uma linha a mais para indicar se há próxima página.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple, Union
+
+Data = Union[str, date, datetime]
+
+
+def para_data(valor: Data) -> date:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    # Aceita 'YYYY-MM-DD' e também 'YYYY-MM-DDTHH:MM:SS'
+    return date.fromisoformat(str(valor).strip()[:10])
+
+
+def limites_periodo(data_inicial: Data, data_final: Data) -> Tuple[datetime, datetime]:
+    """Retorna (início do dia inicial, início do dia seguinte ao final)."""
+    inicio = para_data(data_inicial)
+    fim = para_data(data_final) + timedelta(days=1)
+    return datetime.combine(inicio, datetime.min.time()), datetime.combine(fim, datetime.min.time())
+
+
+def filtro_periodo(coluna: str, data_inicial: Data, data_final: Data) -> Tuple[str, Tuple[datetime, datetime]]:
+    """
+    Predicado de período para `coluna` e seus dois parâmetros, nessa ordem.
+
+        sql, params = filtro_periodo("VENDAS.ECF_DATA", "2024-01-01", "2024-01-31")
+        # "VENDAS.ECF_DATA >= ? AND VENDAS.ECF_DATA < ?", (2024-01-01 00:00, 2024-02-01 00:00)
+    """
+    return f"{coluna} >= ? AND {coluna} < ?", limites_periodo(data_inicial, data_final)
+
+
+def filtro_dia(coluna: str, dia: Data) -> Tuple[str, Tuple[datetime, datetime]]:
+    """Predicado para um único dia."""
+    return filtro_periodo(coluna, dia, dia)
+
+
+def paginacao(limit: Optional[int], offset: int = 0,
+              limite_maximo: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """
+    Cláusula ROWS para limit/offset e o limite efetivamente aplicado.
+    Busca uma linha a mais que o limite para que o chamador saiba se há
+    próxima página (ver aplicar_paginacao). limite_maximo é o teto imposto
+    pelo servidor; sem limit e sem teto devolve ("", None) e nada é cortado.
+    """
+    if limite_maximo is not None:
+        limit = limite_maximo if limit is None else min(limit, limite_maximo)
+    if limit is None:
+        return "", None
+    if limit < 1 or offset < 0:
+        raise ValueError("limit deve ser maior que zero e offset não pode ser negativo")
+    return f"ROWS {offset + 1} TO {offset + limit + 1}", limit
+
+
+def aplicar_paginacao(linhas: list, limit: Optional[int]) -> Tuple[list, bool]:
+    """Corta a linha extra buscada por paginacao() e informa se há mais registros."""
+    if limit is None or len(linhas) <= limit:
+        return linhas, False
+    return linhas[:limit], True
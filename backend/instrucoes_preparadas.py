@@ -0,0 +1,172 @@
+"""
+Instruções preparadas por conexão do pool.
+
+Sem reaproveitamento o Firebird prepara de novo o mesmo SQL a cada
+execute, mesmo com a conexão vindo do pool. Cada conexão do pool das
+empresas tem um CacheInstrucoes: um dicionário texto SQL -> instrução
+preparada com cursor.prep(), limitado a db_pool_instrucoes_max entradas
+com despejo da menos usada recentemente (LRU).
+
+Os endpoints não mudam: ConexaoPool.cursor() devolve um CursorPreparado,
+que em execute/executemany usa a instrução do cache (preparando na
+primeira vez) e repassa fetchone/fetchall/fetchmany/description para o
+cursor dela. Uma instrução preparada pertence ao cursor fdb que a criou e
+guarda o resultado da última execução, então enquanto um CursorPreparado
+a usa ela fica ocupada; outro cursor que precise do mesmo SQL ao mesmo
+tempo executa do jeito comum. As instruções são liberadas no próximo
+execute, no close() do cursor ou quando a conexão volta ao pool.
+
+Só vale para SQL com texto estável: valores variáveis (datas, vendedor,
+cliente) vão como parâmetros (?), senão cada valor vira uma entrada nova.
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+log = logging.getLogger("instrucoes_preparadas")
+
+
+class _Instrucao:
+    def __init__(self, cursor, preparada):
+        self.cursor = cursor
+        self.preparada = preparada
+        self.em_uso = False
+
+    def liberar(self):
+        # Fecha só o resultado; a instrução continua preparada
+        self.em_uso = False
+        try:
+            self.preparada.close()
+        except Exception:
+            pass
+
+    def fechar(self):
+        self.em_uso = False
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+
+
+class CacheInstrucoes:
+    """Instruções preparadas de uma conexão fdb, por texto SQL, com despejo LRU."""
+
+    def __init__(self, conn, capacidade: int):
+        self._conn = conn
+        self.capacidade = max(1, capacidade)
+        self._itens: "OrderedDict[str, _Instrucao]" = OrderedDict()
+        # Execuções que reaproveitaram uma instrução, preparos novos,
+        # despejos por LRU e execuções sem cache porque a instrução estava ocupada
+        self.metricas = {"acertos": 0, "preparos": 0, "despejos": 0, "ocupadas": 0}
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def emprestar(self, sql: str) -> Optional[_Instrucao]:
+        """Instrução de `sql` marcada como em uso, ou None se outra execução a ocupa."""
+        instrucao = self._itens.get(sql)
+        if instrucao is not None:
+            if instrucao.em_uso:
+                self.metricas["ocupadas"] += 1
+                return None
+            self._itens.move_to_end(sql)
+            self.metricas["acertos"] += 1
+        else:
+            cursor = self._conn.cursor()
+            instrucao = _Instrucao(cursor, cursor.prep(sql))
+            self._itens[sql] = instrucao
+            self.metricas["preparos"] += 1
+            self._despejar()
+        instrucao.em_uso = True
+        return instrucao
+
+    def _despejar(self):
+        while len(self._itens) > self.capacidade:
+            livre = next((sql for sql, item in self._itens.items() if not item.em_uso), None)
+            if livre is None:
+                return
+            self._itens.pop(livre).fechar()
+            self.metricas["despejos"] += 1
+
+    def descartar(self, sql: str):
+        """Tira `sql` do cache (ex.: a execução falhou); a próxima vez prepara de novo."""
+        instrucao = self._itens.pop(sql, None)
+        if instrucao is not None:
+            instrucao.fechar()
+
+    def liberar_todas(self):
+        """Chamado quando a conexão volta ao pool: nenhum cursor usa mais as instruções."""
+        for instrucao in self._itens.values():
+            if instrucao.em_uso:
+                instrucao.liberar()
+
+    def fechar(self):
+        for instrucao in self._itens.values():
+            instrucao.fechar()
+        self._itens.clear()
+
+    def estado(self) -> Dict[str, Any]:
+        return {"instrucoes": len(self._itens), **self.metricas}
+
+
+class CursorPreparado:
+    """
+    Cursor de uma conexão do pool com a mesma interface do cursor fdb;
+    execute/executemany passam pelo CacheInstrucoes da conexão.
+    """
+
+    def __init__(self, conn, cache: CacheInstrucoes):
+        self._conn = conn
+        self._cache = cache
+        self._proprio = None  # cursor fdb comum, para quando a instrução está ocupada
+        self._atual = None
+        self._instrucao: Optional[_Instrucao] = None
+
+    def _cursor_proprio(self):
+        if self._proprio is None:
+            self._proprio = self._conn.cursor()
+        return self._proprio
+
+    def _soltar(self):
+        if self._instrucao is not None:
+            self._instrucao.liberar()
+            self._instrucao = None
+
+    def _executar(self, metodo: str, sql, params):
+        self._soltar()
+        instrucao = self._cache.emprestar(sql) if isinstance(sql, str) else None
+        if instrucao is None:
+            self._atual = self._cursor_proprio()
+            if params is None:
+                getattr(self._atual, metodo)(sql)
+            else:
+                getattr(self._atual, metodo)(sql, params)
+            return self
+        self._instrucao = instrucao
+        self._atual = instrucao.cursor
+        try:
+            getattr(instrucao.cursor, metodo)(instrucao.preparada, () if params is None else params)
+        except Exception:
+            self._instrucao = None
+            self._cache.descartar(sql)
+            raise
+        return self
+
+    def execute(self, sql, params=None):
+        return self._executar("execute", sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._executar("executemany", sql, seq_params)
+
+    def close(self):
+        self._soltar()
+        if self._proprio is not None:
+            self._proprio.close()
+        self._atual = None
+
+    def __iter__(self):
+        return iter(self._atual if self._atual is not None else self._cursor_proprio())
+
+    def __getattr__(self, nome):
+        # fetchone, fetchall, fetchmany, description, rowcount... do cursor da última execução
+        return getattr(self._atual if self._atual is not None else self._cursor_proprio(), nome)
@@ -23,6 +23,9 @@ import models
 import database
 from starlette.middleware.base import BaseHTTPMiddleware
 from server_config import create_app, run_server
+from pool_conexoes import alertas_pools, estado_pools
+from cache_relatorios import estatisticas as estatisticas_cache_relatorios
+from db_async import cursor_async, executar_na_conexao, estado_db, middleware_banco_ocupado
 
 # Importar o router de orçamentos
 from orcamento_router import router as orcamento_router
@@ -173,9 +176,14 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
         response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, x-empresa-codigo, Accept, Origin, X-Requested-With"
         response.headers["Access-Control-Allow-Credentials"] = "true" if cors_origin != "*" else "false"
         response.headers["Access-Control-Max-Age"] = "86400"  # Cache de 24h para reduzir preflight requests
+        # Paginação das buscas de clientes e Retry-After do 503
+        response.headers["Access-Control-Expose-Headers"] = "X-Has-More, X-Limit, X-Offset, Retry-After, Age"
         
         return response
 
+# 503 + Retry-After quando a fila do servidor Firebird da empresa estiver cheia
+app.middleware("http")(middleware_banco_ocupado)
+
 # Adicionar o middleware personalizado (deve ser o primeiro da pilha)
 app.add_middleware(CustomCORSMiddleware)
 
@@ -238,6 +246,31 @@ async def health_check():
         "message": "API está funcionando corretamente"
     }
 
+@app.get("/health/pools")
+async def health_pools():
+    """Estado e métricas (checkouts, esperas, reconexões, timeouts) dos pools de conexão e alertas"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "alertas": alertas_pools(),
+        "pools": estado_pools()
+    }
+
+@app.get("/health/cache")
+async def health_cache():
+    """Itens, memória, hits/misses e cálculos compartilhados do cache de resultados dos relatórios"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "relatorios": estatisticas_cache_relatorios()
+    }
+
+@app.get("/health/db")
+async def health_db():
+    """Ocupação do executor do banco e filas por servidor Firebird e por base"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        **estado_db()
+    }
+
 @app.get("/teste-cors")
 async def teste_cors():
     """Rota simples para testar se o CORS está funcionando"""
@@ -425,8 +458,8 @@ async def get_clientes(request: Request):
         # Obtém a conexão com a empresa selecionada
         conn = await get_empresa_connection(request)
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
+            cursor = cursor_async(conn)
+            await cursor.execute("""
                 SELECT 
                     ID, 
                     NOME, 
@@ -443,7 +476,7 @@ async def get_clientes(request: Request):
             
             # Converte os resultados em uma lista de dicionários
             results = []
-            for row in cursor.fetchall():
+            for row in await cursor.fetchall():
                 result = {}
                 for i, value in enumerate(row):
                     result[columns[i]] = value
@@ -462,8 +495,8 @@ async def get_produtos(request: Request):
         # Obtém a conexão com a empresa selecionada
         conn = await get_empresa_connection(request)
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
+            cursor = cursor_async(conn)
+            await cursor.execute("""
                 SELECT 
                     ID, 
                     CODIGO, 
@@ -480,7 +513,7 @@ async def get_produtos(request: Request):
             
             # Converte os resultados em uma lista de dicionários
             results = []
-            for row in cursor.fetchall():
+            for row in await cursor.fetchall():
                 result = {}
                 for i, value in enumerate(row):
                     result[columns[i]] = value
@@ -499,11 +532,11 @@ async def create_pedido(pedido: models.PedidoCreate, request: Request):
         # Obtém a conexão com a empresa selecionada
         conn = await get_empresa_connection(request)
         try:
-            cursor = conn.cursor()
+            cursor = cursor_async(conn)
             
             # Inicia uma transação
             # Insere o cabeçalho do pedido
-            cursor.execute("""
+            await cursor.execute("""
             INSERT INTO PEDIDOS (
                 CLIENTE_ID, 
                 DATA, 
@@ -521,14 +554,14 @@ async def create_pedido(pedido: models.PedidoCreate, request: Request):
             ))
             
             # Obtém o ID do pedido inserido
-            pedido_id = cursor.fetchone()[0]
+            pedido_id = (await cursor.fetchone())[0]
             
             # Calcula o valor total
             valor_total = 0
             
             # Insere os itens do pedido
             for item in pedido.itens:
-                cursor.execute("""
+                await cursor.execute("""
                 INSERT INTO ITENS_PEDIDO (
                     PEDIDO_ID, 
                     PRODUTO_ID, 
@@ -548,16 +581,16 @@ async def create_pedido(pedido: models.PedidoCreate, request: Request):
                 valor_total += item['quantidade'] * item['preco_unitario']
             
             # Atualiza o valor total do pedido
-            cursor.execute("""
+            await cursor.execute("""
             UPDATE PEDIDOS SET VALOR_TOTAL = ? WHERE ID = ?
             """, (valor_total, pedido_id))
             
-            conn.commit()
+            await executar_na_conexao(conn, conn.commit)
             
             # Retorna o pedido criado
             return {"id": pedido_id, "mensagem": "Pedido criado com sucesso"}
         except Exception as e:
-            conn.rollback()
+            await executar_na_conexao(conn, conn.rollback)
             raise e
         finally:
             conn.close()
@@ -571,10 +604,10 @@ async def get_pedidos(request: Request):
         # Obtém a conexão com a empresa selecionada
         conn = await get_empresa_connection(request)
         try:
-            cursor = conn.cursor()
+            cursor = cursor_async(conn)
             
             # Consulta para obter os pedidos
-            cursor.execute("""
+            await cursor.execute("""
                 SELECT 
                     P.ID, 
                     P.CLIENTE_ID, 
@@ -593,7 +626,7 @@ async def get_pedidos(request: Request):
             
             # Converte os resultados em uma lista de dicionários
             pedidos = []
-            for row in cursor.fetchall():
+            for row in await cursor.fetchall():
                 pedido = {}
                 for i, value in enumerate(row):
                     pedido[columns[i]] = value
@@ -601,7 +634,7 @@ async def get_pedidos(request: Request):
             
             # Para cada pedido, obtém os itens
             for pedido in pedidos:
-                cursor.execute("""
+                await cursor.execute("""
                     SELECT 
                         IP.PRODUTO_ID, 
                         P.DESCRICAO AS PRODUTO_DESCRICAO,
@@ -618,7 +651,7 @@ async def get_pedidos(request: Request):
                 
                 # Converte os resultados em uma lista de dicionários
                 itens = []
-                for row in cursor.fetchall():
+                for row in await cursor.fetchall():
                     item = {}
                     for i, value in enumerate(row):
                         item[item_columns[i]] = value
@@ -1088,7 +1121,7 @@ async def listar_vendedores(request: Request):
     try:
         # Usar a conexão direta do Firebird ao invés de SQLAlchemy
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         query = """
             SELECT 
@@ -1098,8 +1131,8 @@ async def listar_vendedores(request: Request):
             FROM VENDEDOR
             ORDER BY VEN_NOME
         """
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        await cursor.execute(query)
+        rows = await cursor.fetchall()
         
         vendedores = []
         for row in rows:
@@ -0,0 +1,89 @@
+"""
+Numeração dos orçamentos (ORCAMENT.ECF_NUMERO).
+
+O número vinha de SELECT COD_PROXVALOR + UPDATE CODIGO dentro da transação
+do orçamento: todo orçamento da empresa esperava pela mesma linha de
+CODIGO até o commit do anterior, e sob carga os conflitos de atualização
+viravam rollback.
+
+Agora cada base reserva blocos de orcamento_numeracao_bloco números em
+uma transação curta e separada (UPDATE ... COD_PROXVALOR + bloco RETURNING,
+um único comando, com nova tentativa em caso de conflito) e entrega os
+números do bloco a partir da memória. COD_PROXVALOR continua guardando o
+último número usado, então outros processos e o sistema da loja, que leem
+a mesma linha, pulam o bloco reservado e os números nunca se repetem. Os
+números de um bloco não usados até o processo parar ficam sem orçamento.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from config import get_settings
+from db_async import executar_na_conexao
+
+log = logging.getLogger("numeracao_orcamentos")
+settings = get_settings()
+
+SQL_RESERVAR = """
+    UPDATE CODIGO SET COD_PROXVALOR = COALESCE(COD_PROXVALOR, 0) + ?
+    WHERE COD_TABELA = 'ORCAMENT' AND COD_NOMECAMPO = 'ECF_NUMERO'
+    RETURNING COD_PROXVALOR
+"""
+
+TENTATIVAS = 5
+
+
+def _conflito(erro: Exception) -> bool:
+    texto = str(erro).lower()
+    return "deadlock" in texto or "update conflict" in texto or "lock conflict" in texto
+
+
+def reservar_bloco(conn, tamanho: int) -> int:
+    """
+    Soma `tamanho` a COD_PROXVALOR e confirma na hora. Retorna o novo valor,
+    que é o último número do bloco reservado. Deve rodar fora da transação
+    do orçamento (a conexão não pode ter transação pendente).
+    """
+    for tentativa in range(1, TENTATIVAS + 1):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SQL_RESERVAR, (tamanho,))
+            row = cursor.fetchone()
+            if not row:
+                raise Exception("Não foi possível obter o próximo número de orçamento na tabela CODIGO.")
+            conn.commit()
+            return int(row[0])
+        except Exception as e:
+            conn.rollback()
+            if tentativa == TENTATIVAS or not _conflito(e):
+                raise
+            log.warning(f"Conflito ao reservar números de orçamento (tentativa {tentativa}): {e}")
+            time.sleep(0.05 * tentativa)
+        finally:
+            cursor.close()
+
+
+class _Bloco:
+    def __init__(self):
+        self.proximo = 1
+        self.fim = 0
+        self.lock = asyncio.Lock()
+
+
+_blocos: Dict[str, _Bloco] = {}
+
+
+async def proximo_numero_orcamento(conn) -> int:
+    """Próximo ECF_NUMERO livre da base da conexão; reserva outro bloco quando acaba."""
+    chave = getattr(conn, "chave", None) or id(conn)
+    bloco = _blocos.setdefault(chave, _Bloco())
+    async with bloco.lock:
+        if bloco.proximo > bloco.fim:
+            tamanho = max(1, settings.orcamento_numeracao_bloco)
+            ultimo = await executar_na_conexao(conn, reservar_bloco, conn, tamanho)
+            bloco.proximo, bloco.fim = ultimo - tamanho + 1, ultimo
+            log.info(f"Números de orçamento {bloco.proximo} a {bloco.fim} reservados")
+        numero = bloco.proximo
+        bloco.proximo += 1
+        return numero
@@ -7,6 +7,13 @@ Se precisar fazer alterações:
 2. Faça backup do banco
 3. Documente as alterações
 4. Atualize esta mensagem
+
+Alterações:
+- O número do orçamento vem de numeracao_orcamentos.py (blocos reservados
+  na tabela CODIGO em transação própria), não mais do SELECT/UPDATE de
+  CODIGO dentro da transação do orçamento.
+- Os itens (ITORC) são gravados com executemany em lotes
+  (inserir_itens_orcamento) e a gravação inteira é cronometrada no log.
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Request, Body
@@ -15,12 +22,20 @@ from typing import Any, List, Optional, Dict
 from pydantic import BaseModel
 import database  # Seu módulo de conexão
 import logging
+import time
 from datetime import datetime
 # Usar a versão corrigida da função get_empresa_connection
 from empresa_manager import get_empresa_connection
+from contexto import contexto_requisicao
+from catalogo_schema import obter_catalogo
+from db_async import cursor_async, executar_na_conexao
+from numeracao_orcamentos import proximo_numero_orcamento
+from config import get_settings
 
 logging.warning('DEBUG: orcamento_router.py carregado!')
 
+settings = get_settings()
+
 # Modelos para criação de orçamento
 class ProdutoOrcamento(BaseModel):
     codigo: str
@@ -44,11 +59,25 @@ class OrcamentoCreate(BaseModel):
     desconto: Optional[float] = 0
     produtos: List[ProdutoOrcamento]
 
-router = APIRouter()
+# O contexto (token, empresa, vendedor, conexão) é resolvido uma vez por requisição
+router = APIRouter(dependencies=[Depends(contexto_requisicao)])
 
 def vazio_para_none(valor):
     return valor if valor not in ("", None) else None
 
+SQL_INSERIR_ITEM = """
+    INSERT INTO ITORC (
+        ECF_NUMERO, IEC_SEQUENCIA, PRO_CODIGO, PRO_DESCRICAO, 
+        PRO_QUANTIDADE, PRO_VENDA, IOR_TOTAL
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+async def inserir_itens_orcamento(cursor, itens: List[tuple]):
+    """Grava os itens (tuplas na ordem de SQL_INSERIR_ITEM) em lotes de orcamento_itens_lote."""
+    lote = max(1, settings.orcamento_itens_lote)
+    for inicio in range(0, len(itens), lote):
+        await cursor.executemany(SQL_INSERIR_ITEM, itens[inicio:inicio + lote])
+
 @router.post("/orcamentos")
 @router.post("/orcamento")
 async def criar_orcamento(request: Request, orcamento: OrcamentoCreate):
@@ -61,27 +90,19 @@ async def criar_orcamento(request: Request, orcamento: OrcamentoCreate):
         if not conn:
             logging.error("Conexão com o banco não foi estabelecida - retornou None")
             return {"success": False, "message": "Erro de conexão com o banco de dados"}
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
+        inicio_gravacao = time.perf_counter()
         try:
-            conn.begin()
+            # Número do orçamento: vem de um bloco reservado em transação própria
+            # (numeracao_orcamentos.py), antes de abrir a transação do orçamento
+            orcamento_numero = await proximo_numero_orcamento(conn)
+            await executar_na_conexao(conn, conn.begin)
             # Calcular o valor do desconto baseado no valor informado
             subtotal = sum(item.valor_total for item in orcamento.produtos)
             valor_desconto = orcamento.desconto if orcamento.desconto else 0
             
             valor_total = subtotal - valor_desconto
 
-            # Buscar próximo número de orçamento na tabela CODIGO
-            cursor.execute("SELECT COD_PROXVALOR FROM CODIGO WHERE COD_TABELA = 'ORCAMENT' AND COD_NOMECAMPO = 'ECF_NUMERO'")
-            resultado = cursor.fetchone()
-            if not resultado:
-                raise Exception("Não foi possível obter o próximo número de orçamento na tabela CODIGO.")
-            valor_codigo = resultado[0]
-            orcamento_numero = valor_codigo + 1
-            # Atualizar a tabela CODIGO com o novo valor
-            cursor.execute(
-                "UPDATE CODIGO SET COD_PROXVALOR = ? WHERE COD_TABELA = 'ORCAMENT' AND COD_NOMECAMPO = 'ECF_NUMERO'",
-                (orcamento_numero,)
-            )
             # Formatar datas
             data_orcamento = None
             if orcamento.data_orcamento and orcamento.data_orcamento.strip():
@@ -90,7 +111,7 @@ async def criar_orcamento(request: Request, orcamento: OrcamentoCreate):
             if orcamento.data_validade and orcamento.data_validade.strip():
                 data_validade = datetime.strptime(orcamento.data_validade, "%Y-%m-%d").date()
             # Inserir cabeçalho do orçamento
-            cursor.execute("""
+            await cursor.execute("""
                 INSERT INTO ORCAMENT (
                     ECF_NUMERO, CLI_CODIGO, NOME, ECF_DATA, ECF_TOTAL, 
                     ECF_FPG_COD, ECF_TAB_COD, VEN_CODIGO, ECF_DESCONTO, 
@@ -112,14 +133,10 @@ async def criar_orcamento(request: Request, orcamento: OrcamentoCreate):
                 1,  # EMP_CODIGO fixo como 1
                 vazio_para_none(orcamento.especie)
             ))
-            # Inserir itens do orçamento
-            for i, produto in enumerate(orcamento.produtos, 1):
-                cursor.execute("""
-                    INSERT INTO ITORC (
-                        ECF_NUMERO, IEC_SEQUENCIA, PRO_CODIGO, PRO_DESCRICAO, 
-                        PRO_QUANTIDADE, PRO_VENDA, IOR_TOTAL
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
+            # Inserir itens do orçamento: o INSERT é preparado uma vez e os
+            # itens vão em lotes (executemany), em vez de um execute por item
+            itens = [
+                (
                     orcamento_numero,
                     i,
                     vazio_para_none(produto.codigo),
@@ -127,16 +144,21 @@ async def criar_orcamento(request: Request, orcamento: OrcamentoCreate):
                     vazio_para_none(produto.quantidade),
                     vazio_para_none(produto.valor_unitario),
                     vazio_para_none(produto.valor_total)
-                ))
-            conn.commit()
-            logging.info(f"Orçamento {orcamento_numero} criado com sucesso (novo fluxo Firebird)")
+                )
+                for i, produto in enumerate(orcamento.produtos, 1)
+            ]
+            await inserir_itens_orcamento(cursor, itens)
+            await executar_na_conexao(conn, conn.commit)
+            duracao = (time.perf_counter() - inicio_gravacao) * 1000
+            logging.info(f"Orçamento {orcamento_numero} criado com sucesso (novo fluxo Firebird) em {duracao:.1f} ms "
+                         f"({len(itens)} itens, {duracao / max(len(itens), 1):.2f} ms por item)")
             return {
                 "success": True,
                 "message": "Orçamento criado com sucesso",
                 "numero_orcamento": orcamento_numero
             }
         except Exception as e:
-            conn.rollback()
+            await executar_na_conexao(conn, conn.rollback)
             logging.error(f"Erro ao criar orçamento: {str(e)}")
             return {"success": False, "message": f"Erro ao criar orçamento: {str(e)}"}
         finally:
@@ -163,12 +185,11 @@ async def listar_orcamentos(request: Request, data_inicial: str = None, data_fin
         except Exception as conn_error:
             logging.error(f"Erro ao conectar ao banco: {str(conn_error)}")
             return {"total": 0, "orcamentos": []}
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         try:
             # Verificar se a tabela ORCAMENT existe
             try:
-                cursor.execute("SELECT FIRST 1 * FROM RDB$RELATIONS WHERE RDB$RELATION_NAME = 'ORCAMENT'")
-                if not cursor.fetchone():
+                if not (await executar_na_conexao(conn, obter_catalogo, conn)).tem_tabela("ORCAMENT"):
                     logging.warning("Tabela ORCAMENT não existe no banco de dados")
                     return {"total": 0, "orcamentos": []}
             except Exception as table_error:
@@ -183,8 +204,8 @@ async def listar_orcamentos(request: Request, data_inicial: str = None, data_fin
                 count_params.append(data_final)
             if where_clauses:
                 count_query += " WHERE " + " AND ".join(where_clauses)
-            cursor.execute(count_query, count_params) if count_params else cursor.execute(count_query)
-            total_registros = cursor.fetchone()[0]
+            await cursor.execute(count_query, count_params) if count_params else await cursor.execute(count_query)
+            total_registros = (await cursor.fetchone())[0]
             # Consulta principal (paginada)
             query = """
                 SELECT 
@@ -232,12 +253,12 @@ async def listar_orcamentos(request: Request, data_inicial: str = None, data_fin
             logging.info(f"Query final: {query}")
             logging.info(f"Parâmetros: {params}")
             if params:
-                cursor.execute(query, params)
+                await cursor.execute(query, params)
             else:
-                cursor.execute(query)
+                await cursor.execute(query)
             columns = [desc[0].lower() for desc in cursor.description]
             results = []
-            for row in cursor.fetchall():
+            for row in await cursor.fetchall():
                 result = {columns[i]: row[i] for i in range(len(columns))}
                 results.append(result)
             logging.info(f"Encontrados {len(results)} orçamentos (paginados)")
@@ -270,10 +291,10 @@ async def obter_orcamento(numero: int, request: Request):
             logging.error("Conexão com o banco não foi estabelecida")
             return {"id": numero, "numero": numero, "cliente_nome": "Cliente Exemplo", "data": "2025-05-26", "valor_total": 1500.0, "status": "Pendente"}
             
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         try:
-            cursor.execute("SELECT * FROM ORCAMENT WHERE ECF_NUMERO = ?", (numero,))
-            row = cursor.fetchone()
+            await cursor.execute("SELECT * FROM ORCAMENT WHERE ECF_NUMERO = ?", (numero,))
+            row = await cursor.fetchone()
             if row:
                 columns = [desc[0].lower() for desc in cursor.description]
                 result = {columns[i]: row[i] for i in range(len(columns))}
@@ -306,12 +327,11 @@ async def obter_itens_orcamento(numero: int, request: Request):
                 {"codigo": "002", "descricao": "Produto Exemplo 2", "quantidade": 1, "valor": 750.0}
             ]
             
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         try:
             # Verificar se a tabela ITORC existe
             try:
-                cursor.execute("SELECT FIRST 1 * FROM RDB$RELATIONS WHERE RDB$RELATION_NAME = 'ITORC'")
-                if not cursor.fetchone():
+                if not (await executar_na_conexao(conn, obter_catalogo, conn)).tem_tabela("ITORC"):
                     logging.warning("Tabela ITORC não existe no banco de dados")
                     # Retornar itens de exemplo
                     return [
@@ -336,10 +356,10 @@ async def obter_itens_orcamento(numero: int, request: Request):
                 WHERE ECF_NUMERO = ? 
                 ORDER BY IEC_SEQUENCIA
             """
-            cursor.execute(query_itens, (numero,))
+            await cursor.execute(query_itens, (numero,))
             columns = [desc[0].lower() for desc in cursor.description]
             results = []
-            for row in cursor.fetchall():
+            for row in await cursor.fetchall():
                 result = {columns[i]: row[i] for i in range(len(columns))}
                 results.append(result)
                 
@@ -384,7 +404,7 @@ async def gerar_pdf_orcamento(numero: int, request: Request):
             logging.error("Conexão com o banco não foi estabelecida")
             raise HTTPException(status_code=500, detail="Erro de conexão com o banco")
             
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         try:
             # 1. Buscar dados da empresa usando a query fornecida
             empresa_query = """
@@ -398,8 +418,8 @@ async def gerar_pdf_orcamento(numero: int, request: Request):
                   Join municipio on municipio.muni_codigo = Empresa.cod_mun
                   And empresa.emp_cod = (Select Paramet.par_emp_padrao from Paramet)
             """
-            cursor.execute(empresa_query)
-            empresa_row = cursor.fetchone()
+            await cursor.execute(empresa_query)
+            empresa_row = await cursor.fetchone()
             
             if not empresa_row:
                 logging.warning("Dados da empresa não encontrados")
@@ -453,8 +473,8 @@ async def gerar_pdf_orcamento(numero: int, request: Request):
                 LEFT JOIN CLIENTES C ON O.CLI_CODIGO = C.CLI_CODIGO
                 WHERE O.ECF_NUMERO = ?
             """
-            cursor.execute(orcamento_query, (numero,))
-            orcamento_row = cursor.fetchone()
+            await cursor.execute(orcamento_query, (numero,))
+            orcamento_row = await cursor.fetchone()
             
             if not orcamento_row:
                 raise HTTPException(status_code=404, detail=f"Orçamento {numero} não encontrado")
@@ -493,8 +513,8 @@ async def gerar_pdf_orcamento(numero: int, request: Request):
                 WHERE I.ECF_NUMERO = ?
                 ORDER BY I.IEC_SEQUENCIA
             """
-            cursor.execute(itens_query, (numero,))
-            itens_rows = cursor.fetchall()
+            await cursor.execute(itens_query, (numero,))
+            itens_rows = await cursor.fetchall()
             
             itens_data = []
             for item_row in itens_rows:
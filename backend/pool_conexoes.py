@@ -0,0 +1,392 @@
+"""
+Pool de conexões Firebird.
+
+Mantém um pool limitado por base de dados (chave = DSN). As conexões
+emprestadas são devolvidas ao pool quando o código chama conn.close(),
+então os endpoints existentes continuam funcionando sem alteração.
+
+adquirir_async() espera por uma conexão livre sem ocupar thread: quem
+espera fica no event loop e só abrir/testar a conexão vai para o executor.
+adquirir() continua bloqueante, para código síncrono.
+
+Com instrucoes_max > 0 cada conexão guarda as suas instruções preparadas
+(instrucoes_preparadas.py) enquanto estiver aberta, entre um empréstimo e
+outro; conn.cursor() passa a usá-las.
+"""
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+from instrucoes_preparadas import CacheInstrucoes, CursorPreparado
+
+log = logging.getLogger("pool_conexoes")
+
+SQL_PING = "SELECT 1 FROM RDB$DATABASE"
+
+# Janela (segundos) em que timeouts de espera viram alerta em /health/pools
+JANELA_ALERTAS = 300
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera do pool."""
+
+
+class ConexaoPool:
+    """
+    Conexão emprestada de um PoolConexoes.
+    Repassa tudo para a conexão fdb, mas close() devolve a conexão ao pool.
+    """
+
+    def __init__(self, pool: "PoolConexoes", conn, instrucoes: Optional[CacheInstrucoes] = None):
+        self._pool = pool
+        self._conn = conn
+        self._instrucoes = instrucoes
+        self._devolvida = False
+
+    @property
+    def chave(self) -> str:
+        return self._pool.chave
+
+    @property
+    def closed(self) -> bool:
+        return self._devolvida or self._conn.closed
+
+    def close(self):
+        if self._devolvida:
+            return
+        self._devolvida = True
+        self._pool.devolver(self._conn)
+
+    def cursor(self):
+        if self._instrucoes is None:
+            return self._conn.cursor()
+        return CursorPreparado(self._conn, self._instrucoes)
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Rede de segurança para caminhos de erro que esquecem o close()
+        if self.__dict__.get("_conn") is not None and not self.__dict__.get("_devolvida", True):
+            log.warning(f"Conexão do pool {self._pool.chave} não foi fechada; devolvendo ao pool")
+            try:
+                self.close()
+            except Exception:
+                pass
+
+
+class PoolConexoes:
+    """
+    Pool limitado de conexões para uma única base.
+    - max_size: máximo de conexões abertas (livres + em uso)
+    - min_size: conexões ociosas que nunca são despejadas
+    - timeout: segundos de espera por uma conexão livre
+    - idle_timeout: conexões ociosas há mais tempo que isso são fechadas
+    - ping_intervalo: conexões ociosas há mais tempo que isso são testadas antes do uso
+    - instrucoes_max: instruções preparadas guardadas por conexão (0 desliga)
+    """
+
+    def __init__(self, chave: str, fabrica: Callable[[], Any], min_size: int = 1, max_size: int = 5,
+                 timeout: float = 30, idle_timeout: float = 300, ping_intervalo: float = 30,
+                 instrucoes_max: int = 0):
+        self.chave = chave
+        self._fabrica = fabrica
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_intervalo = ping_intervalo
+        self.instrucoes_max = instrucoes_max
+        # Cache de instruções preparadas de cada conexão aberta (por id da conexão fdb)
+        self._instrucoes: Dict[int, CacheInstrucoes] = {}
+        self._livres = deque()  # (conexão, instante em que ficou livre)
+        self._em_uso = 0
+        self._cond = threading.Condition()
+        # Esperas de adquirir_async: (event loop, futuro) acordados em devolver()
+        self._esperas_async = deque()
+        # Contadores: empréstimos, empréstimos que precisaram esperar,
+        # reconexões de conexões mortas e esperas que estouraram o timeout
+        self.metricas = {"checkouts": 0, "esperas": 0, "reconexoes": 0, "timeouts": 0}
+        self._aguardando = 0  # esperas síncronas em andamento
+        self._timeouts_em = deque(maxlen=1000)  # instantes (monotonic) dos timeouts recentes
+
+    @property
+    def total(self) -> int:
+        return len(self._livres) + self._em_uso
+
+    def _reservar(self) -> Optional[Tuple[Any, Optional[float], List[Any]]]:
+        """
+        Com o lock adquirido: reserva uma vaga (conexão livre ou nova) e
+        devolve (conexão ou None, livre desde, ociosas despejadas), ou None
+        se o pool estiver cheio.
+        """
+        despejadas = self._despejar_ociosas()
+        if self._livres:
+            conn, livre_desde = self._livres.pop()
+        elif self.total < self.max_size:
+            conn, livre_desde = None, None
+        else:
+            # Despejar ociosas libera vaga, então aqui despejadas está sempre vazia
+            return None
+        self._em_uso += 1
+        self.metricas["checkouts"] += 1
+        return conn, livre_desde, despejadas
+
+    def _esgotado(self, espera: float) -> PoolEsgotado:
+        self.metricas["timeouts"] += 1
+        self._timeouts_em.append(time.monotonic())
+        return PoolEsgotado(
+            f"Pool {self.chave} esgotado: {self._em_uso} conexões em uso, "
+            f"nenhuma liberada em {espera}s"
+        )
+
+    def _preparar(self, conn, livre_desde: Optional[float], despejadas: List[Any]) -> ConexaoPool:
+        """Parte bloqueante do empréstimo: fecha ociosas, conecta ou testa a conexão reservada."""
+        for antiga in despejadas:
+            self._fechar(antiga)
+
+        try:
+            if conn is None:
+                conn = self._fabrica()
+            elif time.monotonic() - livre_desde >= self.ping_intervalo and not self._conexao_viva(conn):
+                log.warning(f"Conexão ociosa do pool {self.chave} não responde; reconectando")
+                self._fechar(conn)
+                with self._cond:
+                    self.metricas["reconexoes"] += 1
+                conn = self._fabrica()
+        except Exception:
+            with self._cond:
+                self._em_uso -= 1
+                self._acordar()
+            raise
+
+        instrucoes = None
+        if self.instrucoes_max > 0:
+            with self._cond:
+                instrucoes = self._instrucoes.get(id(conn))
+                if instrucoes is None:
+                    instrucoes = self._instrucoes[id(conn)] = CacheInstrucoes(conn, self.instrucoes_max)
+        return ConexaoPool(self, conn, instrucoes)
+
+    def adquirir(self, timeout: float = None) -> ConexaoPool:
+        """Empresta uma conexão, esperando até `timeout` segundos se o pool estiver cheio."""
+        espera = self.timeout if timeout is None else timeout
+        limite = time.monotonic() + espera
+        esperou = False
+
+        with self._cond:
+            while True:
+                reserva = self._reservar()
+                if reserva is not None:
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise self._esgotado(espera)
+                if not esperou:
+                    esperou = True
+                    self.metricas["esperas"] += 1
+                self._aguardando += 1
+                try:
+                    self._cond.wait(restante)
+                finally:
+                    self._aguardando -= 1
+
+        return self._preparar(*reserva)
+
+    async def adquirir_async(self, executar_bloqueante: Callable[..., Awaitable[Any]],
+                             timeout: float = None) -> ConexaoPool:
+        """
+        Como adquirir(), mas a espera por uma conexão livre acontece no event
+        loop. executar_bloqueante(funcao, *args) roda a parte bloqueante
+        (conectar/testar) no executor do banco.
+        """
+        espera = self.timeout if timeout is None else timeout
+        limite = time.monotonic() + espera
+        loop = asyncio.get_running_loop()
+        esperou = False
+
+        while True:
+            with self._cond:
+                reserva = self._reservar()
+                if reserva is None:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        # Uma devolução pode ter acordado esta espera: passa a vez adiante
+                        self._acordar()
+                        raise self._esgotado(espera)
+                    if not esperou:
+                        esperou = True
+                        self.metricas["esperas"] += 1
+                    espera_async = (loop, loop.create_future())
+                    self._esperas_async.append(espera_async)
+            if reserva is not None:
+                break
+            try:
+                await asyncio.wait_for(espera_async[1], restante)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self._cond:
+                    if espera_async in self._esperas_async:
+                        self._esperas_async.remove(espera_async)
+                    else:
+                        self._acordar()
+                raise
+            with self._cond:
+                if espera_async in self._esperas_async:
+                    self._esperas_async.remove(espera_async)
+
+        return await executar_bloqueante(self._preparar, *reserva)
+
+    def _acordar(self):
+        """Com o lock adquirido: acorda uma espera síncrona e uma assíncrona."""
+        self._cond.notify()
+        while self._esperas_async:
+            loop, futuro = self._esperas_async.popleft()
+            if futuro.done():
+                continue
+            try:
+                loop.call_soon_threadsafe(_acordar_futuro, futuro)
+            except RuntimeError:
+                continue  # event loop já encerrado
+            return
+
+    def devolver(self, conn):
+        """Recebe de volta uma conexão emprestada. Transações abertas são desfeitas."""
+        reutilizar = not conn.closed
+        instrucoes = self._instrucoes.get(id(conn))
+        if instrucoes is not None:
+            instrucoes.liberar_todas()
+        if reutilizar:
+            try:
+                # Encerra a transação para que o próximo uso enxergue dados atuais
+                conn.rollback()
+            except Exception as e:
+                log.warning(f"Descartando conexão do pool {self.chave}: {str(e)}")
+                reutilizar = False
+        with self._cond:
+            self._em_uso -= 1
+            if reutilizar:
+                self._livres.append((conn, time.monotonic()))
+            self._acordar()
+        if not reutilizar:
+            self._fechar(conn)
+
+    def fechar_todas(self):
+        with self._cond:
+            livres = [conn for conn, _ in self._livres]
+            self._livres.clear()
+        for conn in livres:
+            self._fechar(conn)
+
+    def estado(self) -> Dict[str, Any]:
+        with self._cond:
+            estado = {
+                "livres": len(self._livres),
+                "em_uso": self._em_uso,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "timeout": self.timeout,
+                "aguardando": self._aguardando + len(self._esperas_async),
+                **self.metricas,
+                "timeouts_recentes": self._timeouts_recentes(),
+            }
+            if self.instrucoes_max > 0:
+                instrucoes = {"instrucoes": 0, "acertos": 0, "preparos": 0, "despejos": 0, "ocupadas": 0}
+                for cache in self._instrucoes.values():
+                    for nome, valor in cache.estado().items():
+                        instrucoes[nome] += valor
+                estado["instrucoes_preparadas"] = instrucoes
+            return estado
+
+    def _timeouts_recentes(self, janela: float = JANELA_ALERTAS) -> int:
+        desde = time.monotonic() - janela
+        return sum(1 for instante in self._timeouts_em if instante >= desde)
+
+    def alertas(self) -> List[str]:
+        """Problemas de dimensionamento: esperas que estouraram o timeout e pool cheio com fila."""
+        estado = self.estado()
+        alertas = []
+        if estado["timeouts_recentes"]:
+            alertas.append(f"{estado['timeouts_recentes']} espera(s) por conexão estouraram o timeout de "
+                           f"{self.timeout}s nos últimos {JANELA_ALERTAS // 60} min")
+        if estado["aguardando"] and estado["em_uso"] >= self.max_size:
+            alertas.append(f"pool cheio ({estado['em_uso']}/{self.max_size} em uso) com "
+                           f"{estado['aguardando']} requisição(ões) esperando")
+        return alertas
+
+    def _despejar_ociosas(self):
+        # Chamado com o lock adquirido; as conexões mais antigas ficam no início da fila
+        despejadas = []
+        agora = time.monotonic()
+        while (self._livres and self.total > self.min_size
+               and agora - self._livres[0][1] >= self.idle_timeout):
+            despejadas.append(self._livres.popleft()[0])
+        return despejadas
+
+    def _conexao_viva(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(SQL_PING)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _fechar(self, conn):
+        with self._cond:
+            instrucoes = self._instrucoes.pop(id(conn), None)
+        if instrucoes is not None:
+            instrucoes.fechar()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _acordar_futuro(futuro: asyncio.Future):
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+# Pools ativos por chave (DSN)
+_pools: Dict[str, PoolConexoes] = {}
+_pools_lock = threading.Lock()
+
+
+def obter_pool(chave: str, fabrica: Callable[[], Any], **opcoes) -> PoolConexoes:
+    """Retorna o pool da chave informada, criando-o na primeira chamada."""
+    pool = _pools.get(chave)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(chave)
+            if pool is None:
+                log.info(f"Criando pool de conexões para {chave}")
+                pool = PoolConexoes(chave, fabrica, **opcoes)
+                _pools[chave] = pool
+    return pool
+
+
+def estado_pools() -> Dict[str, Dict[str, Any]]:
+    return {chave: pool.estado() for chave, pool in list(_pools.items())}
+
+
+def alertas_pools() -> Dict[str, List[str]]:
+    """Alertas por pool (só os pools com algum)."""
+    alertas = {chave: pool.alertas() for chave, pool in list(_pools.items())}
+    return {chave: lista for chave, lista in alertas.items() if lista}
+
+
+def fechar_pools():
+    for pool in list(_pools.values()):
+        pool.fechar_todas()
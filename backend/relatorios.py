@@ -1,28 +1,95 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Body, Response
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date, timedelta
-from empresa_manager import get_empresa_connection, get_empresa_atual
+from empresa_manager import get_empresa_connection, get_empresa_atual, emprestar_conexao_empresa
+from contexto import contexto_requisicao, resolver_contexto, liberar_contexto
+from agregados_dashboard import calcular_dashboard_stats, calcular_contagens
+from agregado_diario import obter_agregado
+from catalogo_schema import obter_catalogo
+from db_async import cursor_async, executar_na_conexao
+from filtros_sql import filtro_periodo, paginacao, aplicar_paginacao
+from consultas_positivacao import (
+    sql_positivacao_clientes, linha_para_cliente,
+    sql_positivacao_produtos, sql_contagem_positivacao_produtos,
+    sql_mix_produtos, sql_contagem_mix_produtos, linha_para_produto
+)
+from cache_relatorios import chave_relatorio, obter_ou_calcular, obter_com_revalidacao
+from resposta_ndjson import modo_stream, resposta_ndjson
+from catalogo_produtos import obter_catalogo_produtos
+from diretorio_clientes import COLUNAS as COLUNAS_CLIENTES, obter_diretorio, marcar_clientes_alterados, ativo, tipo
+from config import get_settings
+import asyncio
 import logging
+import time
 
 # Configurar o logger
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("relatorios")
 
 # Configurar o router
-router = APIRouter(prefix="/relatorios", tags=["Relatórios"])
+# O contexto (token, empresa, vendedor, conexão) é resolvido uma vez por requisição
+router = APIRouter(prefix="/relatorios", tags=["Relatórios"], dependencies=[Depends(contexto_requisicao)])
+
+settings = get_settings()
+
+def _paginacao_clientes(limit: Optional[int], offset: int, limite_padrao: int):
+    """ROWS e limite efetivo das buscas de clientes (400 para valores inválidos)."""
+    try:
+        return paginacao(limite_padrao if limit is None else limit, offset, settings.clientes_limite_maximo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _informar_paginacao(response: Response, limite: int, offset: int, has_more: bool):
+    # As buscas de clientes continuam devolvendo lista; a paginação vai nos cabeçalhos
+    response.headers["X-Limit"] = str(limite)
+    response.headers["X-Offset"] = str(offset)
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+
+def _informar_idade(response: Response, idade: float):
+    # Idade (s) do resultado do cache; acima do TTL ele já está sendo atualizado
+    response.headers["Age"] = str(int(idade))
+
+async def _diretorio_clientes(request: Request):
+    """Diretório de clientes da empresa da requisição (diretorio_clientes.py)."""
+    return await obter_diretorio(_empresa_codigo(request), lambda: get_empresa_connection(request))
+
+def _empresa_codigo(request: Request):
+    return (get_empresa_atual(request) or {}).get("cli_codigo")
 
 @router.get("/clientes")
-async def listar_clientes(request: Request, q: str = "", empresa: str = ""):
+async def listar_clientes(request: Request, response: Response, q: str = "", empresa: str = "",
+                          limit: Optional[int] = None, offset: int = 0):
     """
     Busca clientes reais no banco Firebird da empresa selecionada.
     Pesquisa por nome, CNPJ ou CPF, usando o parâmetro q.
-    Retorna até 20 resultados.
+    Retorna até limit resultados (padrão clientes_limite_padrao, no máximo
+    clientes_limite_maximo) a partir de offset; X-Has-More indica se há mais.
+    Com o diretório em memória ligado a busca não vai ao banco.
     """
+    rows_sql, limite = _paginacao_clientes(limit, offset, settings.clientes_limite_padrao)
     try:
+        if settings.clientes_diretorio_habilitado:
+            diretorio = await _diretorio_clientes(request)
+            encontrados, has_more = aplicar_paginacao(diretorio.buscar(q, limite, offset), limite)
+            _informar_paginacao(response, limite, offset, has_more)
+            return [
+                {
+                    "cli_codigo": c["cli_codigo"],
+                    "cli_nome": c["cli_nome"],
+                    "cnpj": c["cnpj"] or "",
+                    "cpf": c["cpf"] or "",
+                    "cli_tipo": c["cli_tipo"] or "",
+                    "cidade": c["cidade"] or "",
+                    "uf": c["uf"] or "",
+                    "bairro": c["bairro"] or ""
+                }
+                for c in encontrados
+            ]
+
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         termo_nome = f"%{q.strip()}%" if q else "%"
         termo_cnpj = f"%{q.strip()}%"[:14] if q else "%"
         termo_cpf = f"%{q.strip()}%"[:11] if q else "%"
@@ -30,11 +97,13 @@ async def listar_clientes(request: Request, q: str = "", empresa: str = ""):
             "SELECT CLI_CODIGO, CLI_NOME, CNPJ, CPF, CLI_TIPO, CIDADE, UF, BAIRRO "
             "FROM CLIENTES "
             "WHERE CLI_NOME LIKE ? OR CNPJ LIKE ? OR CPF LIKE ? "
-            "ORDER BY CLI_NOME"
+            f"ORDER BY CLI_NOME {rows_sql}"
         )
-        cursor.execute(sql, (termo_nome, termo_cnpj, termo_cpf))
+        await cursor.execute(sql, (termo_nome, termo_cnpj, termo_cpf))
+        linhas, has_more = aplicar_paginacao(await cursor.fetchall(), limite)
+        _informar_paginacao(response, limite, offset, has_more)
         clientes = []
-        for row in cursor.fetchall():
+        for row in linhas:
             clientes.append({
                 "cli_codigo": row[0],
                 "cli_nome": row[1],
@@ -47,6 +116,8 @@ async def listar_clientes(request: Request, q: str = "", empresa: str = ""):
             })  # Não inclui 'cli_cgc' no dicionário de resposta
         conn.close()
         return clientes
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Erro ao buscar clientes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar clientes: {str(e)}")
@@ -124,6 +195,11 @@ class FormaPagamento(BaseModel):
 async def obter_filtro_vendedor(request: Request, alias_tabela: str = "VENDAS") -> tuple[str, bool, str]:
     """
     Função helper global para obter filtro de vendedor automaticamente.
+    O código do vendedor vem do contexto da requisição (contexto.py).
+    O filtro usa parâmetro (?), para o texto do SQL ser o mesmo para todos
+    os vendedores (instruções preparadas, ver instrucoes_preparadas.py):
+    quem monta a consulta acrescenta params_vendedor(filtro_sql, codigo_vendedor)
+    aos parâmetros, na posição em que o filtro entra no SQL.
     
     Args:
         request: Requisição HTTP
@@ -133,108 +209,61 @@ async def obter_filtro_vendedor(request: Request, alias_tabela: str = "VENDAS")
         tuple: (filtro_sql, filtro_aplicado, codigo_vendedor)
     """
     try:
-        # Obter o token da requisição
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            return "", False, ""
-        
-        token = auth_header.replace("Bearer ", "")
-        
-        # Decodificar o token
-        from auth import SECRET_KEY, ALGORITHM
-        from jose import jwt
-        
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            usuario_email = payload.get("sub")
-            usuario_nivel = payload.get("nivel")
-            
-            # Se não for vendedor, não aplica filtro
-            if not usuario_nivel or usuario_nivel.lower() != 'vendedor':
-                log.info(f"🔄 SEM FILTRO - Usuário não é vendedor (nível: {usuario_nivel})")
-                return "", False, ""
-                
-        except Exception as jwt_err:
-            log.error(f"Erro ao decodificar token JWT: {str(jwt_err)}")
-            return "", False, ""
-        
-        # Obter código da empresa
-        empresa_codigo = request.headers.get("x-empresa-codigo")
-        if not empresa_codigo:
-            log.warning("🔄 SEM FILTRO - Código da empresa não fornecido")
-            return "", False, ""
-        
-        # Buscar código do vendedor na base da empresa
-        try:
-            from conexao_firebird import obter_conexao_controladora, obter_conexao_cliente
-            
-            # Buscar dados da empresa
-            conn_ctrl = obter_conexao_controladora()
-            cursor_ctrl = conn_ctrl.cursor()
-            
-            cursor_ctrl.execute("""
-                SELECT CLI_CODIGO, CLI_NOME, CLI_CAMINHO_BASE, CLI_IP_SERVIDOR, 
-                       CLI_NOME_BASE, CLI_PORTA 
-                FROM CLIENTES 
-                WHERE CLI_CODIGO = ?
-            """, (int(empresa_codigo),))
-            
-            empresa_dados = cursor_ctrl.fetchone()
-            conn_ctrl.close()
-            
-            if not empresa_dados:
-                log.warning(f"🔄 SEM FILTRO - Empresa {empresa_codigo} não encontrada")
-                return "", False, ""
-            
-            # Montar dados da empresa
-            empresa_dict = {
-                'cli_codigo': empresa_dados[0],
-                'cli_nome': empresa_dados[1],
-                'cli_caminho_base': empresa_dados[2],
-                'cli_ip_servidor': empresa_dados[3],
-                'cli_nome_base': empresa_dados[4],
-                'cli_porta': empresa_dados[5] or '3050'
-            }
-            
-            # Conectar na base da empresa e buscar vendedor
-            conn = obter_conexao_cliente(empresa_dict)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT VEN_CODIGO, VEN_NOME FROM VENDEDOR 
-                WHERE VEN_EMAIL = ?
-            """, (usuario_email,))
-            
-            vendedor = cursor.fetchone()
-            conn.close()
-            
-            if vendedor:
-                codigo_vendedor = str(vendedor[0]).strip()
-                nome_vendedor = vendedor[1].strip() if vendedor[1] else ""
-                filtro_sql = f" AND {alias_tabela}.VEN_CODIGO = '{codigo_vendedor}'"
-                
-                log.info(f"🎯 FILTRO APLICADO: Vendedor {codigo_vendedor} ({nome_vendedor}) - Alias: {alias_tabela}")
-                return filtro_sql, True, codigo_vendedor
-            else:
-                log.warning(f"🔄 SEM FILTRO - Vendedor não encontrado para email {usuario_email}")
-                return "", False, ""
-                
-        except Exception as e:
-            log.error(f"Erro ao buscar código do vendedor: {str(e)}")
-            return "", False, ""
+        contexto = await resolver_contexto(request)
+    except HTTPException as e:
+        log.error(f"Erro ao obter contexto da requisição: {e.detail}")
+        return "", False, ""
     
-    except Exception as e:
-        log.error(f"Erro geral na função obter_filtro_vendedor: {str(e)}")
+    # Se não for vendedor, não aplica filtro
+    if not contexto.eh_vendedor:
+        log.info(f"🔄 SEM FILTRO - Usuário não é vendedor (nível: {contexto.usuario_nivel})")
+        return "", False, ""
+    
+    if not contexto.empresa:
+        log.warning("🔄 SEM FILTRO - Empresa não selecionada")
         return "", False, ""
+    
+    if contexto.codigo_vendedor:
+        filtro_sql = f" AND {alias_tabela}.VEN_CODIGO = ?"
+        log.info(f"🎯 FILTRO APLICADO: Vendedor {contexto.codigo_vendedor} ({contexto.nome_vendedor}) - Alias: {alias_tabela}")
+        return filtro_sql, True, contexto.codigo_vendedor
+    
+    log.warning(f"🔄 SEM FILTRO - Vendedor não encontrado para email {contexto.usuario_email}")
+    return "", False, ""
+
+def params_vendedor(filtro_vendedor: str, codigo_vendedor: Optional[str]) -> List[Any]:
+    """Parâmetro do filtro de obter_filtro_vendedor (nenhum quando não há filtro)."""
+    return [codigo_vendedor] if filtro_vendedor else []
+
+def _venda_formatada(v: Dict[str, Any]) -> Dict[str, Any]:
+    """Linha de VENDAS (colunas em minúsculas) no formato esperado pelo frontend."""
+    return {
+        "id": v.get("ecf_numero"),
+        "cliente_nome": v.get("nome"),
+        "data": v.get("ecf_data"),
+        "autenticacao_data": v.get("ecf_cx_data"),
+        "autenticada": bool(v.get("ecf_cx_data")),
+        "forma_pagamento": v.get("fpg_nome"),
+        "vendedor": v.get("ven_nome"),
+        "valor_total": v.get("ecf_total"),
+        "status": "CONCLUÍDO" if v.get("ecf_total", 0) > 0 else "PENDENTE"
+    }
 
 @router.get("/vendas")
-async def listar_vendas(request: Request):
+async def listar_vendas(request: Request, response: Response, limit: Optional[int] = None, cursor: Optional[int] = None,
+                        include_total: bool = False, stream: Optional[str] = None):
     """
-    Lista todas as vendas, com filtros opcionais por cliente, vendedor, data_inicial e data_final.
+    Lista as vendas, com filtros opcionais por cliente, vendedor, data_inicial e data_final.
     Parâmetros query:
       - cli_codigo: filtra por cliente
       - vendedor_codigo: filtra por vendedor
       - data_inicial, data_final: período (padrão: mês atual)
+      - limit: vendas por página (padrão vendas_limite_padrao, no máximo vendas_limite_maximo)
+      - cursor: next_cursor da página anterior (paginação por ECF_NUMERO decrescente)
+      - include_total: também conta e soma as vendas do período (consulta separada):
+        total e totais {quantidade, valor_total, autenticadas}
+      has_more e o limit também vão nos cabeçalhos X-Has-More e X-Limit.
+      - stream=ndjson: envia todas as vendas do período (a partir do cursor), uma por linha, sem limit
       
     Se o usuário logado for VENDEDOR, aplica filtro automático pelo seu código.
     Se for ADMIN/GERENTE, pode usar vendedor_codigo=null para "todos" ou especificar um código.
@@ -242,7 +271,19 @@ async def listar_vendas(request: Request):
     from datetime import date, timedelta
     log.info(f"[VENDAS] Listando vendas. Headers: {dict(request.headers)}")
     
+    em_stream = modo_stream(stream)
+    try:
+        if em_stream:
+            rows_sql, limite = "", None
+        else:
+            rows_sql, limite = paginacao(settings.vendas_limite_padrao if limit is None else limit, 0, settings.vendas_limite_maximo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
+        conn = await get_empresa_connection(request)
+        cur = cursor_async(conn)
+        
         # ===== OBTER FILTRO DE VENDEDOR =====
         filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
         
@@ -261,12 +302,9 @@ async def listar_vendas(request: Request):
             else:
                 log.info(f"🎯 VENDAS - Usuário ADMIN/GERENTE: exibindo todas as vendas")
         
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
-        
         # Descobrir coluna de data válida
-        cursor.execute("SELECT FIRST 1 * FROM VENDAS")
-        colunas_vendas = [col[0].lower() for col in cursor.description]
+        catalogo = await executar_na_conexao(conn, obter_catalogo, conn)
+        colunas_vendas = [col.lower() for col in catalogo.colunas("VENDAS")]
         date_column = "ecf_data" if "ecf_data" in colunas_vendas else ("ecf_cx_data" if "ecf_cx_data" in colunas_vendas else None)
         if not date_column:
             conn.close()
@@ -292,6 +330,30 @@ async def listar_vendas(request: Request):
         existe_ecf_cx_data = "ecf_cx_data" in colunas_vendas
         log.info(f"Coluna ECF_CX_DATA existe? {existe_ecf_cx_data}")
         
+        # Filtros comuns à página e à contagem
+        periodo_sql, periodo_params = filtro_periodo("VENDAS.ECF_DATA", data_inicial, data_final)
+        filtros_sql = ""
+        params = list(periodo_params)
+        
+        # ===== APLICAR FILTRO DE CLIENTE =====
+        if cli_codigo:
+            filtros_sql += " AND VENDAS.CLI_CODIGO = ?"
+            params.append(cli_codigo)
+        
+        # ===== APLICAR FILTRO DE VENDEDOR =====
+        if vendedor_codigo_final:
+            filtros_sql += " AND VENDAS.VEN_CODIGO = ?"
+            params.append(vendedor_codigo_final)
+        
+        # Paginação por chave: a próxima página começa abaixo do último
+        # ECF_NUMERO devolvido, sem reler as páginas anteriores
+        params_pagina = list(params)
+        if cursor is not None:
+            filtros_sql_pagina = filtros_sql + " AND VENDAS.ECF_NUMERO < ?"
+            params_pagina.append(cursor)
+        else:
+            filtros_sql_pagina = filtros_sql
+        
         sql = f'''
             SELECT
               VENDAS.ECF_NUMERO,         -- ID da Venda
@@ -317,60 +379,64 @@ async def listar_vendas(request: Request):
             WHERE
               VENDAS.ECF_CANCELADA = 'N'
               AND VENDAS.ECF_CONCLUIDA = 'S'
-              AND CAST(VENDAS.ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
+              AND {periodo_sql}
+              {filtros_sql_pagina}
+            ORDER BY VENDAS.ECF_NUMERO DESC
+            {rows_sql}
         '''
         
-        params = [data_inicial, data_final]
+        await cur.execute(sql, tuple(params_pagina))
+        columns = [col[0].lower() for col in cur.description]
+        if em_stream:
+            resposta = resposta_ndjson(request, conn, cur, lambda row: _venda_formatada(dict(zip(columns, row))))
+            conn = None  # devolvida ao pool pelo stream
+            return resposta
+        linhas, has_more = aplicar_paginacao(await cur.fetchall(), limite)
+        vendas = [dict(zip(columns, row)) for row in linhas]
+        next_cursor = vendas[-1].get("ecf_numero") if has_more else None
         
-        # ===== APLICAR FILTRO DE CLIENTE =====
-        if cli_codigo:
-            sql += " AND VENDAS.CLI_CODIGO = ?"
-            params.append(cli_codigo)
-        
-        # ===== APLICAR FILTRO DE VENDEDOR =====
-        if vendedor_codigo_final:
-            sql += " AND VENDAS.VEN_CODIGO = ?"
-            params.append(vendedor_codigo_final)
-            
-        sql += " ORDER BY VENDAS.ECF_NUMERO DESC"
-        
-        cursor.execute(sql, tuple(params))
-        columns = [col[0].lower() for col in cursor.description]
-        vendas = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        total = totais = None
+        if include_total:
+            autenticadas_sql = ("SUM(CASE WHEN VENDAS.ECF_CX_DATA IS NOT NULL THEN 1 ELSE 0 END)"
+                                if existe_ecf_cx_data else "0")
+            await cur.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM(VENDAS.ECF_TOTAL), 0), COALESCE({autenticadas_sql}, 0)
+                FROM VENDAS
+                WHERE VENDAS.ECF_CANCELADA = 'N'
+                  AND VENDAS.ECF_CONCLUIDA = 'S'
+                  AND {periodo_sql}
+                  {filtros_sql}
+            ''', tuple(params))
+            row = await cur.fetchone()
+            total = int(row[0] or 0)
+            totais = {"quantidade": total, "valor_total": float(row[1] or 0), "autenticadas": int(row[2] or 0)}
         # Mapeamento para garantir compatibilidade com o frontend
-        vendas_formatadas = []
-        for v in vendas:
-            vendas_formatadas.append({
-                "id": v.get("ecf_numero"),
-                "cliente_nome": v.get("nome"),
-                "data": v.get("ecf_data"),
-                "autenticacao_data": v.get("ecf_cx_data"),
-                "autenticada": bool(v.get("ecf_cx_data")),
-                "forma_pagamento": v.get("fpg_nome"),
-                "vendedor": v.get("ven_nome"),
-                "valor_total": v.get("ecf_total"),
-                "status": "CONCLUÍDO" if v.get("ecf_total", 0) > 0 else "PENDENTE"
-            })
-        log.info(f"🎯 VENDAS LISTADAS: {len(vendas_formatadas)} resultado(s) para vendedor {vendedor_codigo_final or 'TODOS'}")
-        if not vendas_formatadas:
-            return {
-                "vendas": [],
-                "mensagem": "Nenhuma venda encontrada para o período informado.",
-                "filtro_vendedor_aplicado": filtro_aplicado,
-                "codigo_vendedor": codigo_vendedor,
-                "vendedor_selecionado": vendedor_codigo_final,
-                "total_registros": 0,
-                "periodo": {"data_inicial": data_inicial, "data_final": data_final}
-            }
-        return {
+        vendas_formatadas = [_venda_formatada(v) for v in vendas]
+        log.info(f"🎯 VENDAS LISTADAS: {len(vendas_formatadas)} resultado(s) para vendedor {vendedor_codigo_final or 'TODOS'}"
+                 f" (cursor {cursor}, has_more {has_more})")
+        resposta = {
             "vendas": vendas_formatadas,
             "filtro_vendedor_aplicado": filtro_aplicado,
             "codigo_vendedor": codigo_vendedor,
             "vendedor_selecionado": vendedor_codigo_final,
             "total_registros": len(vendas_formatadas),
-            "periodo": {"data_inicial": data_inicial, "data_final": data_final}
+            "periodo": {"data_inicial": data_inicial, "data_final": data_final},
+            "limit": limite,
+            "next_cursor": next_cursor,
+            "has_more": has_more
         }
+        if include_total:
+            resposta["total"] = total
+            resposta["totais"] = totais
+        # Quem só lê a lista também fica sabendo que ela foi cortada no limit
+        response.headers["X-Limit"] = str(limite)
+        response.headers["X-Has-More"] = "true" if has_more else "false"
+        if not vendas_formatadas and cursor is None:
+            resposta["mensagem"] = "Nenhuma venda encontrada para o período informado."
+        return resposta
         
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         log.error(f"Erro ao listar vendas: {e}\n{traceback.format_exc()}")
@@ -381,11 +447,211 @@ async def listar_vendas(request: Request):
         except:
             pass
 
+# ===== Consultas do dashboard =====
+# Usadas pelos endpoints individuais e pelo /dashboard composto, que roda
+# todas ao mesmo tempo, cada uma na sua conexão do pool.
+
+async def consultar_dashboard_stats(conn, data_hoje: str, data_inicial: str, data_final: str,
+                                    filtro_vendedor: str = "", codigo_vendedor: Optional[str] = None) -> DashboardStats:
+    """
+    Cards de estatísticas. Com o agregado diário ligado os valores de vendas
+    saem dele (ver agregado_diario.py) e só as contagens vão ao banco; sem
+    ele, duas consultas (ver agregados_dashboard.py).
+    """
+    catalogo = await executar_na_conexao(conn, obter_catalogo, conn)
+    tem_ecf_cx_data = catalogo.tem_coluna("VENDAS", "ECF_CX_DATA")
+    if settings.agregado_diario_habilitado:
+        agregado = await obter_agregado(conn, [(data_inicial, data_final), (data_hoje, data_hoje)], tem_ecf_cx_data)
+        qtde, total, autenticadas = agregado.totais(data_inicial, data_final, codigo_vendedor)
+        qtde_dia, total_dia, _ = agregado.totais(data_hoje, data_hoje, codigo_vendedor)
+        contagens = await executar_na_conexao(conn, calcular_contagens, conn.cursor())
+        return DashboardStats(
+            vendas_dia=total_dia,
+            total_pedidos_dia=qtde_dia,
+            vendas_mes=total,
+            valor_total_pedidos=total,
+            total_pedidos=qtde,
+            vendas_autenticadas=autenticadas,
+            vendas_nao_autenticadas=total - autenticadas,
+            **contagens
+        )
+    return DashboardStats(**await executar_na_conexao(
+        conn, calcular_dashboard_stats,
+        conn.cursor(), data_hoje, data_inicial, data_final, filtro_vendedor,
+        params_vendedor(filtro_vendedor, codigo_vendedor), tem_ecf_cx_data=tem_ecf_cx_data
+    ))
+
+async def consultar_top_vendedores(conn, data_inicial: str, data_final: str,
+                                   filtro_vendedor: str = "", codigo_vendedor: Optional[str] = None) -> List[TopVendedor]:
+    cursor = cursor_async(conn)
+    periodo_sql, periodo_params = filtro_periodo("VENDAS.ECF_DATA", data_inicial, data_final)
+    sql = f"""
+        SELECT 
+            V.VEN_NOME,
+            V.VEN_CODIGO,
+            COUNT(*) as QTD_VENDAS,
+            COALESCE(SUM(VENDAS.ECF_TOTAL), 0) as TOTAL,
+            COALESCE(V.VEN_META, 50000.00) as META,
+            COALESCE(1.0 * SUM(VENDAS.ECF_TOTAL) / NULLIF(COUNT(*), 0), 0) as TICKET_MEDIO
+        FROM VENDAS
+        LEFT JOIN VENDEDOR V ON VENDAS.VEN_CODIGO = V.VEN_CODIGO
+        WHERE VENDAS.ECF_CANCELADA = 'N'
+        AND VENDAS.ECF_CONCLUIDA = 'S'
+        AND {periodo_sql}
+        {filtro_vendedor}
+        GROUP BY V.VEN_NOME, V.VEN_CODIGO, V.VEN_META
+        ORDER BY TOTAL DESC
+    """
+    await cursor.execute(sql, list(periodo_params) + params_vendedor(filtro_vendedor, codigo_vendedor))
+    rows = await cursor.fetchall()
+
+    top_vendedores = []
+    for row in rows:
+        try:
+            total = float(row[3] or 0)
+            qtd_vendas = int(row[2] or 0)
+            top_vendedores.append(TopVendedor(
+                nome=row[0] or "Nome não informado",
+                codigo=row[1],
+                qtde_vendas=qtd_vendas,
+                total=total,
+                meta=float(row[4] or 50000.00),
+                ticket_medio=round(total / qtd_vendas, 2) if qtd_vendas > 0 else 0
+            ))
+        except Exception as e:
+            log.error(f"Erro ao processar vendedor: {str(e)}")
+            log.error(f"Dados da linha que causou erro: {row}")
+            continue
+    return top_vendedores
+
+async def consultar_top_clientes(conn, data_inicial: str, data_final: str,
+                                 filtro_vendedor: str = "", codigo_vendedor: Optional[str] = None) -> List[TopCliente]:
+    cursor = cursor_async(conn)
+    periodo_sql, periodo_params = filtro_periodo("VENDAS.ECF_DATA", data_inicial, data_final)
+    sql = f"""
+        SELECT FIRST 10
+            C.CLI_NOME,
+            C.CLI_CODIGO,
+            C.CIDADE,
+            C.UF,
+            COUNT(*) as QTD_VENDAS,
+            COALESCE(SUM(VENDAS.ECF_TOTAL), 0) as TOTAL,
+            MAX(VENDAS.ECF_DATA) as ULTIMA_COMPRA
+        FROM VENDAS
+        LEFT JOIN CLIENTES C ON VENDAS.CLI_CODIGO = C.CLI_CODIGO
+        WHERE VENDAS.ECF_CANCELADA = 'N'
+        AND VENDAS.ECF_CONCLUIDA = 'S'
+        AND {periodo_sql}
+        {filtro_vendedor}
+        GROUP BY C.CLI_NOME, C.CLI_CODIGO, C.CIDADE, C.UF
+        ORDER BY TOTAL DESC
+    """
+    await cursor.execute(sql, list(periodo_params) + params_vendedor(filtro_vendedor, codigo_vendedor))
+    rows = await cursor.fetchall()
+    return [
+        TopCliente(
+            nome=row[0] or "Nome não informado",
+            codigo=row[1],
+            cidade=row[2] or "",
+            uf=row[3] or "",
+            qtde_compras=int(row[4] or 0),
+            total=float(row[5] or 0),
+            ecf_data=row[6].isoformat() if row[6] else None
+        )
+        for row in rows
+    ]
+
+async def consultar_top_produtos(conn, data_inicial: str, data_final: str,
+                                 filtro_vendedor: str = "", codigo_vendedor: Optional[str] = None) -> List[Dict[str, Any]]:
+    cursor = cursor_async(conn)
+    periodo_sql, periodo_params = filtro_periodo("VENDAS.ECF_DATA", data_inicial, data_final)
+    sql = f"""
+        SELECT FIRST 10 
+            PRODUTO.PRO_CODIGO,
+            PRODUTO.PRO_DESCRICAO,
+            COALESCE(SUM(ITVENDA.PRO_QUANTIDADE * ITVENDA.PRO_VENDA), 0) AS TOTAL,
+            COALESCE(PRODUTO.PRO_QUANTIDADE, 0) AS ESTOQUE,
+            COALESCE(PRODUTO.PRO_MINIMA, 0) AS EST_MINIMO
+        FROM ITVENDA
+        JOIN VENDAS ON VENDAS.ECF_NUMERO = ITVENDA.ECF_NUMERO
+             AND VENDAS.ECF_CANCELADA = 'N'
+             AND VENDAS.ECF_CONCLUIDA = 'S'
+        JOIN PRODUTO ON PRODUTO.PRO_CODIGO = ITVENDA.PRO_CODIGO
+        WHERE {periodo_sql}
+        {filtro_vendedor}
+        GROUP BY PRODUTO.PRO_CODIGO, PRODUTO.PRO_DESCRICAO, PRODUTO.PRO_QUANTIDADE, PRODUTO.PRO_MINIMA
+        ORDER BY TOTAL DESC
+    """
+    await cursor.execute(sql, list(periodo_params) + params_vendedor(filtro_vendedor, codigo_vendedor))
+    produtos = await cursor.fetchall() or []
+    return [
+        {
+            'PRO_CODIGO': produto[0],
+            'PRO_DESCRICAO': produto[1],
+            'TOTAL': float(produto[2] or 0),
+            'ESTOQUE': float(produto[3] or 0),
+            'EST_MINIMO': float(produto[4] or 0)
+        }
+        for produto in produtos
+    ]
+
+async def consultar_vendas_por_dia(conn, data_inicial: str, data_final: str,
+                                   filtro_vendedor: str = "", codigo_vendedor: Optional[str] = None) -> List[VendaPorDia]:
+    if settings.agregado_diario_habilitado:
+        catalogo = await executar_na_conexao(conn, obter_catalogo, conn)
+        agregado = await obter_agregado(conn, [(data_inicial, data_final)], catalogo.tem_coluna("VENDAS", "ECF_CX_DATA"))
+        return [
+            VendaPorDia(data=dia.isoformat(), quantidade=quantidade, total=total)
+            for dia, quantidade, total, _ in agregado.por_dia(data_inicial, data_final, codigo_vendedor)
+        ]
+
+    cursor = cursor_async(conn)
+    periodo_sql, periodo_params = filtro_periodo("ECF_DATA", data_inicial, data_final)
+    sql = f"""
+        SELECT 
+            CAST(ECF_DATA AS DATE) as DATA,
+            COUNT(*) as QUANTIDADE,
+            COALESCE(SUM(ECF_TOTAL), 0) as TOTAL
+        FROM VENDAS
+        WHERE ECF_CANCELADA = 'N'
+        AND ECF_CONCLUIDA = 'S'
+        AND {periodo_sql}
+        {filtro_vendedor}
+        GROUP BY CAST(ECF_DATA AS DATE)
+        ORDER BY DATA
+    """
+    await cursor.execute(sql, list(periodo_params) + params_vendedor(filtro_vendedor, codigo_vendedor))
+    rows = await cursor.fetchall()
+    return [
+        VendaPorDia(data=row[0].isoformat(), quantidade=int(row[1] or 0), total=float(row[2] or 0))
+        for row in rows
+    ]
+
+async def _na_conexao_da_requisicao(request: Request, consulta, *args):
+    """Roda consulta(conn, *args) na conexão da requisição e a devolve ao pool."""
+    conn = await get_empresa_connection(request)
+    try:
+        return await consulta(conn, *args)
+    finally:
+        conn.close()
+
+async def _na_conexao_da_empresa(empresa: Dict[str, Any], consulta, *args):
+    """
+    Roda consulta(conn, *args) numa conexão própria do pool da empresa, que
+    não depende da requisição (atualizações em segundo plano do cache).
+    """
+    conn = await emprestar_conexao_empresa(empresa)
+    try:
+        return await consulta(conn, *args)
+    finally:
+        conn.close()
+
 @router.get("/dashboard-stats")
-async def get_dashboard_stats(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
+async def get_dashboard_stats(request: Request, response: Response, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
     """
     Endpoint para obter estatísticas gerais para o Dashboard, incluindo vendas do dia, do mês, etc.
     Aplica filtro por vendedor automaticamente se o usuário logado for um vendedor.
+    Resultado do cache em modo stale-while-revalidate (cabeçalho Age).
     """
     log.info(f"Recebendo requisição para dashboard-stats com data_inicial={data_inicial} e data_final={data_final}")
     
@@ -418,117 +684,28 @@ async def get_dashboard_stats(request: Request, data_inicial: Optional[str] = No
             
         log.info(f"Período de consulta: {data_inicial} a {data_final}")
         
-        # ===== USAR FUNÇÃO HELPER GLOBAL =====
-        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
-
-        # Obter a conexão com o banco da empresa selecionada
+        # Empresa selecionada (a conexão só é aberta se o resultado não estiver em cache)
         empresa = get_empresa_atual(request)
         if not empresa:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                               detail="Empresa não encontrada. Selecione uma empresa válida.")
 
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
-        stats = DashboardStats()
+        # ===== USAR FUNÇÃO HELPER GLOBAL =====
+        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
+        # A consulta usa conexão própria (ver _na_conexao_da_empresa); a do
+        # contexto só serviu para achar o vendedor
+        liberar_contexto(request)
 
         try:
-            # Consulta para vendas do dia
-            sql_vendas_dia = f"""
-                SELECT 
-                    COALESCE(SUM(ECF_TOTAL), 0),
-                    COUNT(*)
-                FROM VENDAS
-                WHERE VENDAS.ecf_cancelada = 'N'
-                AND VENDAS.ecf_concluida = 'S'
-                AND CAST(VENDAS.ecf_data AS DATE) = CAST(? AS DATE)
-                {filtro_vendedor}
-            """
-            cursor.execute(sql_vendas_dia, (data_hoje,))
-            row = cursor.fetchone()
-            if row:
-                stats.vendas_dia = float(row[0] or 0)
-                stats.total_pedidos_dia = int(row[1] or 0)
-            
-            # Consulta para vendas do mês (parametrizada)
-            try:
-                # Descobrir coluna de data válida
-                cursor.execute("SELECT FIRST 1 * FROM VENDAS")
-                colunas_vendas = [col[0].lower() for col in cursor.description]
-                date_column = "ecf_data" if "ecf_data" in colunas_vendas else ("ecf_cx_data" if "ecf_cx_data" in colunas_vendas else None)
-                if not date_column:
-                    raise HTTPException(status_code=400, detail="Nenhuma coluna de data encontrada na tabela VENDAS (esperado: ecf_data ou ecf_cx_data)")
-
-                # ===== USAR FUNÇÃO HELPER GLOBAL =====
-                filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
-                
-                sql_vendas_mes = f"""
-                    SELECT COALESCE(SUM(ECF_TOTAL), 0)
-                    FROM VENDAS
-                    WHERE VENDAS.ecf_cancelada = 'N'
-                    AND VENDAS.ecf_concluida = 'S'
-                    AND ECF_DATA IS NOT NULL
-                    AND CAST(VENDAS.ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                    {filtro_vendedor}
-                """
-                log.info(f"Executando SQL vendas do mês: {sql_vendas_mes}")
-                log.info(f"Parâmetros: {data_inicial}, {data_final}")
-                cursor.execute(sql_vendas_mes, (data_inicial, data_final))
-                row = cursor.fetchone()
-                if row and row[0] is not None:
-                    stats.vendas_mes = float(row[0])
-                else:
-                    stats.vendas_mes = 0.0
-                log.info(f"Vendas do mês: {stats.vendas_mes}")
-            
-            except Exception as e:
-                log.error(f"Erro ao buscar vendas do mês: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Erro ao buscar vendas do mês: {str(e)}")
-            
-            # Consulta para vendas autenticadas e não autenticadas
-            sql_vendas_auth = f"""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN ECF_CX_DATA IS NOT NULL THEN ECF_TOTAL ELSE 0 END), 0) as VENDAS_AUTH,
-                    COALESCE(SUM(CASE WHEN ECF_CX_DATA IS NULL THEN ECF_TOTAL ELSE 0 END), 0) as VENDAS_NAO_AUTH
-                FROM VENDAS
-                WHERE VENDAS.ecf_cancelada = 'N'
-                AND VENDAS.ecf_concluida = 'S'
-                AND CAST(VENDAS.ecf_data AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                {filtro_vendedor}
-            """
-            cursor.execute(sql_vendas_auth, (data_inicial, data_final))
-            row = cursor.fetchone()
-            if row:
-                stats.vendas_autenticadas = float(row[0] or 0)
-                stats.vendas_nao_autenticadas = float(row[1] or 0)
-            
-            # Consulta para total de clientes (sem filtro de vendedor)
-            sql_total_clientes = "SELECT COUNT(*) FROM CLIENTES"
-            cursor.execute(sql_total_clientes)
-            row = cursor.fetchone()
-            if row and row[0] is not None:
-                stats.total_clientes = int(row[0])
-            
-            # Consulta para total de produtos (sem filtro de vendedor)
-            sql_total_produtos = "SELECT COUNT(*) FROM PRODUTO"
-            cursor.execute(sql_total_produtos)
-            row = cursor.fetchone()
-            if row and row[0] is not None:
-                stats.total_produtos = int(row[0])
-            
-            # Consulta para total de pedidos no período
-            sql_total_pedidos = f"""
-                SELECT COUNT(*), COALESCE(SUM(ECF_TOTAL), 0)
-                FROM VENDAS
-                WHERE VENDAS.ecf_cancelada = 'N'
-                AND VENDAS.ecf_concluida = 'S'
-                AND CAST(VENDAS.ecf_data AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                {filtro_vendedor}
-            """
-            cursor.execute(sql_total_pedidos, (data_inicial, data_final))
-            row = cursor.fetchone()
-            if row:
-                stats.total_pedidos = int(row[0] or 0)
-                stats.valor_total_pedidos = float(row[1] or 0)
+            inicio = time.perf_counter()
+            stats, idade = await obter_com_revalidacao(
+                chave_relatorio(empresa.get("cli_codigo"), "dashboard-stats", codigo_vendedor, data_inicial, data_final,
+                                data_hoje),
+                lambda: _na_conexao_da_empresa(empresa, consultar_dashboard_stats, data_hoje, data_inicial, data_final, filtro_vendedor, codigo_vendedor),
+                inclui_hoje=True
+            )
+            _informar_idade(response, idade)
+            log.info(f"Estatísticas do dashboard calculadas em {(time.perf_counter() - inicio) * 1000:.1f} ms")
             
             # Log do resultado
             if filtro_aplicado:
@@ -545,21 +722,17 @@ async def get_dashboard_stats(request: Request, data_inicial: Optional[str] = No
         except Exception as e:
             log.error(f"Erro ao buscar estatísticas: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Erro ao buscar estatísticas: {str(e)}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
                 
     except Exception as e:
         log.error(f"Erro geral ao buscar estatísticas do dashboard: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro geral: {str(e)}")
 
 @router.get("/top-vendedores")
-async def get_top_vendedores(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
+async def get_top_vendedores(request: Request, response: Response, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
     """
     Endpoint para obter os top vendedores com maior volume de vendas no período.
     Se o usuário logado for um vendedor, retorna apenas os dados dele.
+    Pode vir do cache já vencido (stale-while-revalidate); a idade vai no cabeçalho Age.
     """
     log.info(f"Recebendo requisição para top-vendedores com data_inicial={data_inicial} e data_final={data_final}")
     
@@ -575,73 +748,21 @@ async def get_top_vendedores(request: Request, data_inicial: Optional[str] = Non
                 proximo_mes = date(hoje.year, hoje.month + 1, 1)
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
             
-        # ===== APLICAR FILTRO DE VENDEDOR =====
-        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
-            
-        # Obter a conexão com o banco da empresa selecionada
+        # Empresa selecionada (a conexão só é aberta se o resultado não estiver em cache)
         empresa = get_empresa_atual(request)
         if not empresa:
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
-            
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+
+        # ===== APLICAR FILTRO DE VENDEDOR =====
+        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
+        liberar_contexto(request)  # a consulta usa conexão própria
         
         try:
-            # Consulta para top vendedores COM FILTRO
-            sql = f"""
-                SELECT 
-                    V.VEN_NOME,
-                    V.VEN_CODIGO,
-                    COUNT(*) as QTD_VENDAS,
-                    COALESCE(SUM(VENDAS.ECF_TOTAL), 0) as TOTAL,
-                    COALESCE(V.VEN_META, 50000.00) as META,
-                    COALESCE(1.0 * SUM(VENDAS.ECF_TOTAL) / NULLIF(COUNT(*), 0), 0) as TICKET_MEDIO
-                FROM VENDAS
-                LEFT JOIN VENDEDOR V ON VENDAS.VEN_CODIGO = V.VEN_CODIGO
-                WHERE VENDAS.ECF_CANCELADA = 'N'
-                AND VENDAS.ECF_CONCLUIDA = 'S'
-                AND CAST(VENDAS.ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                {filtro_vendedor}
-                GROUP BY V.VEN_NOME, V.VEN_CODIGO, V.VEN_META
-                ORDER BY TOTAL DESC
-            """
-            
-            cursor.execute(sql, (data_inicial, data_final))
-            rows = cursor.fetchall()
-            
-            # Log para debug
-            log.info(f"Consulta SQL executada: {sql}")
-            log.info(f"Parâmetros: data_inicial={data_inicial}, data_final={data_final}")
-            
-            top_vendedores = []
-            for row in rows:
-                try:
-                    # Log para debug de cada linha
-                    log.info(f"Processando linha: {row}")
-                    
-                    total = float(row[3] or 0)
-                    qtd_vendas = int(row[2] or 0)
-                    ticket_medio = round(total / qtd_vendas, 2) if qtd_vendas > 0 else 0
-                    
-                    # Log para debug dos cálculos
-                    log.info(f"Vendedor: {row[0]}")
-                    log.info(f"Total: {total}")
-                    log.info(f"Qtd Vendas: {qtd_vendas}")
-                    log.info(f"Ticket Médio Calculado: {ticket_medio}")
-                    
-                    vendedor = TopVendedor(
-                        nome=row[0] or "Nome não informado",
-                        codigo=row[1],
-                        qtde_vendas=qtd_vendas,
-                        total=total,
-                        meta=float(row[4] or 50000.00),
-                        ticket_medio=ticket_medio
-                    )
-                    top_vendedores.append(vendedor)
-                except Exception as e:
-                    log.error(f"Erro ao processar vendedor: {str(e)}")
-                    log.error(f"Dados da linha que causou erro: {row}")
-                    continue
+            top_vendedores, idade = await obter_com_revalidacao(
+                chave_relatorio(empresa.get("cli_codigo"), "top-vendedores", codigo_vendedor, data_inicial, data_final),
+                lambda: _na_conexao_da_empresa(empresa, consultar_top_vendedores, data_inicial, data_final, filtro_vendedor, codigo_vendedor)
+            )
+            _informar_idade(response, idade)
             
             # Log para debug
             if filtro_aplicado:
@@ -659,11 +780,6 @@ async def get_top_vendedores(request: Request, data_inicial: Optional[str] = Non
         except Exception as e:
             log.error(f"Erro ao buscar top vendedores: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Erro ao buscar top vendedores: {str(e)}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
                 
     except Exception as e:
         log.error(f"Erro geral ao buscar top vendedores: {str(e)}")
@@ -689,6 +805,11 @@ async def get_top_clientes(request: Request, data_inicial: Optional[str] = None,
                 proximo_mes = date(hoje.year, hoje.month + 1, 1)
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
             
+        # Empresa selecionada (a conexão só é aberta se o resultado não estiver em cache)
+        empresa = get_empresa_atual(request)
+        if not empresa:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+
         # ===== APLICAR FILTRO DE VENDEDOR =====
         filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
         
@@ -697,56 +818,12 @@ async def get_top_clientes(request: Request, data_inicial: Optional[str] = None,
         log.info(f"   📄 Filtro SQL: '{filtro_vendedor}'")
         log.info(f"   ✅ Filtro aplicado: {filtro_aplicado}")
         log.info(f"   🔢 Código vendedor: '{codigo_vendedor}'")
-            
-        # Obter a conexão com o banco da empresa selecionada
-        empresa = get_empresa_atual(request)
-        if not empresa:
-            raise HTTPException(status_code=404, detail="Empresa não encontrada")
-            
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
         
         try:
-            # Consulta para top clientes COM FILTRO DE VENDEDOR
-            sql = f"""
-                SELECT FIRST 10
-                    C.CLI_NOME,
-                    C.CLI_CODIGO,
-                    C.CIDADE,
-                    C.UF,
-                    COUNT(*) as QTD_VENDAS,
-                    COALESCE(SUM(VENDAS.ECF_TOTAL), 0) as TOTAL,
-                    MAX(VENDAS.ECF_DATA) as ULTIMA_COMPRA
-                FROM VENDAS
-                LEFT JOIN CLIENTES C ON VENDAS.CLI_CODIGO = C.CLI_CODIGO
-                WHERE VENDAS.ECF_CANCELADA = 'N'
-                AND VENDAS.ECF_CONCLUIDA = 'S'
-                AND CAST(VENDAS.ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                {filtro_vendedor}
-                GROUP BY C.CLI_NOME, C.CLI_CODIGO, C.CIDADE, C.UF
-                ORDER BY TOTAL DESC
-            """
-            
-            # Log da SQL final que será executada
-            log.info(f"🔍 TOP CLIENTES - SQL Final:")
-            log.info(f"   Query: {sql}")
-            log.info(f"   Parâmetros: data_inicial='{data_inicial}', data_final='{data_final}'")
-            
-            cursor.execute(sql, (data_inicial, data_final))
-            rows = cursor.fetchall()
-            
-            top_clientes = []
-            for row in rows:
-                cliente = TopCliente(
-                    nome=row[0] or "Nome não informado",
-                    codigo=row[1],
-                    cidade=row[2] or "",
-                    uf=row[3] or "",
-                    qtde_compras=int(row[4] or 0),
-                    total=float(row[5] or 0),
-                    ecf_data=row[6].isoformat() if row[6] else None
-                )
-                top_clientes.append(cliente)
+            top_clientes = await obter_ou_calcular(
+                chave_relatorio(empresa.get("cli_codigo"), "top-clientes", codigo_vendedor, data_inicial, data_final),
+                lambda: _na_conexao_da_requisicao(request, consultar_top_clientes, data_inicial, data_final, filtro_vendedor, codigo_vendedor)
+            )
             
             # Log para debug
             if filtro_aplicado:
@@ -763,21 +840,17 @@ async def get_top_clientes(request: Request, data_inicial: Optional[str] = None,
         except Exception as e:
             log.error(f"Erro ao buscar top clientes: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Erro ao buscar top clientes: {str(e)}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
                 
     except Exception as e:
         log.error(f"Erro geral ao buscar top clientes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro geral: {str(e)}")
 
 @router.get("/vendas-por-dia")
-async def get_vendas_por_dia(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
+async def get_vendas_por_dia(request: Request, response: Response, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
     """
     Endpoint para retornar as vendas agrupadas por dia no período informado.
     Aplica filtro por vendedor automaticamente se o usuário logado for um vendedor.
+    Stale-while-revalidate como dashboard-stats (cabeçalho Age).
     """
     log.info(f"Recebendo requisição para vendas-por-dia com data_inicial={data_inicial} e data_final={data_final}")
     
@@ -793,44 +866,21 @@ async def get_vendas_por_dia(request: Request, data_inicial: Optional[str] = Non
                 proximo_mes = date(hoje.year, hoje.month + 1, 1)
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
             
-        # ===== USAR FUNÇÃO HELPER GLOBAL =====
-        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
-            
-        # Obter a conexão com o banco da empresa selecionada
+        # Empresa selecionada (a conexão só é aberta se o resultado não estiver em cache)
         empresa = get_empresa_atual(request)
         if not empresa:
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
-            
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+
+        # ===== USAR FUNÇÃO HELPER GLOBAL =====
+        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
+        liberar_contexto(request)  # a consulta usa conexão própria
         
         try:
-            # Consulta para vendas por dia COM FILTRO DE VENDEDOR
-            sql = f"""
-                SELECT 
-                    CAST(ECF_DATA AS DATE) as DATA,
-                    COUNT(*) as QUANTIDADE,
-                    COALESCE(SUM(ECF_TOTAL), 0) as TOTAL
-                FROM VENDAS
-                WHERE ECF_CANCELADA = 'N'
-                AND ECF_CONCLUIDA = 'S'
-                AND CAST(ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                {filtro_vendedor}
-                GROUP BY CAST(ECF_DATA AS DATE)
-                ORDER BY DATA
-            """
-            
-            cursor.execute(sql, (data_inicial, data_final))
-            rows = cursor.fetchall()
-            
-            vendas_por_dia = []
-            for row in rows:
-                venda = VendaPorDia(
-                    data=row[0].isoformat(),
-                    quantidade=int(row[1] or 0),
-                    total=float(row[2] or 0)
-                )
-                vendas_por_dia.append(venda)
+            vendas_por_dia, idade = await obter_com_revalidacao(
+                chave_relatorio(empresa.get("cli_codigo"), "vendas-por-dia", codigo_vendedor, data_inicial, data_final),
+                lambda: _na_conexao_da_empresa(empresa, consultar_vendas_por_dia, data_inicial, data_final, filtro_vendedor, codigo_vendedor)
+            )
+            _informar_idade(response, idade)
             
             # Log do resultado
             if filtro_aplicado:
@@ -843,16 +893,112 @@ async def get_vendas_por_dia(request: Request, data_inicial: Optional[str] = Non
         except Exception as e:
             log.error(f"Erro ao buscar vendas por dia: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Erro ao buscar vendas por dia: {str(e)}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
                 
     except Exception as e:
         log.error(f"Erro geral ao buscar vendas por dia: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro geral: {str(e)}")
 
+@router.get("/dashboard")
+async def get_dashboard(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
+    """
+    Dashboard completo em uma chamada: estatísticas, top vendedores, top clientes,
+    top produtos e vendas por dia, com o mesmo filtro de vendedor dos endpoints
+    individuais. As consultas rodam em paralelo, cada uma na sua conexão do pool,
+    mas no máximo dashboard_conexoes_por_requisicao ao mesmo tempo: cinco
+    conexões de uma vez seriam o pool inteiro da base, e dois dashboards
+    simultâneos deixariam a empresa sem conexão.
+    Uma parte que falhar volta como null e o erro aparece em "erros". Cada parte
+    usa o cache de resultados dos endpoints individuais (cache_relatorios.py);
+    tempos_ms só lista as partes que foram ao banco.
+    """
+    hoje = date.today()
+    data_hoje = hoje.isoformat()
+    try:
+        if not data_inicial:
+            data_inicial = date(hoje.year, hoje.month, 1).isoformat()
+        else:
+            datetime.fromisoformat(data_inicial)
+        if not data_final:
+            if hoje.month == 12:
+                proximo_mes = date(hoje.year + 1, 1, 1)
+            else:
+                proximo_mes = date(hoje.year, hoje.month + 1, 1)
+            data_final = (proximo_mes - timedelta(days=1)).isoformat()
+        else:
+            datetime.fromisoformat(data_final)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato YYYY-MM-DD")
+
+    empresa = get_empresa_atual(request)
+    if not empresa:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+
+    filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
+    # A conexão do contexto só serviu para achar o vendedor; devolve ao pool
+    # para as cinco consultas terem conexões livres
+    liberar_contexto(request)
+
+    tempos: Dict[str, float] = {}
+    conexoes = asyncio.Semaphore(max(1, settings.dashboard_conexoes_por_requisicao))
+
+    async def em_conexao_propria(nome, consulta, *args):
+        async with conexoes:
+            inicio = time.perf_counter()
+            conn = await emprestar_conexao_empresa(empresa)
+            try:
+                return await consulta(conn, *args)
+            finally:
+                conn.close()
+                tempos[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    async def parte(nome, endpoint, consulta, *args):
+        # Mesma chave de cache dos endpoints individuais
+        return await obter_ou_calcular(
+            chave_relatorio(empresa.get("cli_codigo"), endpoint, codigo_vendedor, data_inicial, data_final,
+                            data_hoje if endpoint == "dashboard-stats" else None),
+            lambda: em_conexao_propria(nome, consulta, *args),
+            inclui_hoje=(endpoint == "dashboard-stats")
+        )
+
+    consultas = {
+        "stats": ("dashboard-stats", consultar_dashboard_stats, data_hoje, data_inicial, data_final, filtro_vendedor, codigo_vendedor),
+        "top_vendedores": ("top-vendedores", consultar_top_vendedores, data_inicial, data_final, filtro_vendedor, codigo_vendedor),
+        "top_clientes": ("top-clientes", consultar_top_clientes, data_inicial, data_final, filtro_vendedor, codigo_vendedor),
+        "top_produtos": ("top-produtos", consultar_top_produtos, data_inicial, data_final, filtro_vendedor, codigo_vendedor),
+        "vendas_por_dia": ("vendas-por-dia", consultar_vendas_por_dia, data_inicial, data_final, filtro_vendedor, codigo_vendedor),
+    }
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *(parte(nome, *consulta) for nome, consulta in consultas.items()),
+        return_exceptions=True
+    )
+    tempos["total"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    resposta: Dict[str, Any] = {
+        "data_inicial": data_inicial,
+        "data_final": data_final,
+        "filtro_vendedor_aplicado": filtro_aplicado,
+        "codigo_vendedor": codigo_vendedor,
+    }
+    erros = {}
+    for nome, resultado in zip(consultas, resultados):
+        if isinstance(resultado, HTTPException) and resultado.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            raise resultado
+        if isinstance(resultado, Exception):
+            log.error(f"[DASHBOARD] Erro em {nome}: {str(resultado)}")
+            erros[nome] = str(resultado)
+            resultado = None
+        resposta[nome] = resultado
+    if len(erros) == len(consultas):
+        raise HTTPException(status_code=500, detail=f"Erro ao montar o dashboard: {erros}")
+    if erros:
+        resposta["erros"] = erros
+    resposta["tempos_ms"] = tempos
+
+    log.info(f"Dashboard completo em {tempos['total']:.1f} ms (soma das consultas: "
+             f"{sum(v for k, v in tempos.items() if k != 'total'):.1f} ms)")
+    return resposta
+
 @router.get("/clientes/{cliente_codigo}/vendas")
 async def get_vendas_cliente(request: Request, cliente_codigo: str, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
     """
@@ -894,13 +1040,13 @@ async def get_vendas_cliente(request: Request, cliente_codigo: str, data_inicial
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
             
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         try:
             # Primeiro verifica se o cliente existe
             log.info(f"[VENDAS_CLIENTE] Verificando existência do cliente {cliente_codigo}")
-            cursor.execute("SELECT CLI_CODIGO, CLI_NOME FROM CLIENTES WHERE CLI_CODIGO = ?", (cliente_codigo,))
-            cliente = cursor.fetchone()
+            await cursor.execute("SELECT CLI_CODIGO, CLI_NOME FROM CLIENTES WHERE CLI_CODIGO = ?", (cliente_codigo,))
+            cliente = await cursor.fetchone()
             
             if not cliente:
                 log.info(f"[VENDAS_CLIENTE] Cliente {cliente_codigo} não encontrado")
@@ -917,7 +1063,8 @@ async def get_vendas_cliente(request: Request, cliente_codigo: str, data_inicial
             log.info(f"[VENDAS_CLIENTE] Cliente encontrado: {cliente[1]}")
             
             # Consulta para vendas do cliente
-            sql = """
+            periodo_sql, periodo_params = filtro_periodo("V.ECF_DATA", data_inicial, data_final)
+            sql = f"""
                 SELECT 
                     V.ECF_NUMERO,
                     V.ECF_DATA,
@@ -939,13 +1086,13 @@ async def get_vendas_cliente(request: Request, cliente_codigo: str, data_inicial
                 WHERE V.CLI_CODIGO = ?
                 AND V.ECF_CANCELADA = 'N'
                 AND V.ECF_CONCLUIDA = 'S'
-                AND CAST(V.ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
+                AND {periodo_sql}
                 ORDER BY V.ECF_DATA DESC, V.ECF_NUMERO DESC
             """
             
             log.info(f"[VENDAS_CLIENTE] Executando consulta de vendas")
-            cursor.execute(sql, (cliente_codigo, data_inicial, data_final))
-            rows = cursor.fetchall()
+            await cursor.execute(sql, (cliente_codigo,) + periodo_params)
+            rows = await cursor.fetchall()
             log.info(f"[VENDAS_CLIENTE] Encontradas {len(rows)} vendas")
             
             vendas = []
@@ -1036,7 +1183,7 @@ async def get_itens_venda(request: Request, ecf_numero: str):
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
             
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         try:
             # Consulta para itens da venda com dados do produto
@@ -1061,8 +1208,8 @@ async def get_itens_venda(request: Request, ecf_numero: str):
             log.info(f"[ITENS_VENDA] Parâmetro ECF_NUMERO: {ecf_numero}")
             
             try:
-                cursor.execute(sql, (ecf_numero,))
-                rows = cursor.fetchall()
+                await cursor.execute(sql, (ecf_numero,))
+                rows = await cursor.fetchall()
                 log.info(f"[ITENS_VENDA] Encontrados {len(rows)} itens")
             except Exception as sql_error:
                 log.error(f"[ITENS_VENDA] Erro na execução da query SQL: {str(sql_error)}")
@@ -1134,11 +1281,11 @@ async def listar_tabelas(request: Request):
     try:
         # Obter conexão com o banco da empresa
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         # Buscar tabelas de preço
-        cursor.execute("SELECT TAB_COD, TAB_NOME FROM TABPRECO ORDER BY TAB_COD")
+        await cursor.execute("SELECT TAB_COD, TAB_NOME FROM TABPRECO ORDER BY TAB_COD")
         tabelas = [
-            {"codigo": row[0], "nome": row[1]} for row in cursor.fetchall()
+            {"codigo": row[0], "nome": row[1]} for row in await cursor.fetchall()
         ]
         cursor.close()
         conn.close()
@@ -1153,7 +1300,7 @@ async def listar_formas_pagamento(request: Request):
     """
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         sql = """
             SELECT 
@@ -1163,8 +1310,8 @@ async def listar_formas_pagamento(request: Request):
             ORDER BY FPG_NOME
         """
         
-        cursor.execute(sql)
-        rows = cursor.fetchall()
+        await cursor.execute(sql)
+        rows = await cursor.fetchall()
         
         formas = []
         for row in rows:
@@ -1201,7 +1348,7 @@ async def listar_vendedores(request: Request):
                 detail="Erro ao conectar ao banco de dados"
             )
         
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         sql = """
             SELECT 
@@ -1214,8 +1361,8 @@ async def listar_vendedores(request: Request):
         """
         
         log.info("[VENDEDORES] Executando consulta SQL...")
-        cursor.execute(sql)
-        rows = cursor.fetchall()
+        await cursor.execute(sql)
+        rows = await cursor.fetchall()
         
         vendedores = []
         for row in rows:
@@ -1242,21 +1389,63 @@ async def listar_vendedores(request: Request):
         except Exception as e:
             log.error(f"Erro ao fechar conexão: {str(e)}")
 
+def _cliente_new(row) -> Dict[str, Any]:
+    return {
+        "cli_codigo": row[0] if len(row) > 0 else None,
+        "cli_nome": row[1] if len(row) > 1 else "",
+        "apelido": row[2] if len(row) > 2 else "",
+        "contato": row[3] if len(row) > 3 else "",
+        "cpf": row[4] if len(row) > 4 else "",
+        "cnpj": row[5] if len(row) > 5 else "",
+        "endereco": row[6] if len(row) > 6 and row[6] is not None else "",
+        "numero": row[7] if len(row) > 7 and row[7] is not None else "",
+        "bairro": row[8] if len(row) > 8 and row[8] is not None else "",
+        "cidade": row[9] if len(row) > 9 and row[9] is not None else "",
+        "uf": row[10] if len(row) > 10 and row[10] is not None else "",
+        "tel_whatsapp": row[11] if len(row) > 11 and row[11] is not None else "",
+        "email": row[12] if len(row) > 12 and row[12] is not None else "",
+        "cli_tipo": row[13] if len(row) > 13 else None
+    }
+
 @router.get("/clientes-new")
-async def buscar_clientes_new(request: Request, q: str = ""):
+async def buscar_clientes_new(request: Request, response: Response, q: str = "", cli_codigo: Optional[str] = None,
+                              cli_tipo: int = 1, limit: Optional[int] = None, offset: int = 0,
+                              stream: Optional[str] = None):
     """
     Novo endpoint para buscar clientes, preparado para o formulário ClientesNew.
     Retorna todos os campos do endpoint antigo, com nomes padronizados.
+    Retorna até limit clientes (padrão clientes_new_limite_padrao, no máximo
+    clientes_limite_maximo) a partir de offset; X-Has-More indica se há mais.
+    cli_codigo restringe a um cliente (formulário de edição); cli_tipo
+    escolhe o cadastro (1 = clientes, 2 = fornecedores, usado em ListarCompras).
+    Com stream=ndjson (útil com q vazio, para exportar a carteira inteira)
+    envia um cliente por linha, sem limite.
     """
+    em_stream = modo_stream(stream)
+    if em_stream:
+        rows_sql, limite = "", None
+    else:
+        rows_sql, limite = _paginacao_clientes(limit, offset, settings.clientes_new_limite_padrao)
     try:
+        if settings.clientes_diretorio_habilitado and not em_stream:
+            diretorio = await _diretorio_clientes(request)
+            codigo = cli_codigo.strip() if cli_codigo else None
+            encontrados, has_more = aplicar_paginacao(diretorio.buscar(
+                q, limite, offset,
+                lambda c: ativo(c) and tipo(c) == str(cli_tipo) and (codigo is None or str(c["cli_codigo"]).strip() == codigo)
+            ), limite)
+            _informar_paginacao(response, limite, offset, has_more)
+            return [_cliente_new(tuple(c[coluna.lower()] for coluna in COLUNAS_CLIENTES)) for c in encontrados]
+
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
 
         # Usar o termo completo, sem truncar
         termo_nome = f"%{q.strip()}%" if q else "%"
         termo_cnpj = f"%{q.strip()}%"[:14] if q else "%"
         termo_cpf = f"%{q.strip()}%"[:11] if q else "%"
-        sql = """
+        filtro_codigo = "AND CLI_CODIGO = ?" if cli_codigo else ""
+        sql = f"""
             SELECT
                 CLI_CODIGO,
                 CLI_NOME,
@@ -1274,37 +1463,31 @@ async def buscar_clientes_new(request: Request, q: str = ""):
                 CLI_TIPO
             FROM CLIENTES
             WHERE (CLI_INATIVO = 'N' OR CLI_INATIVO IS NULL)
-              AND CLI_TIPO = 1
+              AND CLI_TIPO = ?
               AND (UPPER(CLI_NOME) LIKE ?
                    OR CNPJ LIKE ?
                    OR CPF LIKE ?)
+              {filtro_codigo}
             ORDER BY CLI_NOME
+            {rows_sql}
         """
-        cursor.execute(sql, (termo_nome, termo_cnpj, termo_cpf))
-        rows = cursor.fetchall()
+        params = [cli_tipo, termo_nome, termo_cnpj, termo_cpf]
+        if cli_codigo:
+            params.append(cli_codigo.strip())
+        await cursor.execute(sql, tuple(params))
+        if em_stream:
+            resposta = resposta_ndjson(request, conn, cursor, _cliente_new)
+            conn = None  # devolvida ao pool pelo stream
+            return resposta
+        rows, has_more = aplicar_paginacao(await cursor.fetchall(), limite)
+        _informar_paginacao(response, limite, offset, has_more)
         
-        clientes = []
-        for row in rows:
-            cliente = {
-                "cli_codigo": row[0] if len(row) > 0 else None,
-                "cli_nome": row[1] if len(row) > 1 else "",
-                "apelido": row[2] if len(row) > 2 else "",
-                "contato": row[3] if len(row) > 3 else "",
-                "cpf": row[4] if len(row) > 4 else "",
-                "cnpj": row[5] if len(row) > 5 else "",
-                "endereco": row[6] if len(row) > 6 and row[6] is not None else "",
-                "numero": row[7] if len(row) > 7 and row[7] is not None else "",
-                "bairro": row[8] if len(row) > 8 and row[8] is not None else "",
-                "cidade": row[9] if len(row) > 9 and row[9] is not None else "",
-                "uf": row[10] if len(row) > 10 and row[10] is not None else "",
-                "tel_whatsapp": row[11] if len(row) > 11 and row[11] is not None else "",
-                "email": row[12] if len(row) > 12 and row[12] is not None else "",
-                "cli_tipo": row[13] if len(row) > 13 else None
-            }
-            clientes.append(cliente)
+        clientes = [_cliente_new(row) for row in rows]
         
         return clientes
         
+    except HTTPException:
+        raise
     except Exception as e:
         log.error(f"Erro ao buscar clientes (novo): {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar clientes (novo): {str(e)}")
@@ -1318,10 +1501,24 @@ async def buscar_clientes_new(request: Request, q: str = ""):
 async def buscar_produtos(request: Request, q: str = ""):
     """
     Endpoint para buscar produtos por descrição, código ou marca.
+    Com o catálogo em memória ligado (catalogo_produtos.py) a busca é por
+    início de palavra, sem acento, e não vai ao banco.
     """
     try:
+        if settings.catalogo_produtos_habilitado:
+            empresa = get_empresa_atual(request)
+            if not empresa:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail="Empresa não encontrada. Selecione uma empresa válida.")
+            # Conexão própria do pool: a atualização do catálogo pode rodar
+            # em segundo plano, depois que a requisição terminou
+            catalogo = await obter_catalogo_produtos(
+                empresa.get("cli_codigo"), lambda: emprestar_conexao_empresa(empresa)
+            )
+            return catalogo.buscar(q, 20)
+
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         sql = """
             SELECT FIRST 20
@@ -1346,8 +1543,8 @@ async def buscar_produtos(request: Request, q: str = ""):
         # Adiciona % no início e fim se não existir
         search_term = q if q.startswith('%') else f"%{q}%"
         
-        cursor.execute(sql, (search_term, search_term, search_term))
-        rows = cursor.fetchall()
+        await cursor.execute(sql, (search_term, search_term, search_term))
+        rows = await cursor.fetchall()
         
         produtos = []
         for row in rows:
@@ -1383,6 +1580,8 @@ async def buscar_produtos(request: Request, q: str = ""):
             
         return produtos
         
+    except HTTPException:
+        raise
     except Exception as e:
         log.error(f"Erro ao buscar produtos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar produtos: {str(e)}")
@@ -1399,7 +1598,7 @@ async def verificar_estrutura_produto(request: Request):
     """
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
         # Consulta para obter a estrutura da tabela
         sql = """
@@ -1407,7 +1606,7 @@ async def verificar_estrutura_produto(request: Request):
             FROM PRODUTO
         """
         
-        cursor.execute(sql)
+        await cursor.execute(sql)
         columns = [col[0] for col in cursor.description]
         
         return {
@@ -1444,50 +1643,19 @@ async def top_produtos(request: Request, data_inicial: Optional[str] = None, dat
                 proximo_mes = date(hoje.year, hoje.month + 1, 1)
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
             
-        # ===== APLICAR FILTRO DE VENDEDOR =====
-        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
-
-        # Obter a conexão com o banco da empresa selecionada
+        # Empresa selecionada (a conexão só é aberta se o resultado não estiver em cache)
         empresa = get_empresa_atual(request)
         if not empresa:
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
 
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        # ===== APLICAR FILTRO DE VENDEDOR =====
+        filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "VENDAS")
 
         try:
-            # Consulta para top produtos COM FILTRO DE VENDEDOR
-            sql = f"""
-                SELECT FIRST 10 
-                    PRODUTO.PRO_CODIGO,
-                    PRODUTO.PRO_DESCRICAO,
-                    COALESCE(SUM(ITVENDA.PRO_QUANTIDADE * ITVENDA.PRO_VENDA), 0) AS TOTAL,
-                    COALESCE(PRODUTO.PRO_QUANTIDADE, 0) AS ESTOQUE,
-                    COALESCE(PRODUTO.PRO_MINIMA, 0) AS EST_MINIMO
-                FROM ITVENDA
-                JOIN VENDAS ON VENDAS.ECF_NUMERO = ITVENDA.ECF_NUMERO
-                     AND VENDAS.ECF_CANCELADA = 'N'
-                     AND VENDAS.ECF_CONCLUIDA = 'S'
-                JOIN PRODUTO ON PRODUTO.PRO_CODIGO = ITVENDA.PRO_CODIGO
-                WHERE CAST(VENDAS.ECF_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
-                {filtro_vendedor}
-                GROUP BY PRODUTO.PRO_CODIGO, PRODUTO.PRO_DESCRICAO, PRODUTO.PRO_QUANTIDADE, PRODUTO.PRO_MINIMA
-                ORDER BY TOTAL DESC
-            """
-            
-            cursor.execute(sql, (data_inicial, data_final))
-            produtos = cursor.fetchall() or []
-            
-            # Converter para lista de dicionários
-            resultado = []
-            for produto in produtos:
-                resultado.append({
-                    'PRO_CODIGO': produto[0],
-                    'PRO_DESCRICAO': produto[1],
-                    'TOTAL': float(produto[2] or 0),
-                    'ESTOQUE': float(produto[3] or 0),
-                    'EST_MINIMO': float(produto[4] or 0)
-                })
+            resultado = await obter_ou_calcular(
+                chave_relatorio(empresa.get("cli_codigo"), "top-produtos", codigo_vendedor, data_inicial, data_final),
+                lambda: _na_conexao_da_requisicao(request, consultar_top_produtos, data_inicial, data_final, filtro_vendedor, codigo_vendedor)
+            )
             
             # Log para debug
             if filtro_aplicado:
@@ -1500,11 +1668,6 @@ async def top_produtos(request: Request, data_inicial: Optional[str] = None, dat
         except Exception as e:
             log.error(f"Erro ao buscar top produtos: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Erro ao buscar top produtos: {str(e)}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
             
     except Exception as e:
         log.error(f"Erro geral ao buscar top produtos: {str(e)}")
@@ -1515,11 +1678,11 @@ async def get_tabelas_preco(request: Request, search: str = "", empresa: str = N
     """Endpoint para listar tabelas de preço"""
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
-        cursor.execute("SELECT TAB_COD, TAB_NOME FROM TABPRECO ORDER BY TAB_COD")
+        await cursor.execute("SELECT TAB_COD, TAB_NOME FROM TABPRECO ORDER BY TAB_COD")
         tabelas = [
-            {"codigo": row[0], "nome": row[1]} for row in cursor.fetchall()
+            {"codigo": row[0], "nome": row[1]} for row in await cursor.fetchall()
         ]
         cursor.close()
         conn.close()
@@ -1532,11 +1695,11 @@ async def get_vendedores_ativos(request: Request, search: str = "", empresa: str
     """Endpoint para listar vendedores ativos"""
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
-        cursor.execute("SELECT VEN_CODIGO, VEN_NOME FROM VENDEDOR WHERE VEN_ATIVO = 'S' ORDER BY VEN_NOME")
+        await cursor.execute("SELECT VEN_CODIGO, VEN_NOME FROM VENDEDOR WHERE VEN_ATIVO = 'S' ORDER BY VEN_NOME")
         vendedores = [
-            {"codigo": row[0], "nome": row[1]} for row in cursor.fetchall()
+            {"codigo": row[0], "nome": row[1]} for row in await cursor.fetchall()
         ]
         cursor.close()
         conn.close()
@@ -1549,11 +1712,11 @@ async def get_formas_pagamento(request: Request, search: str = "", empresa: str
     """Endpoint para listar formas de pagamento"""
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         
-        cursor.execute("SELECT FPG_COD, FPG_NOME FROM FORMAPAG ORDER BY FPG_NOME")
+        await cursor.execute("SELECT FPG_COD, FPG_NOME FROM FORMAPAG ORDER BY FPG_NOME")
         formas = [
-            {"codigo": row[0], "nome": row[1]} for row in cursor.fetchall()
+            {"codigo": row[0], "nome": row[1]} for row in await cursor.fetchall()
         ]
         cursor.close()
         conn.close()
@@ -1575,7 +1738,7 @@ async def criar_cliente_new(request: Request, dados: dict = Body(...)):
     """
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         sql = """
             INSERT INTO CLIENTES (
                 CLI_NOME, APELIDO, CONTATO, CPF, CNPJ, ENDERECO, NUMERO, BAIRRO, CIDADE, UF, TEL_WHATSAPP, CLI_EMAIL
@@ -1596,9 +1759,10 @@ async def criar_cliente_new(request: Request, dados: dict = Body(...)):
             dados.get("tel_whatsapp", ""),
             dados.get("email", "")
         ]
-        cursor.execute(sql, params)
-        cli_codigo = cursor.fetchone()[0]
-        conn.commit()
+        await cursor.execute(sql, params)
+        cli_codigo = (await cursor.fetchone())[0]
+        await executar_na_conexao(conn, conn.commit)
+        marcar_clientes_alterados(_empresa_codigo(request), [cli_codigo])
         return {"cli_codigo": cli_codigo, "mensagem": "Cliente cadastrado com sucesso"}
     except Exception as e:
         log.error(f"Erro ao cadastrar cliente (novo): {str(e)}")
@@ -1617,7 +1781,7 @@ async def editar_cliente_new(cli_codigo: int, request: Request, dados: dict = Bo
     """
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         sql = """
             UPDATE CLIENTES SET
                 CLI_NOME = ?,
@@ -1649,8 +1813,9 @@ async def editar_cliente_new(cli_codigo: int, request: Request, dados: dict = Bo
             dados.get("email", ""),
             cli_codigo
         ]
-        cursor.execute(sql, params)
-        conn.commit()
+        await cursor.execute(sql, params)
+        await executar_na_conexao(conn, conn.commit)
+        marcar_clientes_alterados(_empresa_codigo(request), [cli_codigo])
         return {"cli_codigo": cli_codigo, "mensagem": "Cliente atualizado com sucesso"}
     except Exception as e:
         log.error(f"Erro ao editar cliente (novo): {str(e)}")
@@ -1668,7 +1833,7 @@ async def listar_contas_cliente(cli_codigo: int, request: Request):
     conn = None # Initialize conn
     try:
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         sql = """
             SELECT
                 CONTAS.CON_DOCUMENTO,
@@ -1688,9 +1853,9 @@ async def listar_contas_cliente(cli_codigo: int, request: Request):
               AND CONTAS.CLI_CODIGO = ?
             ORDER BY CONTAS.CON_VENCTO
         """
-        cursor.execute(sql, (cli_codigo,))
+        await cursor.execute(sql, (cli_codigo,))
         columns = [col[0].lower() for col in cursor.description]
-        contas = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        contas = [dict(zip(columns, row)) for row in await cursor.fetchall()]
         return contas
     except Exception as e:
         import traceback
@@ -1708,11 +1873,13 @@ async def listar_contas_cliente(cli_codigo: int, request: Request):
             pass
 
 @router.get("/positivacao-clientes")
-async def positivacao_clientes(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None, q: Optional[str] = None):
+async def positivacao_clientes(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None, q: Optional[str] = None,
+                               limit: Optional[int] = None, offset: int = 0):
     """
     Lista clientes com flag de positivado (comprou no período) e data da última compra.
     Filtra automaticamente pelo vendedor logado (se for vendedor).
     Permite filtrar por nome ou CNPJ do cliente (parâmetro q).
+    Paginação opcional: limit e offset (has_more indica se há mais clientes).
     """
     try:
         # Datas padrão: mês atual
@@ -1726,103 +1893,77 @@ async def positivacao_clientes(request: Request, data_inicial: Optional[str] = N
                 proximo_mes = date(hoje.year, hoje.month + 1, 1)
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
 
+        conn = await get_empresa_connection(request)
+        cursor = cursor_async(conn)
+
         # Filtro de vendedor automático
         filtro_vendedor, filtro_aplicado, codigo_vendedor = await obter_filtro_vendedor(request, "C")
 
-        conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
-
-        # Filtro de busca por nome ou CNPJ
+        # Filtro de busca por nome ou CNPJ: com o diretório em memória os
+        # clientes encontrados entram como lista de códigos; se forem muitos
+        # para um IN, volta ao LIKE
         filtro_busca = ""
         params_busca = []
-        if q:
+        if q and settings.clientes_diretorio_habilitado:
+            diretorio = await _diretorio_clientes(request)
+            encontrados, _ = diretorio.codigos(q)
+            codigos = [c for c in encontrados if ativo(diretorio.clientes[c])]
+            if not codigos:
+                filtro_busca = " AND 1 = 0"
+            elif len(codigos) <= settings.clientes_diretorio_max_codigos_sql:
+                filtro_busca = f" AND c.CLI_CODIGO IN ({', '.join('?' * len(codigos))})"
+                params_busca = codigos
+        if q and not filtro_busca:
             termo = f"%{q.strip().upper()}%"
             filtro_busca = " AND (UPPER(c.CLI_NOME) LIKE ? OR c.CNPJ LIKE ?)"
             params_busca = [termo, q.strip()]
 
-        sql = f'''
-        SELECT
-          c.CLI_CODIGO,
-          c.CLI_NOME,
-          c.CNPJ,
-          c.CIDADE,
-          c.UF,
-          (
-            SELECT MAX(v.ECF_DATA)
-            FROM VENDAS v
-            WHERE v.CLI_CODIGO = c.CLI_CODIGO
-              AND v.ECF_CANCELADA = 'N'
-              AND v.ECF_CONCLUIDA = 'S'
-              AND v.ECF_DATA BETWEEN ? AND ?
-          ) AS ULTIMA_OPERACAO,
-          CASE
-            WHEN EXISTS (
-              SELECT 1 FROM VENDAS v2
-              WHERE v2.CLI_CODIGO = c.CLI_CODIGO
-                AND v2.ECF_CANCELADA = 'N'
-                AND v2.ECF_CONCLUIDA = 'S'
-                AND v2.ECF_DATA BETWEEN ? AND ?
-            ) THEN 1 ELSE 0
-          END AS POSITIVADO,
-          (
-            SELECT COALESCE(SUM(v3.ECF_TOTAL), 0)
-            FROM VENDAS v3
-            WHERE v3.CLI_CODIGO = c.CLI_CODIGO
-              AND v3.ECF_CANCELADA = 'N'
-              AND v3.ECF_CONCLUIDA = 'S'
-              AND v3.ECF_DATA BETWEEN ? AND ?
-          ) AS TOTAL_COMPRAS,
-          (
-            SELECT COUNT(v4.ECF_NUMERO)
-            FROM VENDAS v4
-            WHERE v4.CLI_CODIGO = c.CLI_CODIGO
-              AND v4.ECF_CANCELADA = 'N'
-              AND v4.ECF_CONCLUIDA = 'S'
-              AND v4.ECF_DATA BETWEEN ? AND ?
-          ) AS QTDE_COMPRAS
-        FROM CLIENTES c
-        WHERE (c.CLI_INATIVO = 'N' OR c.CLI_INATIVO IS NULL)
-        {filtro_vendedor.replace('VENDAS', 'c')}
-        {filtro_busca}
-        ORDER BY c.CLI_NOME
-        '''
-        params = [data_inicial, data_final, data_inicial, data_final, data_inicial, data_final, data_inicial, data_final] + params_busca
-        cursor.execute(sql, params)
-        clientes = []
-        for row in cursor.fetchall():
-            clientes.append({
-                "cli_codigo": row[0],
-                "cli_nome": row[1],
-                "cnpj": row[2] or "",
-                "cidade": row[3],
-                "uf": row[4],
-                "ultima_operacao": row[5],
-                "positivado": bool(row[6]),
-                "total_compras": float(row[7] or 0),
-                "qtde_compras": int(row[8] or 0)
-            })
+        # Vendas agregadas por cliente em uma tabela derivada (consultas_positivacao.py)
+        try:
+            sql, params, limite = sql_positivacao_clientes(
+                data_inicial, data_final, filtro_vendedor.replace('VENDAS', 'c'),
+                filtro_busca, params_busca, limit, offset,
+                params_vendedor=params_vendedor(filtro_vendedor, codigo_vendedor)
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await cursor.execute(sql, params)
+        linhas, has_more = aplicar_paginacao(await cursor.fetchall(), limite)
+        clientes = [linha_para_cliente(row) for row in linhas]
         conn.close()
         return {
             "data_inicial": data_inicial,
             "data_final": data_final,
             "clientes": clientes,
             "filtro_vendedor_aplicado": filtro_aplicado,
-            "codigo_vendedor": codigo_vendedor
+            "codigo_vendedor": codigo_vendedor,
+            "limit": limite,
+            "offset": offset,
+            "has_more": has_more
         }
+    except HTTPException:
+        raise
     except Exception as e:
         log.error(f"Erro na positivação de clientes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro na positivação de clientes: {str(e)}")
 
 @router.get("/positivacao-produtos")
-async def positivacao_produtos(request: Request, cli_codigo: str = None, data_inicial: str = None, data_final: str = None, q: str = None):
+async def positivacao_produtos(request: Request, cli_codigo: str = None, data_inicial: str = None, data_final: str = None, q: str = None,
+                               positivado: Optional[bool] = None,
+                               limit: Optional[int] = None, offset: int = 0, stream: Optional[str] = None):
     """
     Lista produtos do mix do cliente, indicando se foram comprados no período (positivados) ou não.
     Parâmetros:
       - cli_codigo: código do cliente (opcional)
       - data_inicial, data_final: período
       - q: busca por nome/código do produto (opcional)
+      - positivado: true/false para só os positivados / não positivados (com cliente)
+      - limit, offset: paginação (limit nunca passa de positivacao_produtos_limite_maximo)
+      - stream=ndjson: envia todos os produtos, um por linha (sem paginação nem limite máximo)
+    Sem stream, "total" é o número de produtos do filtro inteiro, não só da página.
     """
     from datetime import date, timedelta
+    em_stream = modo_stream(stream)
     try:
         hoje = date.today()
         if not data_inicial:
@@ -1835,7 +1976,7 @@ async def positivacao_produtos(request: Request, cli_codigo: str = None, data_in
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
 
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
 
         # Filtro de busca de produto
         filtro_produto = ""
@@ -1844,103 +1985,45 @@ async def positivacao_produtos(request: Request, cli_codigo: str = None, data_in
             filtro_produto = " AND (UPPER(p.PRO_DESCRICAO) LIKE UPPER(?) OR CAST(p.PRO_CODIGO AS VARCHAR(20)) LIKE ?)"
             params_produto = [f"%{q}%", f"%{q}%"]
 
-        produtos = []
-        if cli_codigo:
-            sql = f'''
-            SELECT
-              p.PRO_CODIGO,
-              p.PRO_DESCRICAO,
-              p.PRO_MARCA,
-              p.UNI_CODIGO,
-              (
-                SELECT MAX(v.ECF_DATA)
-                FROM ITVENDA i
-                JOIN VENDAS v ON v.ECF_NUMERO = i.ECF_NUMERO
-                WHERE i.PRO_CODIGO = p.PRO_CODIGO
-                  AND v.CLI_CODIGO = ?
-                  AND v.ECF_CANCELADA = 'N'
-                  AND v.ECF_CONCLUIDA = 'S'
-                  AND v.ECF_DATA BETWEEN ? AND ?
-              ) AS ULTIMA_COMPRA,
-              (
-                SELECT SUM(i2.PRO_QUANTIDADE)
-                FROM ITVENDA i2
-                JOIN VENDAS v2 ON v2.ECF_NUMERO = i2.ECF_NUMERO
-                WHERE i2.PRO_CODIGO = p.PRO_CODIGO
-                  AND v2.CLI_CODIGO = ?
-                  AND v2.ECF_CANCELADA = 'N'
-                  AND v2.ECF_CONCLUIDA = 'S'
-                  AND v2.ECF_DATA BETWEEN ? AND ?
-              ) AS QTDE_COMPRADA,
-              (
-                SELECT SUM(i3.PRO_QUANTIDADE * i3.PRO_VENDA)
-                FROM ITVENDA i3
-                JOIN VENDAS v3 ON v3.ECF_NUMERO = i3.ECF_NUMERO
-                WHERE i3.PRO_CODIGO = p.PRO_CODIGO
-                  AND v3.CLI_CODIGO = ?
-                  AND v3.ECF_CANCELADA = 'N'
-                  AND v3.ECF_CONCLUIDA = 'S'
-                  AND v3.ECF_DATA BETWEEN ? AND ?
-              ) AS VALOR_COMPRADO,
-              CASE
-                WHEN EXISTS (
-                  SELECT 1 FROM ITVENDA i4
-                  JOIN VENDAS v4 ON v4.ECF_NUMERO = i4.ECF_NUMERO
-                  WHERE i4.PRO_CODIGO = p.PRO_CODIGO
-                    AND v4.CLI_CODIGO = ?
-                    AND v4.ECF_CANCELADA = 'N'
-                    AND v4.ECF_CONCLUIDA = 'S'
-                    AND v4.ECF_DATA BETWEEN ? AND ?
-                ) THEN 1 ELSE 0
-              END AS POSITIVADO
-            FROM PRODUTO p
-            WHERE p.PRO_INATIVO = 'N' AND p.ITEM_TABLET = 'S'
-            {filtro_produto}
-            ORDER BY p.PRO_DESCRICAO
-            '''
-            params = [cli_codigo, data_inicial, data_final,
-                      cli_codigo, data_inicial, data_final,
-                      cli_codigo, data_inicial, data_final,
-                      cli_codigo, data_inicial, data_final] + params_produto
-            cursor.execute(sql, params)
-            for row in cursor.fetchall():
-                produtos.append({
-                    "pro_codigo": row[0],
-                    "pro_descricao": row[1],
-                    "pro_marca": row[2],
-                    "uni_codigo": row[3],
-                    "ultima_compra": row[4],
-                    "qtde_comprada": float(row[5] or 0),
-                    "valor_comprado": float(row[6] or 0),
-                    "positivado": bool(row[7])
-                })
-        else:
-            # Busca geral: só lista produtos do mix, sem info de positivação
-            sql = f'''
-            SELECT
-              p.PRO_CODIGO,
-              p.PRO_DESCRICAO,
-              p.PRO_MARCA,
-              p.UNI_CODIGO
-            FROM PRODUTO p
-            WHERE p.PRO_INATIVO = 'N' AND p.ITEM_TABLET = 'S'
-            {filtro_produto}
-            ORDER BY p.PRO_DESCRICAO
-            '''
-            cursor.execute(sql, params_produto)
-            for row in cursor.fetchall():
-                produtos.append({
-                    "pro_codigo": row[0],
-                    "pro_descricao": row[1],
-                    "pro_marca": row[2],
-                    "uni_codigo": row[3],
-                    "ultima_compra": None,
-                    "qtde_comprada": 0,
-                    "valor_comprado": 0,
-                    "positivado": False
-                })
+        # Histórico do cliente agregado uma vez por produto (consultas_positivacao.py);
+        # sem cliente, só o mix. Os dois casos têm limite máximo no servidor,
+        # menos no stream, que não guarda o resultado em memória.
+        limite_maximo = settings.positivacao_produtos_limite_maximo
+        if em_stream:
+            limit, offset, limite_maximo = None, 0, None
+        try:
+            if cli_codigo:
+                sql, params, limite = sql_positivacao_produtos(
+                    cli_codigo, data_inicial, data_final, filtro_produto, params_produto,
+                    limit, offset, limite_maximo, positivado
+                )
+            else:
+                sql, params, limite = sql_mix_produtos(
+                    filtro_produto, params_produto,
+                    limit, offset, limite_maximo
+                )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await cursor.execute(sql, params)
+        if em_stream:
+            return resposta_ndjson(request, conn, cursor, linha_para_produto)
+        linhas, has_more = aplicar_paginacao(await cursor.fetchall(), limite)
+        produtos = [linha_para_produto(row) for row in linhas]
+        total = offset + len(produtos)
+        if has_more:
+            # Página cortada: conta o filtro inteiro só quando há mais produtos
+            if cli_codigo:
+                sql, params = sql_contagem_positivacao_produtos(
+                    cli_codigo, data_inicial, data_final, filtro_produto, params_produto, positivado
+                )
+            else:
+                sql, params = sql_contagem_mix_produtos(filtro_produto, params_produto)
+            await cursor.execute(sql, params)
+            total = int((await cursor.fetchone())[0] or 0)
         conn.close()
-        return {"produtos": produtos, "total": len(produtos)}
+        return {"produtos": produtos, "total": total, "limit": limite, "offset": offset, "has_more": has_more}
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         log.error(f"Erro na positivação de produtos: {str(e)}\n{traceback.format_exc()}")
@@ -1967,10 +2050,11 @@ async def get_entradas_produtos(request: Request, data_inicial: Optional[str] =
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
 
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
 
         # Consulta para entradas de produtos
-        sql = """
+        periodo_sql, periodo_params = filtro_periodo("E.ENT_DATA", data_inicial, data_final)
+        sql = f"""
             SELECT 
                 E.ENT_DATA as data_entrada,
                 P.PRO_DESCRICAO as produto,
@@ -1981,12 +2065,12 @@ async def get_entradas_produtos(request: Request, data_inicial: Optional[str] =
             FROM ENTRADAS E
             JOIN PRODUTO P ON P.PRO_CODIGO = E.PRO_CODIGO
             LEFT JOIN FORNECEDOR F ON F.FOR_CODIGO = E.FOR_CODIGO
-            WHERE CAST(E.ENT_DATA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
+            WHERE {periodo_sql}
             ORDER BY E.ENT_DATA DESC, P.PRO_DESCRICAO
         """
         
-        cursor.execute(sql, (data_inicial, data_final))
-        rows = cursor.fetchall()
+        await cursor.execute(sql, periodo_params)
+        rows = await cursor.fetchall()
         
         # Converter para lista de dicionários
         entradas = []
@@ -2014,29 +2098,22 @@ async def get_entradas_produtos(request: Request, data_inicial: Optional[str] =
             pass
 
 @router.get("/listar-compras")
-async def listar_compras(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None):
+async def listar_compras(request: Request, data_inicial: Optional[str] = None, data_final: Optional[str] = None,
+                         stream: Optional[str] = None):
     """
     Endpoint para listar compras (entradas de produtos) no período.
     Usa o SQL fornecido pelo usuário e filtra por COMPRAS.ECF_DATAENTRADA.
     Se o usuário for VENDEDOR, oculta campos sensíveis como custo, compra, fornecedor e total.
+    Com stream=ndjson envia uma entrada por linha.
     """
     from datetime import date
     log.info(f"[COMPRAS] Headers recebidos: {dict(request.headers)}")
+    em_stream = modo_stream(stream)
     try:
         # Verificar nível do usuário
-        auth_header = request.headers.get("Authorization")
-        is_vendedor = False
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.replace("Bearer ", "")
-            try:
-                from auth import SECRET_KEY, ALGORITHM
-                from jose import jwt
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                usuario_nivel = payload.get("nivel", "").upper()
-                is_vendedor = usuario_nivel == "VENDEDOR"
-                log.info(f"[COMPRAS] Nível do usuário: {usuario_nivel}, is_vendedor: {is_vendedor}")
-            except Exception as jwt_err:
-                log.error(f"[COMPRAS] Erro ao decodificar token JWT: {str(jwt_err)}")
+        contexto = await resolver_contexto(request)
+        is_vendedor = contexto.eh_vendedor
+        log.info(f"[COMPRAS] Nível do usuário: {contexto.usuario_nivel}, is_vendedor: {is_vendedor}")
 
         hoje = date.today()
         if not data_inicial:
@@ -2049,7 +2126,7 @@ async def listar_compras(request: Request, data_inicial: Optional[str] = None, d
             data_final = (proximo_mes - timedelta(days=1)).isoformat()
 
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
 
         # SQL base
         sql = '''
@@ -2083,7 +2160,8 @@ async def listar_compras(request: Request, data_inicial: Optional[str] = None, d
               Cast(null As Double Precision) As total,
             '''
         
-        sql += '''
+        periodo_sql, periodo_params = filtro_periodo("COMPRAS.ECF_DATAENTRADA", data_inicial, data_final)
+        sql += f'''
               PRODUTO.PRO_QUANTIDADE as estoque_atual,
               PRODUTO.PRO_VENDA as preco_venda -- Preço1: preço de venda (todos podem ver)
             From
@@ -2094,10 +2172,10 @@ async def listar_compras(request: Request, data_inicial: Optional[str] = None, d
             Where
               (COMPRAS.ECF_CONCLUIDA = 'S') And
               (COMPRAS.ECF_CANCELADA = 'N')
-              And CAST(COMPRAS.ECF_DATAENTRADA AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
+              And {periodo_sql}
         '''
         
-        params = [data_inicial, data_final]
+        params = list(periodo_params)
         fornecedor = request.query_params.get('fornecedor')
         if fornecedor:
             sql += '\n              AND COMPRAS.CLI_CODIGO = ?'
@@ -2111,12 +2189,8 @@ async def listar_compras(request: Request, data_inicial: Optional[str] = None, d
         log.info(f"[COMPRAS] SQL executado:\n{sql}\nParâmetros: {params}")
         sql += '\n            ORDER BY COMPRAS.ECF_DATAENTRADA DESC, PRODUTO.PRO_DESCRICAO'
         
-        cursor.execute(sql, tuple(params))
-        rows = cursor.fetchall()
-        entradas = []
-        
-        for row in rows:
-            entrada = {
+        def para_entrada(row):
+            return {
                 'tipoEntrada': row[0],
                 'dataNota': row[1].strftime('%d/%m/%Y') if row[1] else None,
                 'codigoFornecedor': row[2],
@@ -2134,7 +2208,13 @@ async def listar_compras(request: Request, data_inicial: Optional[str] = None, d
                 'estoqueAtual': float(row[14] or 0),
                 'precoVenda': float(row[15] or 0)  # Preço1: preço de venda (todos podem ver)
             }
-            entradas.append(entrada)
+        
+        await cursor.execute(sql, tuple(params))
+        if em_stream:
+            resposta = resposta_ndjson(request, conn, cursor, para_entrada)
+            conn = None  # devolvida ao pool pelo stream
+            return resposta
+        entradas = [para_entrada(row) for row in await cursor.fetchall()]
             
         log.info(f"[COMPRAS] Encontradas {len(entradas)} compras/entradas")
         return entradas
@@ -2161,21 +2241,11 @@ async def ultimas_compras_produto(request: Request, pro_codigo: int):
     Se o usuário for VENDEDOR, não retorna PRO_COMPRA.
     """
     try:
-        usuario_nivel = None
-        try:
-            from auth import SECRET_KEY, ALGORITHM
-            from jose import jwt
-            auth_header = request.headers.get("Authorization")
-            if auth_header and auth_header.startswith("Bearer "):
-                token = auth_header.replace("Bearer ", "")
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                usuario_nivel = payload.get("nivel", "").upper()
-        except Exception as e:
-            usuario_nivel = None
-        is_vendedor = usuario_nivel == "VENDEDOR"
+        contexto = await resolver_contexto(request)
+        is_vendedor = contexto.eh_vendedor
 
         conn = await get_empresa_connection(request)
-        cursor = conn.cursor()
+        cursor = cursor_async(conn)
         if is_vendedor:
             sql = '''
                 SELECT FIRST 5
@@ -2190,8 +2260,8 @@ async def ultimas_compras_produto(request: Request, pro_codigo: int):
                 WHERE I.PRO_CODIGO = ?
                 ORDER BY C.ECF_DATA DESC
             '''
-            cursor.execute(sql, (pro_codigo,))
-            rows = cursor.fetchall()
+            await cursor.execute(sql, (pro_codigo,))
+            rows = await cursor.fetchall()
             result = [
                 {
                     "ecf_data": row[0].strftime('%Y-%m-%d') if isinstance(row[0], datetime) else str(row[0]),
@@ -2217,8 +2287,8 @@ async def ultimas_compras_produto(request: Request, pro_codigo: int):
                 WHERE I.PRO_CODIGO = ?
                 ORDER BY C.ECF_DATA DESC
             '''
-            cursor.execute(sql, (pro_codigo,))
-            rows = cursor.fetchall()
+            await cursor.execute(sql, (pro_codigo,))
+            rows = await cursor.fetchall()
             result = [
                 {
                     "ecf_data": row[0].strftime('%Y-%m-%d') if isinstance(row[0], datetime) else str(row[0]),
@@ -2237,3 +2307,48 @@ async def ultimas_compras_produto(request: Request, pro_codigo: int):
         log.error(f"Erro ao buscar últimas compras do produto: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar últimas compras do produto: {str(e)}")
 
+
+@router.get("/admin/indices")
+async def verificar_indices_relatorios(request: Request, empresa: Optional[int] = None):
+    """
+    Verifica, em cada empresa vinculada ao usuário, se existem os índices que os
+    relatórios precisam (VENDAS.ECF_DATA, CLI_CODIGO, VEN_CODIGO e
+    ITVENDA.ECF_NUMERO, PRO_CODIGO). Lista os que faltam com o CREATE INDEX sugerido.
+    Parâmetro opcional empresa: verifica só a empresa informada.
+    Restrito a usuários MASTER/admin.
+    """
+    contexto = await resolver_contexto(request)
+    if (contexto.usuario_nivel or "").lower() not in ("master", "admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito a administradores")
+    
+    from auth import obter_empresas_usuario
+    from consultor_indices import verificar_indices
+    
+    empresas = await obter_empresas_usuario(contexto.usuario_id)
+    if empresa is not None:
+        empresas = [e for e in empresas if e["cli_codigo"] == empresa]
+    
+    async def verificar(dados_empresa):
+        conn = await emprestar_conexao_empresa(dados_empresa)
+        try:
+            return await executar_na_conexao(conn, verificar_indices, conn)
+        finally:
+            conn.close()
+    
+    resultado = []
+    for dados_empresa in empresas:
+        item = {"cli_codigo": dados_empresa["cli_codigo"], "cli_nome": dados_empresa["cli_nome"]}
+        if dados_empresa.get("cli_bloqueadoapp") == "S":
+            item["erro"] = "Empresa bloqueada"
+        else:
+            try:
+                item.update(await verificar(dados_empresa))
+            except Exception as e:
+                log.error(f"[INDICES] Erro ao verificar empresa {dados_empresa['cli_codigo']}: {str(e)}")
+                item["erro"] = str(e)
+        if item.get("faltando"):
+            log.warning(f"[INDICES] Empresa {item['cli_codigo']} sem índice em: "
+                        f"{', '.join(f['tabela'] + '.' + f['coluna'] for f in item['faltando'])}")
+        resultado.append(item)
+    
+    return {"empresas": resultado}
@@ -0,0 +1,92 @@
+"""
+Respostas em NDJSON (?stream=ndjson) para relatórios grandes.
+
+Em vez de montar a lista inteira e deixar o FastAPI serializar tudo de uma
+vez, o gerador lê o cursor em lotes de stream_lote linhas (fetchmany) e
+envia cada lote assim que chega, um objeto JSON por linha. A memória fica
+no tamanho de um lote e o primeiro byte sai logo depois da consulta.
+
+    if modo_stream(stream):
+        await cursor.execute(sql, params)
+        return resposta_ndjson(request, conn, cursor, linha_para_dict)
+
+A conexão passa a ser do gerador, que a devolve ao pool no fim do envio
+(ou quando o cliente desconecta); ela é desligada do contexto da
+requisição porque contexto_requisicao a fecharia antes de a resposta
+terminar. Se a leitura falhar no meio, a última linha é {"erro": ...}.
+"""
+import json
+import logging
+import time
+from datetime import date, datetime, time as hora
+from decimal import Decimal
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from config import get_settings
+from contexto import desligar_conexao
+
+log = logging.getLogger("resposta_ndjson")
+settings = get_settings()
+
+FORMATOS_STREAM = ("ndjson",)
+
+
+def modo_stream(stream: Optional[str]) -> bool:
+    """True para ?stream=ndjson; 400 para formatos desconhecidos."""
+    if not stream:
+        return False
+    if stream.lower() not in FORMATOS_STREAM:
+        raise HTTPException(status_code=400, detail=f"stream deve ser um de: {', '.join(FORMATOS_STREAM)}")
+    return True
+
+
+def _padrao(valor: Any):
+    # Mesmo formato que o jsonable_encoder usaria nas respostas normais
+    if isinstance(valor, (datetime, date, hora)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, bytes):
+        return valor.decode("utf-8", errors="replace")
+    return str(valor)
+
+
+def _linha(objeto: Any) -> str:
+    return json.dumps(objeto, default=_padrao, ensure_ascii=False) + "\n"
+
+
+def resposta_ndjson(request: Request, conn, cursor, converter: Callable[[Any], Any],
+                    lote: Optional[int] = None) -> StreamingResponse:
+    """
+    StreamingResponse que lê o cursor (CursorAsync já executado) em lotes e
+    envia converter(row) de cada linha. Fecha o cursor e a conexão no fim.
+    """
+    lote = lote or settings.stream_lote
+    desligar_conexao(request, conn)
+    caminho = request.url.path
+
+    async def linhas():
+        enviadas = 0
+        inicio = time.perf_counter()
+        try:
+            while True:
+                rows = await cursor.fetchmany(lote)
+                if not rows:
+                    break
+                enviadas += len(rows)
+                yield "".join(_linha(converter(row)) for row in rows)
+        except Exception as e:
+            log.error(f"Erro no stream de {caminho} após {enviadas} linhas: {e}")
+            yield _linha({"erro": str(e)})
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+            conn.close()
+            log.info(f"Stream de {caminho}: {enviadas} linhas em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    return StreamingResponse(linhas(), media_type="application/x-ndjson")
@@ -6,6 +6,7 @@ import logging as log
 import fdb
 from urllib.parse import unquote
 from utils import get_db_connection, get_empresa_info
+from catalogo_schema import obter_catalogo
 
 # Configuração do router
 router = APIRouter()
@@ -39,19 +40,19 @@ async def listar_vendas(
         conn = get_db_connection(empresa_codigo)
         cursor = conn.cursor()
         
+        # Catálogo da base em cache: evita consultar metadados a cada chamada
+        catalogo = obter_catalogo(conn, chave=f"empresa:{empresa_codigo}")
+        
         # Verificar se a tabela VENDAS existe
-        try:
-            cursor.execute("SELECT 1 FROM VENDAS WHERE 1=0")
-        except Exception as e:
-            log.error(f"Erro ao verificar tabela VENDAS: {str(e)}")
+        if not catalogo.tem_tabela("VENDAS"):
+            log.error("Tabela VENDAS não encontrada no catálogo da base")
             return JSONResponse(
                 status_code=500,
                 content={"detail": "Tabela VENDAS não encontrada"}
             )
         
         # Obter as colunas da tabela VENDAS
-        cursor.execute("SELECT RDB$FIELD_NAME FROM RDB$RELATION_FIELDS WHERE RDB$RELATION_NAME = 'VENDAS'")
-        colunas_vendas = [col[0].strip().lower() for col in cursor.fetchall()]
+        colunas_vendas = [col.lower() for col in catalogo.colunas("VENDAS")]
         
         # Determinar a coluna de data a ser usada
         date_column = "ECF_DATA"
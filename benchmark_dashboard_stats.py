@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark do dashboard-stats: consultas antigas (7 comandos + sonda de colunas)
+contra a consulta consolidada de backend/agregados_dashboard.py.
+
+Roda direto na base da empresa, sem passar pela API:
+    python benchmark_dashboard_stats.py <codigo_empresa> [repeticoes] [codigo_vendedor]
+"""
+
+import os
+import sys
+import time
+import statistics
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from conexao_firebird import obter_conexao_controladora, obter_conexao_cliente
+from agregados_dashboard import calcular_dashboard_stats
+
+
+def buscar_empresa(codigo):
+    """Lê os dados de conexão da empresa no banco controlador"""
+    conn = obter_conexao_controladora()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT CLI_CODIGO, CLI_NOME, CLI_CAMINHO_BASE, CLI_IP_SERVIDOR,
+                   CLI_NOME_BASE, CLI_PORTA
+            FROM CLIENTES
+            WHERE CLI_CODIGO = ?
+        """, (codigo,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return {
+        "cli_codigo": row[0],
+        "cli_nome": row[1],
+        "cli_caminho_base": row[2],
+        "cli_ip_servidor": row[3],
+        "cli_nome_base": row[4],
+        "cli_porta": row[5] or "3050",
+    }
+
+
+def dashboard_antigo(cursor, data_hoje, data_inicial, data_final, filtro_vendedor, params_vendedor):
+    """
+    Sequência de consultas usada pelo endpoint antes da consolidação, com o
+    vendedor como parâmetro (?) para comparar só o formato das consultas
+    """
+    periodo = "CAST(VENDAS.ecf_data AS DATE) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)"
+    base = "WHERE VENDAS.ecf_cancelada = 'N' AND VENDAS.ecf_concluida = 'S'"
+
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(ECF_TOTAL), 0), COUNT(*) FROM VENDAS {base}
+        AND CAST(VENDAS.ecf_data AS DATE) = CAST(? AS DATE) {filtro_vendedor}
+    """, (data_hoje, *params_vendedor))
+    cursor.fetchone()
+
+    cursor.execute("SELECT FIRST 1 * FROM VENDAS")
+    cursor.fetchall()
+
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(ECF_TOTAL), 0) FROM VENDAS {base}
+        AND ECF_DATA IS NOT NULL AND {periodo} {filtro_vendedor}
+    """, (data_inicial, data_final, *params_vendedor))
+    cursor.fetchone()
+
+    cursor.execute(f"""
+        SELECT
+            COALESCE(SUM(CASE WHEN ECF_CX_DATA IS NOT NULL THEN ECF_TOTAL ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN ECF_CX_DATA IS NULL THEN ECF_TOTAL ELSE 0 END), 0)
+        FROM VENDAS {base} AND {periodo} {filtro_vendedor}
+    """, (data_inicial, data_final, *params_vendedor))
+    cursor.fetchone()
+
+    cursor.execute("SELECT COUNT(*) FROM CLIENTES")
+    cursor.fetchone()
+
+    cursor.execute("SELECT COUNT(*) FROM PRODUTO")
+    cursor.fetchone()
+
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(ECF_TOTAL), 0) FROM VENDAS {base}
+        AND {periodo} {filtro_vendedor}
+    """, (data_inicial, data_final, *params_vendedor))
+    cursor.fetchone()
+
+
+def medir(nome, funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    p95 = tempos[max(0, int(round(len(tempos) * 0.95)) - 1)]
+    print(f"   {nome:<14} média {statistics.mean(tempos):8.1f} ms | "
+          f"mediana {statistics.median(tempos):8.1f} ms | p95 {p95:8.1f} ms")
+    return statistics.median(tempos)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    empresa_codigo = int(sys.argv[1])
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    codigo_vendedor = sys.argv[3] if len(sys.argv) > 3 else None
+    # Vendedor como parâmetro (?), como o endpoint faz
+    filtro_vendedor = " AND VENDAS.VEN_CODIGO = ?" if codigo_vendedor else ""
+    params_vendedor = [codigo_vendedor] if codigo_vendedor else []
+
+    empresa = buscar_empresa(empresa_codigo)
+    if not empresa:
+        print(f"❌ Empresa {empresa_codigo} não encontrada")
+        sys.exit(1)
+
+    hoje = date.today()
+    data_hoje = hoje.isoformat()
+    data_inicial = date(hoje.year, hoje.month, 1).isoformat()
+    proximo_mes = date(hoje.year + 1, 1, 1) if hoje.month == 12 else date(hoje.year, hoje.month + 1, 1)
+    data_final = (proximo_mes - timedelta(days=1)).isoformat()
+
+    print(f"🔍 Empresa {empresa['cli_nome']} | período {data_inicial} a {data_final} | "
+          f"vendedor {codigo_vendedor or 'TODOS'} | {repeticoes} repetições")
+
+    conn = obter_conexao_cliente(empresa)
+    try:
+        cursor = conn.cursor()
+        # Aquecimento: cache de páginas do servidor igual para os dois lados
+        dashboard_antigo(cursor, data_hoje, data_inicial, data_final, filtro_vendedor, params_vendedor)
+        calcular_dashboard_stats(cursor, data_hoje, data_inicial, data_final, filtro_vendedor, params_vendedor)
+
+        antes = medir("antes (7+1)", lambda: dashboard_antigo(
+            cursor, data_hoje, data_inicial, data_final, filtro_vendedor, params_vendedor), repeticoes)
+        depois = medir("depois (2)", lambda: calcular_dashboard_stats(
+            cursor, data_hoje, data_inicial, data_final, filtro_vendedor, params_vendedor), repeticoes)
+    finally:
+        conn.close()
+
+    if depois > 0:
+        print(f"✅ Ganho na mediana: {antes / depois:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
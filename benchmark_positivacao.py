@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Benchmark da positivação de clientes e de produtos em uma base sintética.
+
+Cria uma base Firebird nova com CLIENTES, PRODUTO, VENDAS e ITVENDA
+aleatórios e compara as consultas antigas (subconsultas correlacionadas por
+cliente / por produto) com as tabelas derivadas de
+backend/consultas_positivacao.py. Também confere que as duas versões
+devolvem o mesmo resultado.
+
+    python benchmark_positivacao.py /tmp/positivacao.fdb --clientes 20000 --vendas 200000 --produtos 5000
+
+O arquivo da base é criado (e apagado no fim, salvo com --manter) no
+servidor configurado em DB_HOST/DB_PORT do .env.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import fdb
+from config import get_settings
+from filtros_sql import filtro_periodo
+from consultas_positivacao import sql_positivacao_clientes, sql_positivacao_produtos
+
+settings = get_settings()
+
+DDL = [
+    """CREATE TABLE CLIENTES (
+        CLI_CODIGO INTEGER NOT NULL PRIMARY KEY,
+        CLI_NOME VARCHAR(60),
+        CNPJ VARCHAR(20),
+        CIDADE VARCHAR(40),
+        UF CHAR(2),
+        CLI_INATIVO CHAR(1),
+        VEN_CODIGO VARCHAR(10))""",
+    """CREATE TABLE VENDAS (
+        ECF_NUMERO INTEGER NOT NULL PRIMARY KEY,
+        CLI_CODIGO INTEGER,
+        VEN_CODIGO VARCHAR(10),
+        ECF_DATA TIMESTAMP,
+        ECF_TOTAL NUMERIC(15,2),
+        ECF_CANCELADA CHAR(1),
+        ECF_CONCLUIDA CHAR(1))""",
+    """CREATE TABLE PRODUTO (
+        PRO_CODIGO INTEGER NOT NULL PRIMARY KEY,
+        PRO_DESCRICAO VARCHAR(60),
+        PRO_MARCA VARCHAR(30),
+        UNI_CODIGO VARCHAR(5),
+        PRO_INATIVO CHAR(1),
+        ITEM_TABLET CHAR(1))""",
+    """CREATE TABLE ITVENDA (
+        ECF_NUMERO INTEGER NOT NULL,
+        PRO_CODIGO INTEGER,
+        PRO_QUANTIDADE NUMERIC(15,3),
+        PRO_VENDA NUMERIC(15,2))""",
+    "CREATE INDEX IDX_VENDAS_CLI_CODIGO ON VENDAS (CLI_CODIGO)",
+    "CREATE INDEX IDX_VENDAS_ECF_DATA ON VENDAS (ECF_DATA)",
+    "CREATE INDEX IDX_ITVENDA_ECF_NUMERO ON ITVENDA (ECF_NUMERO)",
+    "CREATE INDEX IDX_ITVENDA_PRO_CODIGO ON ITVENDA (PRO_CODIGO)",
+]
+
+
+def sql_antigo(data_inicial, data_final):
+    """Consulta usada pelo endpoint antes da tabela derivada"""
+    periodo = [filtro_periodo(f"{a}.ECF_DATA", data_inicial, data_final) for a in ("v", "v2", "v3", "v4")]
+    sql = f'''
+        SELECT
+          c.CLI_CODIGO, c.CLI_NOME, c.CNPJ, c.CIDADE, c.UF,
+          (SELECT MAX(v.ECF_DATA) FROM VENDAS v
+            WHERE v.CLI_CODIGO = c.CLI_CODIGO AND v.ECF_CANCELADA = 'N' AND v.ECF_CONCLUIDA = 'S'
+              AND {periodo[0][0]}) AS ULTIMA_OPERACAO,
+          CASE WHEN EXISTS (SELECT 1 FROM VENDAS v2
+            WHERE v2.CLI_CODIGO = c.CLI_CODIGO AND v2.ECF_CANCELADA = 'N' AND v2.ECF_CONCLUIDA = 'S'
+              AND {periodo[1][0]}) THEN 1 ELSE 0 END AS POSITIVADO,
+          (SELECT COALESCE(SUM(v3.ECF_TOTAL), 0) FROM VENDAS v3
+            WHERE v3.CLI_CODIGO = c.CLI_CODIGO AND v3.ECF_CANCELADA = 'N' AND v3.ECF_CONCLUIDA = 'S'
+              AND {periodo[2][0]}) AS TOTAL_COMPRAS,
+          (SELECT COUNT(v4.ECF_NUMERO) FROM VENDAS v4
+            WHERE v4.CLI_CODIGO = c.CLI_CODIGO AND v4.ECF_CANCELADA = 'N' AND v4.ECF_CONCLUIDA = 'S'
+              AND {periodo[3][0]}) AS QTDE_COMPRAS
+        FROM CLIENTES c
+        WHERE (c.CLI_INATIVO = 'N' OR c.CLI_INATIVO IS NULL)
+        ORDER BY c.CLI_NOME
+    '''
+    params = []
+    for _, p in periodo:
+        params.extend(p)
+    return sql, params
+
+
+def sql_antigo_produtos(cli_codigo, data_inicial, data_final):
+    """Consulta de positivação de produtos antes da tabela derivada"""
+    periodo_sql, periodo_params = filtro_periodo("v.ECF_DATA", data_inicial, data_final)
+    sql = f'''
+        SELECT
+          p.PRO_CODIGO, p.PRO_DESCRICAO, p.PRO_MARCA, p.UNI_CODIGO,
+          (SELECT MAX(v.ECF_DATA) FROM VENDAS v JOIN ITVENDA i ON i.ECF_NUMERO = v.ECF_NUMERO
+            WHERE v.CLI_CODIGO = ? AND i.PRO_CODIGO = p.PRO_CODIGO
+              AND v.ECF_CANCELADA = 'N' AND v.ECF_CONCLUIDA = 'S' AND {periodo_sql}) AS ULTIMA_COMPRA,
+          (SELECT SUM(i.PRO_QUANTIDADE) FROM VENDAS v JOIN ITVENDA i ON i.ECF_NUMERO = v.ECF_NUMERO
+            WHERE v.CLI_CODIGO = ? AND i.PRO_CODIGO = p.PRO_CODIGO
+              AND v.ECF_CANCELADA = 'N' AND v.ECF_CONCLUIDA = 'S' AND {periodo_sql}) AS QTDE_COMPRADA,
+          (SELECT SUM(i.PRO_QUANTIDADE * i.PRO_VENDA) FROM VENDAS v JOIN ITVENDA i ON i.ECF_NUMERO = v.ECF_NUMERO
+            WHERE v.CLI_CODIGO = ? AND i.PRO_CODIGO = p.PRO_CODIGO
+              AND v.ECF_CANCELADA = 'N' AND v.ECF_CONCLUIDA = 'S' AND {periodo_sql}) AS VALOR_COMPRADO,
+          CASE WHEN EXISTS (SELECT 1 FROM VENDAS v JOIN ITVENDA i ON i.ECF_NUMERO = v.ECF_NUMERO
+            WHERE v.CLI_CODIGO = ? AND i.PRO_CODIGO = p.PRO_CODIGO
+              AND v.ECF_CANCELADA = 'N' AND v.ECF_CONCLUIDA = 'S' AND {periodo_sql}) THEN 1 ELSE 0 END AS POSITIVADO
+        FROM PRODUTO p
+        WHERE p.PRO_INATIVO = 'N' AND p.ITEM_TABLET = 'S'
+        ORDER BY p.PRO_DESCRICAO
+    '''
+    return sql, [cli_codigo, *periodo_params] * 4
+
+
+def criar_base(caminho, clientes, vendas, produtos):
+    dsn = f"{settings.db_host}/{settings.db_port}:{caminho}"
+    print(f"🔧 Criando base sintética {dsn}")
+    conn = fdb.create_database(
+        f"CREATE DATABASE '{dsn}' USER '{settings.db_user}' PASSWORD '{settings.db_password}' "
+        f"PAGE_SIZE 8192 DEFAULT CHARACTER SET {settings.db_charset}"
+    )
+    for ddl in DDL:
+        conn.execute_immediate(ddl)
+    conn.commit()
+
+    random.seed(42)
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO CLIENTES (CLI_CODIGO, CLI_NOME, CNPJ, CIDADE, UF, CLI_INATIVO, VEN_CODIGO) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, f"CLIENTE {i:06d}", f"{random.randint(10**13, 10**14 - 1)}", "CIDADE", "SP",
+          "S" if random.random() < 0.05 else "N", str(random.randint(1, 30)))
+         for i in range(1, clientes + 1)]
+    )
+    conn.commit()
+
+    inicio = datetime.now() - timedelta(days=365)
+    lote = []
+    for numero in range(1, vendas + 1):
+        lote.append((numero, random.randint(1, clientes), str(random.randint(1, 30)),
+                     inicio + timedelta(minutes=random.randint(0, 365 * 24 * 60)),
+                     round(random.uniform(10, 5000), 2),
+                     "S" if random.random() < 0.03 else "N", "S"))
+        if len(lote) == 10000:
+            cursor.executemany(
+                "INSERT INTO VENDAS (ECF_NUMERO, CLI_CODIGO, VEN_CODIGO, ECF_DATA, ECF_TOTAL, ECF_CANCELADA, ECF_CONCLUIDA) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", lote)
+            conn.commit()
+            lote = []
+    if lote:
+        cursor.executemany(
+            "INSERT INTO VENDAS (ECF_NUMERO, CLI_CODIGO, VEN_CODIGO, ECF_DATA, ECF_TOTAL, ECF_CANCELADA, ECF_CONCLUIDA) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", lote)
+        conn.commit()
+
+    cursor.executemany(
+        "INSERT INTO PRODUTO (PRO_CODIGO, PRO_DESCRICAO, PRO_MARCA, UNI_CODIGO, PRO_INATIVO, ITEM_TABLET) VALUES (?, ?, ?, ?, ?, ?)",
+        [(i, f"PRODUTO {i:06d}", f"MARCA {random.randint(1, 50)}", "UN",
+          "S" if random.random() < 0.05 else "N", "S" if random.random() < 0.8 else "N")
+         for i in range(1, produtos + 1)]
+    )
+    conn.commit()
+
+    lote = []
+    for numero in range(1, vendas + 1):
+        for _ in range(random.randint(1, 5)):
+            lote.append((numero, random.randint(1, produtos), random.randint(1, 20), round(random.uniform(1, 500), 2)))
+        if len(lote) >= 10000:
+            cursor.executemany(
+                "INSERT INTO ITVENDA (ECF_NUMERO, PRO_CODIGO, PRO_QUANTIDADE, PRO_VENDA) VALUES (?, ?, ?, ?)", lote)
+            conn.commit()
+            lote = []
+    if lote:
+        cursor.executemany(
+            "INSERT INTO ITVENDA (ECF_NUMERO, PRO_CODIGO, PRO_QUANTIDADE, PRO_VENDA) VALUES (?, ?, ?, ?)", lote)
+        conn.commit()
+    print(f"✅ {clientes} clientes, {produtos} produtos e {vendas} vendas inseridos")
+    return conn
+
+
+def medir(nome, cursor, sql, params, repeticoes):
+    tempos = []
+    linhas = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        cursor.execute(sql, params)
+        linhas = cursor.fetchall()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    print(f"   {nome:<20} mediana {statistics.median(tempos):9.1f} ms | mínimo {min(tempos):9.1f} ms | {len(linhas)} linhas")
+    return statistics.median(tempos), linhas
+
+
+def normalizar(linhas):
+    return [(r[0], r[5], bool(r[6]), round(float(r[7] or 0), 2), int(r[8] or 0)) for r in linhas]
+
+
+def normalizar_produtos(linhas):
+    return [(r[0], r[4], round(float(r[5] or 0), 3), round(float(r[6] or 0), 2), bool(r[7])) for r in linhas]
+
+
+def comparar(titulo, antes, linhas_antes, depois, linhas_depois, normalizador):
+    if normalizador(linhas_antes) == normalizador(linhas_depois):
+        print(f"✅ {titulo}: resultados idênticos")
+    else:
+        print(f"❌ {titulo}: resultados diferentes entre as duas consultas")
+    if depois > 0:
+        print(f"🚀 {titulo}: ganho na mediana {antes / depois:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da positivação de clientes e produtos")
+    parser.add_argument("caminho", help="Arquivo .fdb a criar no servidor")
+    parser.add_argument("--clientes", type=int, default=20000)
+    parser.add_argument("--vendas", type=int, default=200000)
+    parser.add_argument("--produtos", type=int, default=5000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--manter", action="store_true", help="Não apagar a base no fim")
+    args = parser.parse_args()
+
+    conn = criar_base(args.caminho, args.clientes, args.vendas, args.produtos)
+    try:
+        hoje = date.today()
+        data_inicial = date(hoje.year, hoje.month, 1).isoformat()
+        data_final = hoje.isoformat()
+        cursor = conn.cursor()
+
+        print(f"🔍 Período {data_inicial} a {data_final}, {args.repeticoes} repetições")
+        sql, params = sql_antigo(data_inicial, data_final)
+        antes, linhas_antes = medir("antes (correlacionada)", cursor, sql, params, args.repeticoes)
+        sql, params, _ = sql_positivacao_clientes(data_inicial, data_final)
+        depois, linhas_depois = medir("depois (derivada)", cursor, sql, params, args.repeticoes)
+        comparar("Clientes", antes, linhas_antes, depois, linhas_depois, normalizar)
+
+        # Cliente com mais vendas no período, para a positivação de produtos ter histórico
+        periodo_sql, periodo_params = filtro_periodo("ECF_DATA", data_inicial, data_final)
+        cursor.execute(f"SELECT FIRST 1 CLI_CODIGO FROM VENDAS WHERE {periodo_sql} "
+                       "GROUP BY CLI_CODIGO ORDER BY COUNT(*) DESC", periodo_params)
+        row = cursor.fetchone()
+        cli_codigo = row[0] if row else 1
+        print(f"🔍 Positivação de produtos do cliente {cli_codigo}")
+        sql, params = sql_antigo_produtos(cli_codigo, data_inicial, data_final)
+        antes, linhas_antes = medir("antes (correlacionada)", cursor, sql, params, args.repeticoes)
+        sql, params, _ = sql_positivacao_produtos(cli_codigo, data_inicial, data_final)
+        depois, linhas_depois = medir("depois (derivada)", cursor, sql, params, args.repeticoes)
+        comparar("Produtos", antes, linhas_antes, depois, linhas_depois, normalizar_produtos)
+    finally:
+        if args.manter:
+            conn.close()
+        else:
+            conn.drop_database()
+            print("🧹 Base sintética apagada")
+
+
+if __name__ == "__main__":
+    main()
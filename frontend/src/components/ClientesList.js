@@ -94,6 +94,7 @@ const handleVerItensVenda = async (venda) => {
   const closeModalItens = () => setModalItens({ open: false, itens: [], venda: null });
 
   const [clientes, setClientes] = useState([]);
+  const [maisResultados, setMaisResultados] = useState(false);
   const [loading, setLoading] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [errorMsg, setErrorMsg] = useState(null);
@@ -104,11 +105,13 @@ const handleVerItensVenda = async (venda) => {
     if (e) e.preventDefault();
     if (!searchTerm || !empresaSelecionada) {
       setClientes([]);
+      setMaisResultados(false);
       setLoading(false);
       return;
     }
     setLoading(true);
     setErrorMsg(null);
+    setMaisResultados(false);
     try {
       let empresaCodigo = empresaSelecionada?.cli_codigo || empresaSelecionada?.codigo;
       const token = localStorage.getItem('token');
@@ -137,6 +140,8 @@ const handleVerItensVenda = async (venda) => {
           return;
         }
         setClientes(data);
+        // O backend limita a quantidade de clientes por busca
+        setMaisResultados(response.headers.get('X-Has-More') === 'true');
         setErrorMsg(null);
       } catch (error) {
         console.error('Erro ao carregar clientes:', error);
@@ -213,6 +218,12 @@ const handleVerItensVenda = async (venda) => {
         >Buscar</button>
       </form>
 
+      {maisResultados && (
+        <div className={`p-2 mb-4 rounded text-sm ${darkMode ? 'bg-yellow-900 text-yellow-200' : 'bg-yellow-100 text-yellow-800'}`}>
+          Exibindo os primeiros {clientes.length} clientes. Refine a busca para encontrar outros.
+        </div>
+      )}
+
       {/* Versão para desktop */}
       <div className="hidden sm:block overflow-x-auto">
         <table className="min-w-full break-words divide-y divide-gray-200">
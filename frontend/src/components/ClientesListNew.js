@@ -207,6 +207,7 @@ export default function ClientesListNew({ darkMode = false }) {
   const [clientes, setClientes] = useState([]);
   const [loading, setLoading] = useState(false);
   const [erro, setErro] = useState('');
+  const [maisResultados, setMaisResultados] = useState(false);
   const [showForm, setShowForm] = useState(false);
   const [modoEdicao, setModoEdicao] = useState(false);
   const [clienteEdit, setClienteEdit] = useState(null);
@@ -225,6 +226,8 @@ export default function ClientesListNew({ darkMode = false }) {
     try {
       const resp = await api.get(`/relatorios/clientes-new?q=${encodeURIComponent(termo)}`);
       setClientes(resp.data);
+      // O backend limita a quantidade de clientes por busca
+      setMaisResultados(resp.headers['x-has-more'] === 'true');
     } catch (err) {
       setErro('Erro ao carregar clientes.');
     } finally {
@@ -354,6 +357,11 @@ export default function ClientesListNew({ darkMode = false }) {
     <div className={`w-full mx-auto p-4 ${darkMode ? 'bg-gray-900 text-gray-100' : 'bg-gray-50 text-gray-900'}`}>
       <h1 className={`text-2xl font-bold mb-4 ${darkMode ? 'text-white' : 'text-gray-900'}`}>Lista de Clientes</h1>
       {erro && <div className={`p-2 mb-2 rounded ${darkMode ? 'bg-red-900 text-red-200' : 'bg-red-100 text-red-700'}`}>{erro}</div>}
+      {maisResultados && !loading && (
+        <div className={`p-2 mb-2 rounded text-sm ${darkMode ? 'bg-yellow-900 text-yellow-200' : 'bg-yellow-100 text-yellow-800'}`}>
+          Exibindo os primeiros {clientes.length} clientes. Refine a busca para encontrar outros.
+        </div>
+      )}
       <form onSubmit={handleBuscar} className="mb-4 flex flex-col sm:flex-row gap-2 items-center w-full">
         <div className="w-full flex flex-col sm:flex-row gap-2">
           <input
@@ -38,6 +38,7 @@ export default function ListarCompras({ darkMode = false }) {
   const [fornecedores, setFornecedores] = useState([]);
   const [modalFornecedores, setModalFornecedores] = useState(false);
   const [fornecedorSelecionado, setFornecedorSelecionado] = useState(null);
+  const [maisFornecedores, setMaisFornecedores] = useState(false);
   const [buscaProduto, setBuscaProduto] = useState('');
   const [produtos, setProdutos] = useState([]);
   const [modalProdutos, setModalProdutos] = useState(false);
@@ -54,17 +55,19 @@ export default function ListarCompras({ darkMode = false }) {
       const token = localStorage.getItem('token');
       const empresaCodigo = localStorage.getItem('empresa_atual');
       const resp = await api.get('/relatorios/clientes-new', {
-        params: { q: buscaFornecedor.trim() },
+        // Só fornecedores (CLI_TIPO=2); o limite do backend vale para eles
+        params: { q: buscaFornecedor.trim(), cli_tipo: 2 },
         headers: {
           'Authorization': `Bearer ${token}`,
           'x-empresa-codigo': empresaCodigo
         }
       });
-      // Filtra apenas fornecedores (CLI_TIPO=2)
-      setFornecedores((resp.data || []).filter(f => String(f.cli_tipo) === '2'));
+      setFornecedores(resp.data || []);
+      setMaisFornecedores(resp.headers['x-has-more'] === 'true');
       setModalFornecedores(true);
     } catch (err) {
       setFornecedores([]);
+      setMaisFornecedores(false);
       setModalFornecedores(true);
     }
   };
@@ -338,6 +341,11 @@ export default function ListarCompras({ darkMode = false }) {
           <div className={`bg-white ${darkMode ? 'dark:bg-gray-900 text-white' : 'text-gray-900'} rounded-2xl shadow-2xl max-w-lg w-full p-4 relative`}>
             <button className="absolute top-3 right-3 text-gray-400 hover:text-red-500 text-2xl z-10" onClick={() => setModalFornecedores(false)}>&times;</button>
             <h2 className="text-lg font-bold mb-4">Selecione o Fornecedor</h2>
+            {maisFornecedores && (
+              <div className={`p-2 mb-2 rounded text-sm ${darkMode ? 'bg-yellow-900 text-yellow-200' : 'bg-yellow-100 text-yellow-800'}`}>
+                Exibindo os primeiros {fornecedores.length} fornecedores. Refine a busca para encontrar outros.
+              </div>
+            )}
             {fornecedores.length === 0 ? (
               <div className="text-center text-gray-500">Nenhum fornecedor encontrado.</div>
             ) : (
@@ -27,9 +27,14 @@ const PedidosList = ({ darkMode }) => {
   const CACHE_KEY_FILTERS = 'pedidos_filtros_cache';
   const CACHE_KEY_DATA = 'pedidos_data_cache';
   const CACHE_KEY_TIMESTAMP = 'pedidos_timestamp_cache';
+  const CACHE_KEY_PAGINACAO = 'pedidos_paginacao_cache';
   const CACHE_DURATION = 5 * 60 * 1000; // 5 minutos
 
   const [dadosEmCache, setDadosEmCache] = useState(false);
+  // Paginação do /relatorios/vendas: a próxima página só é buscada em "Carregar mais"
+  const [proximoCursor, setProximoCursor] = useState(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
+  const [totais, setTotais] = useState(null); // totais do período inteiro, calculados no backend
 
   // Função para carregar filtros do cache
   const loadFiltersFromCache = () => {
@@ -86,7 +91,10 @@ const PedidosList = ({ darkMode }) => {
       const cachedData = localStorage.getItem(CACHE_KEY_DATA);
       if (cachedData && isCacheValid()) {
         const data = JSON.parse(cachedData);
+        const paginacao = JSON.parse(localStorage.getItem(CACHE_KEY_PAGINACAO) || '{}');
         setPedidos(data);
+        setProximoCursor(paginacao.proximoCursor ?? null);
+        setTotais(paginacao.totais || null);
         setDadosEmCache(true);
         setLoading(false);
         return true;
@@ -99,9 +107,10 @@ const PedidosList = ({ darkMode }) => {
   };
 
   // Função para salvar dados no cache
-  const saveToCache = (data) => {
+  const saveToCache = (data, paginacao = {}) => {
     try {
       localStorage.setItem(CACHE_KEY_DATA, JSON.stringify(data));
+      localStorage.setItem(CACHE_KEY_PAGINACAO, JSON.stringify(paginacao));
       localStorage.setItem(CACHE_KEY_TIMESTAMP, Date.now().toString());
       setDadosEmCache(true);
     } catch (error) {
@@ -310,21 +319,18 @@ const PedidosList = ({ darkMode }) => {
       if (vendedorSelecionado && vendedorSelecionado !== 'todos') {
         params.append('vendedor_codigo', vendedorSelecionado);
       }
-      let url = `/relatorios/vendas`;
-      if (params.toString()) {
-        url += `?${params.toString()}`;
-      }
+      // Só a primeira página; as seguintes vêm em "Carregar mais"
+      params.append('include_total', 'true');
+      const url = `/relatorios/vendas?${params.toString()}`;
       // Chamada usando api (axios)
       const response = await api.get(url);
       const data = response.data;
-      let vendas = [];
-      if (data.vendas) {
-        vendas = data.vendas;
-      } else if (Array.isArray(data)) {
-        vendas = data;
-      }
+      const vendas = data.vendas || (Array.isArray(data) ? data : []);
       setPedidos(vendas);
-      saveToCache(vendas);
+      const cursorSeguinte = data.has_more ? (data.next_cursor ?? null) : null;
+      setProximoCursor(cursorSeguinte);
+      setTotais(data.totais || null);
+      saveToCache(vendas, { proximoCursor: cursorSeguinte, totais: data.totais || null });
       setLoading(false);
     } catch (error) {
       let errorDetail = 'Erro desconhecido';
@@ -338,6 +344,38 @@ const PedidosList = ({ darkMode }) => {
     }
   };
 
+  // Busca a próxima página (a partir do next_cursor) e acrescenta à lista
+  const carregarMais = async () => {
+    if (proximoCursor === null || proximoCursor === undefined || carregandoMais) {
+      return;
+    }
+    setCarregandoMais(true);
+    setErrorMsg(null);
+    try {
+      const params = new URLSearchParams();
+      if (dataInicial && dataFinal) {
+        params.append('data_inicial', dataInicial);
+        params.append('data_final', dataFinal);
+      }
+      if (vendedorSelecionado && vendedorSelecionado !== 'todos') {
+        params.append('vendedor_codigo', vendedorSelecionado);
+      }
+      params.append('cursor', proximoCursor);
+      const response = await api.get(`/relatorios/vendas?${params.toString()}`);
+      const data = response.data;
+      const novas = pedidos.concat(data.vendas || []);
+      setPedidos(novas);
+      const cursorSeguinte = data.has_more ? (data.next_cursor ?? null) : null;
+      setProximoCursor(cursorSeguinte);
+      saveToCache(novas, { proximoCursor: cursorSeguinte, totais });
+    } catch (error) {
+      const errorDetail = error.response?.data?.detail || error.message || 'Erro desconhecido';
+      setErrorMsg(`Erro ao carregar mais pedidos: ${errorDetail}`);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const formatCurrency = (value) => {
     return new Intl.NumberFormat('pt-BR', {
       style: 'currency',
@@ -634,26 +672,31 @@ const PedidosList = ({ darkMode }) => {
         <div className="flex flex-wrap justify-between items-center gap-4">
           <div>
             <h2 className={`text-lg font-semibold ${darkMode ? "text-white" : "text-gray-800"}`}>
-              Resumo: <span className="font-bold">{pedidos.length}</span> pedidos encontrados
+              Resumo: <span className="font-bold">{totais ? totais.quantidade : pedidos.length}</span> pedidos encontrados
             </h2>
+            {proximoCursor !== null && (
+              <p className={`text-xs ${darkMode ? "text-gray-300" : "text-gray-600"}`}>
+                Exibindo {pedidos.length} na lista; use "Carregar mais" para ver os demais
+              </p>
+            )}
           </div>
           <div className="grid grid-cols-2 gap-3 md:flex md:gap-4">
             <div className={`p-2 rounded-lg ${darkMode ? "bg-gray-800" : "bg-gray-100"}`}>
               <p className={`text-xs md:text-sm font-medium ${darkMode ? "text-gray-300" : "text-gray-600"}`}>Autenticadas</p>
               <p className={`text-lg md:text-xl font-bold ${darkMode ? "text-green-300" : "text-green-600"}`}>
-                {pedidos.filter(p => p.autenticada).length}
+                {totais ? totais.autenticadas : pedidos.filter(p => p.autenticada).length}
               </p>
             </div>
             <div className={`p-2 rounded-lg ${darkMode ? "bg-gray-800" : "bg-gray-100"}`}>
               <p className={`text-xs md:text-sm font-medium ${darkMode ? "text-gray-300" : "text-gray-600"}`}>Não Autenticadas</p>
               <p className={`text-lg md:text-xl font-bold ${darkMode ? "text-red-300" : "text-red-600"}`}>
-                {pedidos.filter(p => !p.autenticada).length}
+                {totais ? totais.quantidade - totais.autenticadas : pedidos.filter(p => !p.autenticada).length}
               </p>
             </div>
             <div className={`p-2 rounded-lg ${darkMode ? "bg-gray-800" : "bg-gray-100"}`}>
               <p className={`text-xs md:text-sm font-medium ${darkMode ? "text-gray-300" : "text-gray-600"}`}>Valor Total</p>
               <p className={`text-lg md:text-xl font-bold ${darkMode ? "text-blue-300" : "text-blue-600"}`}>
-                {formatCurrency(pedidos.reduce((total, p) => total + (parseFloat(p.valor_total) || 0), 0))}
+                {formatCurrency(totais ? totais.valor_total : pedidos.reduce((total, p) => total + (parseFloat(p.valor_total) || 0), 0))}
               </p>
             </div>
           </div>
@@ -937,6 +980,16 @@ const PedidosList = ({ darkMode }) => {
           </div>
         )}
       </div>
+
+      {proximoCursor !== null && (
+        <div className="mt-6 flex justify-center">
+          <button
+            className="bg-blue-600 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded w-full sm:w-auto disabled:opacity-50"
+            onClick={carregarMais}
+            disabled={carregandoMais || loading}
+          >{carregandoMais ? 'Carregando...' : 'Carregar mais'}</button>
+        </div>
+      )}
     </div>
   );
 };
@@ -12,6 +12,9 @@ function ultimoDiaMesAtual() {
   return new Date(hoje.getFullYear(), hoje.getMonth() + 1, 0).toISOString().slice(0, 10);
 }
 
+// Produtos por página do /relatorios/positivacao-produtos; os seguintes vêm em "Carregar mais"
+const PRODUTOS_POR_PAGINA = 200;
+
 const PositivacaoProdutos = ({ darkMode }) => {
   const [cliente, setCliente] = useState(null);
   const [clientes, setClientes] = useState([]);
@@ -26,6 +29,9 @@ const PositivacaoProdutos = ({ darkMode }) => {
   const [clientesFiltrados, setClientesFiltrados] = useState([]);
   const [showListaClientes, setShowListaClientes] = useState(false);
   const [modalAviso, setModalAviso] = useState({ aberto: false, mensagem: '' });
+  const [totalProdutos, setTotalProdutos] = useState(0); // total do filtro inteiro, informado pelo backend
+  const [temMais, setTemMais] = useState(false);
+  const [carregandoMais, setCarregandoMais] = useState(false);
 
   // Buscar clientes ao clicar em Filtrar
   const filtrarClientes = async () => {
@@ -48,8 +54,27 @@ const PositivacaoProdutos = ({ darkMode }) => {
     setLoading(false);
   };
 
-  // Buscar produtos do cliente ou todos
-  const buscarProdutos = async () => {
+  // Parâmetros de uma página; o filtro de positivação é aplicado no backend
+  // para que a paginação não esconda produtos do filtro escolhido
+  const paramsProdutos = (filtroAtual, offset) => {
+    const params = {
+      data_inicial: dataInicial,
+      data_final: dataFinal,
+      q: buscaProduto,
+      limit: PRODUTOS_POR_PAGINA,
+      offset
+    };
+    if (cliente) {
+      params.cli_codigo = cliente.cli_codigo || cliente.codigo || cliente.id;
+      if (filtroAtual !== 'todos') {
+        params.positivado = filtroAtual === 'positivados';
+      }
+    }
+    return params;
+  };
+
+  // Buscar produtos do cliente ou todos (primeira página)
+  const buscarProdutos = async (filtroAtual = filtro) => {
     if (!buscaProduto || buscaProduto.trim().length < 3) {
       setModalAviso({ aberto: true, mensagem: 'Digite pelo menos 3 letras do nome ou código do produto para buscar.\n\nDica: Buscas mais específicas retornam resultados mais rápidos e relevantes.' });
       return;
@@ -57,23 +82,45 @@ const PositivacaoProdutos = ({ darkMode }) => {
     setLoading(true);
     setErro(null);
     try {
-      const params = {
-        data_inicial: dataInicial,
-        data_final: dataFinal,
-        q: buscaProduto
-      };
-      if (cliente) {
-        params.cli_codigo = cliente.cli_codigo || cliente.codigo || cliente.id;
-      }
-      const resp = await api.get('/relatorios/positivacao-produtos', { params });
+      const resp = await api.get('/relatorios/positivacao-produtos', { params: paramsProdutos(filtroAtual, 0) });
       setProdutos(resp.data.produtos || []);
+      setTotalProdutos(resp.data.total || 0);
+      setTemMais(!!resp.data.has_more);
     } catch (err) {
       setErro('Erro ao buscar produtos.');
       setProdutos([]);
+      setTotalProdutos(0);
+      setTemMais(false);
     }
     setLoading(false);
   };
 
+  // Busca a página seguinte e acrescenta à lista
+  const carregarMais = async () => {
+    if (!temMais || carregandoMais) {
+      return;
+    }
+    setCarregandoMais(true);
+    setErro(null);
+    try {
+      const resp = await api.get('/relatorios/positivacao-produtos', { params: paramsProdutos(filtro, produtos.length) });
+      setProdutos(produtos.concat(resp.data.produtos || []));
+      setTotalProdutos(resp.data.total || 0);
+      setTemMais(!!resp.data.has_more);
+    } catch (err) {
+      setErro('Erro ao carregar mais produtos.');
+    }
+    setCarregandoMais(false);
+  };
+
+  const alterarFiltro = (novoFiltro) => {
+    setFiltro(novoFiltro);
+    // A lista carregada veio filtrada pelo backend: busca de novo com o filtro escolhido
+    if (cliente && produtos.length > 0) {
+      buscarProdutos(novoFiltro);
+    }
+  };
+
   // Filtro visual
   const produtosFiltrados = produtos.filter(p => {
     if (filtro === 'positivados') return p.positivado;
@@ -199,7 +246,7 @@ const PositivacaoProdutos = ({ darkMode }) => {
         </div>
         <div className="w-full md:w-auto">
           <label className="block text-sm mb-1">Filtro</label>
-          <select value={filtro} onChange={e => setFiltro(e.target.value)}
+          <select value={filtro} onChange={e => alterarFiltro(e.target.value)}
             className={`rounded px-2 py-1 border w-full md:w-36 ${darkMode ? 'bg-gray-800 text-white border-gray-600' : 'bg-white text-gray-900 border-gray-300'}`}
           >
             <option value="todos">Todos</option>
@@ -208,7 +255,7 @@ const PositivacaoProdutos = ({ darkMode }) => {
           </select>
         </div>
         <button
-          onClick={buscarProdutos}
+          onClick={() => buscarProdutos()}
           disabled={loading || showListaClientes}
           className={`ml-0 md:ml-2 mt-2 md:mt-0 px-4 py-2 rounded font-bold ${darkMode ? 'bg-blue-700 hover:bg-blue-800 text-white' : 'bg-blue-500 hover:bg-blue-600 text-white'}`}
         >
@@ -224,6 +271,11 @@ const PositivacaoProdutos = ({ darkMode }) => {
         </div>
       ) : cliente || produtos.length > 0 ? (
         <>
+          {temMais && (
+            <div className={`p-2 mb-2 rounded text-sm ${darkMode ? 'bg-yellow-900 text-yellow-200' : 'bg-yellow-100 text-yellow-800'}`}>
+              Exibindo {produtos.length} de {totalProdutos} produtos; use "Carregar mais" para ver os demais ou refine a busca.
+            </div>
+          )}
           {/* Tabela para desktop */}
           <div className="overflow-x-auto hidden md:block">
             <table className="min-w-full border text-sm">
@@ -281,6 +333,15 @@ const PositivacaoProdutos = ({ darkMode }) => {
               ))
             )}
           </div>
+          {temMais && (
+            <div className="mt-4 flex justify-center">
+              <button
+                className={`px-4 py-2 rounded font-bold w-full sm:w-auto disabled:opacity-50 ${darkMode ? 'bg-blue-700 hover:bg-blue-800 text-white' : 'bg-blue-500 hover:bg-blue-600 text-white'}`}
+                onClick={carregarMais}
+                disabled={carregandoMais || loading}
+              >{carregandoMais ? 'Carregando...' : 'Carregar mais'}</button>
+            </div>
+          )}
         </>
       ) : (
         <div className="text-center py-8 text-gray-500">Selecione um cliente ou clique em buscar para visualizar a positivação de produtos.</div>